@@ -2,6 +2,7 @@ import { useState, useEffect } from 'react';
 import { Card, Button, Modal, Form, Alert, Table, Badge, Spinner, Row, Col } from 'react-bootstrap';
 import { FaDatabase, FaPlus, FaEdit, FaTrash, FaCheck, FaUpload, FaFile, FaExclamationTriangle, FaTimes } from 'react-icons/fa';
 import { useTranslation } from 'react-i18next';
+import { fetchAllPages } from '../services/api';
 
 const API_BASE_URL = '/api/v1';
 
@@ -35,8 +36,7 @@ function DataSourceManager() {
   const loadDatasources = async () => {
     try {
       setLoading(true);
-      const res = await fetch(`${API_BASE_URL}/datasources`);
-      const response = await res.json();
+      const response = await fetchAllPages(`${API_BASE_URL}/datasources`);
       
       if (response.success) {
         setDatasources(response.data);
@@ -166,8 +166,7 @@ function DataSourceManager() {
       if (!isPollingRefresh || files.length === 0) {
         setFilesLoading(true);
       }
-      const res = await fetch(`${API_BASE_URL}/datasources/${datasource.id}/files`);
-      const response = await res.json();
+      const response = await fetchAllPages(`${API_BASE_URL}/datasources/${datasource.id}/files`);
       
       if (response.success) {
         setFiles(response.data || []);
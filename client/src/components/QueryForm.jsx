@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react'
 import { Card, Form, Button, Alert, Spinner, Row, Col } from 'react-bootstrap'
 import { FaPaperPlane, FaBrain, FaComments, FaLightbulb, FaDatabase } from 'react-icons/fa'
-import { queryAPI } from '../services/api'
+import { queryAPI, fetchAllPages } from '../services/api'
 import { useTranslation } from 'react-i18next'
 
 const API_BASE_URL = '/api/v1'; // Define API_BASE_URL if not already defined elsewhere
@@ -51,8 +51,7 @@ function QueryForm() {
   const fetchAllDataSources = async () => {
     setLoadingDataSources(true)
     try {
-      const res = await fetch(`${API_BASE_URL}/datasources`)
-      const result = await res.json()
+      const result = await fetchAllPages(`${API_BASE_URL}/datasources`)
       if (result.success && result.data) {
         setAvailableDataSources(result.data)
       } else {
@@ -167,6 +167,24 @@ export const analyticsAPI = {
   }
 };
 
+// 分页列表接口（数据源、文件）：跟随 next_cursor 读取全部页面，返回 { success, data, error }
+export const fetchAllPages = async (url, pageSize = 100) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const params = new URLSearchParams({ limit: pageSize });
+    if (cursor) params.set('cursor', cursor);
+    const res = await fetch(`${url}?${params}`);
+    const page = await res.json();
+    if (!res.ok || !page.success) {
+      return { success: false, error: page.error || page.detail, data: items };
+    }
+    items.push(...(page.data || []));
+    cursor = page.next_cursor;
+  } while (cursor);
+  return { success: true, data: items };
+};
+
 // 模拟数据（用于开发环境）
 export const mockData = {
   // 模拟查询响应
@@ -1,30 +1,54 @@
 import os
-from typing import Optional, List, Dict, Any, Union
+from typing import AsyncIterator, Optional, List, Dict, Any, Tuple, Union
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits import create_sql_agent
 from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains import RetrievalQA
-from langchain.docstore.document import Document
+from langchain_core.documents import Document
+from sqlalchemy import create_engine
 from .db import (
-    fetch_sales_data_for_query,
+    fetch_sales_summary_for_query,
     fetch_low_stock_products,
     get_product_details,
     initialize_database,  # Changed: initialize_app_database -> initialize_database
     get_files_by_datasource, # Added to get files for RAG
+    get_vector_chunks_for_files, # Chunks persisted at ingestion time
+    get_cached_sql, save_cached_sql, delete_cached_sql, # NL-to-SQL translation cache
+    get_table_profile, # Column statistics computed at ingestion
     DATABASE_PATH # Import DATABASE_PATH
 )
 from .report import generate_daily_sales_summary_report
-from .models import DataSourceType # Import DataSourceType
+from .models import DataSourceType, StorageEngine, VectorIndexType, VectorQuantization # Import DataSourceType
+from .analytics import get_duckdb_engine, is_duckdb_available
+from .file_processor import extract_file_text, chunk_text # Text extraction for files indexed before chunks were persisted
+from .retrieval import HybridRetriever # Dense + BM25 retrieval with reciprocal rank fusion
+from .vector_index import ( # Per-datasource index types, quantized embeddings and the built-index cache
+    decode_embedding, build_vector_store, vector_index_fingerprint, get_cached_vector_index, cache_vector_index
+)
+from .sql_guard import GuardedSQLDatabase # Row caps, timeouts and plan checks for agent-generated SQL
+from .sql_cache import (
+    NL_SQL_CACHE_ENABLED, NL_SQL_CACHE_MAX_ENTRIES,
+    normalize_question, compute_schema_hash, extract_final_sql, format_rows_answer
+)
+from .sql_direct import (
+    SQL_DIRECT_MODE_ENABLED,
+    get_schema_summary, build_direct_sql_prompt, extract_sql_from_completion, validate_direct_sql
+)
+from .table_profiler import format_profile_summary
+from .timing import LLM_TIMING_CALLBACK, span, timed # Per-stage latency spans (Server-Timing header, histograms)
+from .token_budget import fit_prompt, format_fields # Compact CSV data within PROMPT_TOKEN_BUDGET
+from .metrics import NL_SQL_CACHE_LOOKUPS, track_embedding # Prometheus metrics (GET /metrics)
+from .logging_config import configure_logging
 from dotenv import load_dotenv
 from pathlib import Path # Added Path
 import logging # Added logging
-import pandas as pd # Added pandas
+import asyncio
+import json
+import numpy as np
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (queue-based, JSON; a no-op when main.py already did it)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Import for local embeddings
@@ -38,6 +62,8 @@ OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 LLM_MODEL_NAME = os.getenv("OPENAI_MODEL")
 # EMBEDDING_MODEL_NAME is no longer needed for OpenAI, we'll use a fixed local model name
 LOCAL_EMBEDDING_MODEL_NAME = 'intfloat/multilingual-e5-small' 
+# Chunks passed to the LLM per knowledge base question
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
 
 # Determine the correct upload directory relative to this file (agent.py)
 # Assuming agent.py is in server/app/ and uploads are in server/data/uploads/
@@ -45,84 +71,17 @@ UPLOAD_DIR = Path(__file__).resolve().parent.parent / "data" / "uploads"
 DB_URI = f"sqlite:///{DATABASE_PATH}" # Construct DB URI for LangChain
 
 llm = None
+sqlite_engine = None # SQLAlchemy engine over DB_URI, shared by every SQL question
 embeddings = None # Initialize embeddings variable
 
-# Imports for file parsing
-import PyPDF2
-from docx import Document as DocxDocument
-
-# Helper functions for parsing files
-def _extract_text_from_pdf(file_path: Path) -> str:
-    logger.info(f"Extracting text from PDF: {file_path}")
-    text = ""
-    try:
-        with open(file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                text += page.extract_text() or ""
-        logger.info(f"Successfully extracted {len(text)} characters from PDF: {file_path}")
-    except Exception as e:
-        logger.error(f"Error extracting text from PDF {file_path}: {e}", exc_info=True)
-    return text
-
-def _extract_text_from_docx(file_path: Path) -> str:
-    logger.info(f"Extracting text from DOCX: {file_path}")
-    text = ""
-    try:
-        doc = DocxDocument(file_path)
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-        logger.info(f"Successfully extracted {len(text)} characters from DOCX: {file_path}")
-    except Exception as e:
-        logger.error(f"Error extracting text from DOCX {file_path}: {e}", exc_info=True)
-    return text
-
-def _extract_text_from_csv_pandas(file_path: Path) -> str:
-    logger.info(f"Extracting text from CSV using pandas: {file_path}")
-    text = ""
-    try:
-        df = pd.read_csv(file_path, on_bad_lines='skip')
-        # Convert each row to a string, then join all row strings
-        # We include column names for context for each row, and join with a clear separator.
-        # For example: "column1: value1, column2: value2, ..."
-        row_texts = []
-        for index, row in df.iterrows():
-            row_text = ", ".join([f"{col}: {str(val)}" for col, val in row.astype(str).items()])
-            row_texts.append(row_text)
-        text = "\n".join(row_texts) # Each original row becomes a line in the text document
-        logger.info(f"Successfully extracted text from CSV {file_path}. Total characters: {len(text)}")
-    except Exception as e:
-        logger.error(f"Error extracting text from CSV {file_path} with pandas: {e}", exc_info=True)
-    return text
-
-def _extract_text_from_xlsx_pandas(file_path: Path) -> str:
-    logger.info(f"Extracting text from XLSX using pandas: {file_path}")
-    text = ""
-    try:
-        xls = pd.ExcelFile(file_path)
-        sheet_texts = []
-        for sheet_name in xls.sheet_names:
-            df = xls.parse(sheet_name)
-            # Convert each row to a string, then join all row strings for this sheet
-            row_texts = []
-            for index, row in df.iterrows():
-                row_text = ", ".join([f"{col}: {str(val)}" for col, val in row.astype(str).items()])
-                row_texts.append(row_text)
-            sheet_texts.append(f"Sheet: {sheet_name}\n" + "\n".join(row_texts))
-        text = "\n\n".join(sheet_texts) # Separate sheets by a double newline
-        logger.info(f"Successfully extracted text from XLSX {file_path}. Total characters: {len(text)}")
-    except Exception as e:
-        logger.error(f"Error extracting text from XLSX {file_path} with pandas: {e}", exc_info=True)
-    return text
-
 # Initialize LLM (OpenAI or other compatible)
 if OPENAI_API_KEY and not OPENAI_API_KEY.startswith(("123456", "local_mode")):
     try:
         llm_kwargs = {
             "model_name": LLM_MODEL_NAME,
             "temperature": 0,
-            "openai_api_key": OPENAI_API_KEY
+            "openai_api_key": OPENAI_API_KEY,
+            "callbacks": [LLM_TIMING_CALLBACK] # Times every call, including those made inside chains and the SQL agent
         }
         if OPENAI_BASE_URL:
             llm_kwargs["openai_api_base"] = OPENAI_BASE_URL
@@ -149,151 +108,303 @@ except Exception as e:
     logger.error(f"Local embedding model {LOCAL_EMBEDDING_MODEL_NAME} initialization failed: {e}", exc_info=True)
     embeddings = None
 
-async def perform_rag_query(query: str, datasource: Dict[str, Any]) -> Dict[str, Any]:
+@timed("rag.index_build")
+async def _build_rag_vector_store(completed_files: List[Dict[str, Any]], index_type: str,
+                                  quantization: str) -> Optional[Tuple[FAISS, Dict[int, Document]]]:
     """
-    Performs RAG retrieval and Q&A for the specified data source.
+    Build the vector store of a knowledge base from its completed files.
+    Returns (vector store, stored chunk documents by chunk id), or None if no chunks could be loaded.
     """
-    logger.info(f"Attempting RAG query on datasource: {datasource['name']} (ID: {datasource['id']}) for query: '{query}'")
+    # Load chunks (and their embeddings) persisted at ingestion time.
+    # Chunks are shared by content hash, so re-uploads of the same file are not indexed twice.
+    stored_chunks = await get_vector_chunks_for_files(completed_files)
+    indexed_hashes = {chunk['content_hash'] for chunk in stored_chunks if chunk['content_hash']}
+    indexed_file_ids = {chunk['file_id'] for chunk in stored_chunks}
+    source_names = {f['content_hash']: f['original_filename'] for f in completed_files if f.get('content_hash')}
+
+    texts: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    vectors: List[Optional[np.ndarray]] = []
+    for chunk in stored_chunks:
+        texts.append(chunk['content'])
+        metadatas.append({
+            "source": source_names.get(chunk['content_hash'], chunk['metadata'].get('source', 'Unknown source')),
+            "file_id": chunk['file_id'],
+            "chunk_id": chunk['id']
+        })
+        vectors.append(decode_embedding(chunk['embedding'], chunk['embedding_format']) if chunk['embedding'] else None)
+
+    # Files processed before chunks were persisted are parsed and chunked on the fly
+    for file_info in completed_files:
+        if file_info['id'] in indexed_file_ids or (file_info.get('content_hash') and file_info['content_hash'] in indexed_hashes):
+            continue
+
+        file_path = UPLOAD_DIR / file_info['filename']
+        file_type = file_info['file_type']
+        original_filename = file_info['original_filename']
+
+        logger.info(f"Processing file without stored chunks: {file_path} (Original: {original_filename}, Type: {file_type})")
+
+        if not file_path.exists():
+            logger.warning(f"File not found: {file_path} for file_info: {original_filename}")
+            continue
+        
+        try:
+            with span("file.extract"):
+                text_content = await asyncio.to_thread(extract_file_text, file_path, file_type)
+            if text_content is None:
+                logger.info(f"Skipping file {original_filename} due to unsupported file type: {file_type}")
+                continue
+            
+            if text_content.strip():
+                for chunk in chunk_text(text_content):
+                    texts.append(chunk)
+                    metadatas.append({"source": original_filename, "file_id": file_info['id']})
+                    vectors.append(None)
+                logger.info(f"Successfully processed and chunked {original_filename}. Length: {len(text_content)}")
+            else:
+                logger.warning(f"No text content extracted from {original_filename} (Type: {file_type})")
 
-    if not llm:
-        logger.warning("LLM not initialized. RAG query cannot generate final answer effectively.")
-        # Allow to proceed if embeddings are available, for retrieval-only tests, but flag it.
-    
+        except Exception as e:
+            logger.error(f"Error processing file {original_filename}: {e}", exc_info=True)
+
+    logger.info(f"Loaded {len(texts)} chunks ({len(stored_chunks)} from storage).")
+
+    if not texts:
+        return None
+
+    # Build the index with the datasource's settings, only embedding chunks that have no stored vector
+    missing_indexes = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing_indexes:
+        logger.info(f"Embedding {len(missing_indexes)} chunks without stored vectors...")
+        with span("embedding"), track_embedding("index", len(missing_indexes)):
+            missing_vectors = await asyncio.to_thread(embeddings.embed_documents, [texts[i] for i in missing_indexes])
+        for i, vector in zip(missing_indexes, missing_vectors):
+            vectors[i] = np.asarray(vector, dtype=np.float32)
+    logger.info(f"Creating FAISS {index_type} vector store ({quantization}) from {len(texts)} chunks...")
+    with span("faiss.build"):
+        vector_store = await asyncio.to_thread(
+            build_vector_store, texts, metadatas, np.vstack(vectors), embeddings, index_type, quantization
+        )
+    logger.info("FAISS vector store created.")
+    documents_by_chunk_id = {
+        metadata["chunk_id"]: Document(page_content=text, metadata=metadata)
+        for text, metadata in zip(texts, metadatas) if "chunk_id" in metadata
+    }
+    return vector_store, documents_by_chunk_id
+
+async def _prepare_rag_chain(query: str, datasource: Dict[str, Any]) -> Tuple[Optional[RetrievalQA], Optional[Dict[str, Any]]]:
+    """
+    Set up the RetrievalQA chain of a knowledge base datasource.
+    Returns (chain, None), or (None, response) when the query is answered without the chain
+    (missing embedding model, no processed files or no chunks).
+    """
     if not embeddings:
         logger.error("Local embedding model not initialized. RAG query cannot perform vectorization and retrieval.")
-        return {
+        return None, {
             "query": query, "query_type": "rag", "success": False,
             "answer": "RAG functionality cannot be executed because a dependent component is not initialized. Please check API keys and configuration.",
             "data": {"source_datasource_id": datasource['id'], "source_datasource_name": datasource['name']},
             "error": "Local embeddings not initialized."
         }
+
+    # 1. Fetch list of 'completed' files from the database
+    datasource_id = datasource['id']
+    logger.info(f"Fetching completed files for datasource_id: {datasource_id}")
+    db_files = await get_files_by_datasource(datasource_id)
     
-    try:
-        # 1. Fetch list of 'completed' files from the database
-        datasource_id = datasource['id']
-        logger.info(f"Fetching completed files for datasource_id: {datasource_id}")
-        db_files = await get_files_by_datasource(datasource_id)
-        
-        completed_files = [f for f in db_files if f['processing_status'] == 'completed']
-        logger.info(f"Found {len(completed_files)} completed files for datasource {datasource_id}.")
+    completed_files = [f for f in db_files if f['processing_status'] == 'completed']
+    logger.info(f"Found {len(completed_files)} completed files for datasource {datasource_id}.")
+
+    if not completed_files:
+        return None, {
+            "query": query, "query_type": "rag", "success": True, # Success=True as it's a valid state
+            "answer": f"No successfully processed files available for query in data source '{datasource['name']}'. Please upload files and wait for processing to complete.",
+            "data": {"source_datasource_id": datasource['id'], "source_datasource_name": datasource['name'], "retrieved_documents": []}
+        }
 
-        if not completed_files:
-            return {
-                "query": query, "query_type": "rag", "success": True, # Success=True as it's a valid state
-                "answer": f"No successfully processed files available for query in data source '{datasource['name']}'. Please upload files and wait for processing to complete.",
+    # 2. Reuse the datasource's index while its completed files and index settings are unchanged
+    index_type = datasource.get('vector_index_type') or VectorIndexType.FLAT.value
+    quantization = datasource.get('vector_quantization') or VectorQuantization.FLOAT32.value
+    fingerprint = vector_index_fingerprint(completed_files, index_type, quantization)
+    cached_index = get_cached_vector_index(datasource_id, fingerprint)
+    if cached_index:
+        logger.info(f"Using cached {index_type}/{quantization} vector index for datasource {datasource_id}.")
+        vector_store, documents_by_chunk_id = cached_index
+    else:
+        built_index = await _build_rag_vector_store(completed_files, index_type, quantization)
+        if built_index is None:
+            logger.warning("No chunks were created from the documents. Cannot proceed with RAG.")
+            return None, {
+                "query": query, "query_type": "rag", "success": True,
+                "answer": f"Could not extract valid content chunks from files in data source '{datasource['name']}' for querying.",
                 "data": {"source_datasource_id": datasource['id'], "source_datasource_name": datasource['name'], "retrieved_documents": []}
             }
+        vector_store, documents_by_chunk_id = built_index
+        cache_vector_index(datasource_id, fingerprint, built_index)
+
+    # 3. Perform retrieval (RetrievalQA chain) over dense + BM25 keyword results fused with RRF
+    logger.info("Setting up RetrievalQA chain...")
+    retriever = HybridRetriever(
+        vector_store=vector_store,
+        documents_by_chunk_id=documents_by_chunk_id,
+        files=completed_files,
+        k=RAG_TOP_K
+    )
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff", # Other types: map_reduce, refine, map_rerank
+        retriever=retriever,
+        return_source_documents=True
+    )
+    return qa_chain, None
+
+def _source_documents_data(documents: List[Document]) -> List[Dict[str, Any]]:
+    """Serializable summary of retrieved chunks for API responses."""
+    return [
+        {
+            "source": document.metadata.get("source", "Unknown source"),
+            "content_preview": document.page_content[:200] + "...", # Preview of content
+            "retrieved_by": document.metadata.get("retrieved_by", [])
+        }
+        for document in documents
+    ]
+
+def _rag_response(query: str, datasource: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Response for a completed RetrievalQA run."""
+    answer = result.get("result", "Could not find a clear answer in the knowledge base.")
+    source_documents_data = _source_documents_data(result.get("source_documents") or [])
+    logger.info(f"RAG query successful. Answer: {answer[:100]}... Sources: {len(source_documents_data)}")
+    return {
+        "query": query,
+        "query_type": "rag",
+        "answer": answer,
+        "data": {
+            "source_datasource_id": datasource['id'],
+            "source_datasource_name": datasource['name'],
+            "retrieved_documents": source_documents_data
+        },
+        "success": True
+    }
+
+def _rag_error_response(query: str, datasource: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+    logger.error(f"Error during RAG for datasource {datasource['name']}: {error}", exc_info=True)
+    return {
+        "query": query, "query_type": "rag", "success": False,
+        "answer": f"A critical error occurred while processing your query '{query}' in data source '{datasource['name']}'.",
+        "data": {"source_datasource_id": datasource['id'], "source_datasource_name": datasource['name']},
+        "error": str(error)
+    }
 
-        all_docs = []
-        # 2. Load and parse file content
-        for file_info in completed_files:
-            file_path = UPLOAD_DIR / file_info['filename']
-            text_content = ""
-            file_type = file_info['file_type']
-            original_filename = file_info['original_filename']
+async def perform_rag_query(query: str, datasource: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Performs RAG retrieval and Q&A for the specified data source.
+    """
+    logger.info(f"Attempting RAG query on datasource: {datasource['name']} (ID: {datasource['id']}) for query: '{query}'")
 
-            logger.info(f"Processing file: {file_path} (Original: {original_filename}, Type: {file_type})")
+    if not llm:
+        logger.warning("LLM not initialized. RAG query cannot generate final answer effectively.")
+        # Allow to proceed if embeddings are available, for retrieval-only tests, but flag it.
 
-            if not file_path.exists():
-                logger.warning(f"File not found: {file_path} for file_info: {original_filename}")
-                continue
-            
-            try:
-                if file_type == 'txt':
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        text_content = f.read()
-                elif file_type == 'pdf':
-                    text_content = _extract_text_from_pdf(file_path)
-                elif file_type == 'docx':
-                    text_content = _extract_text_from_docx(file_path)
-                # Add other file types like CSV, XLSX later
-                elif file_type == 'csv':
-                    text_content = _extract_text_from_csv_pandas(file_path)
-                elif file_type == 'xlsx':
-                    text_content = _extract_text_from_xlsx_pandas(file_path)
-                else:
-                    logger.info(f"Skipping file {original_filename} due to unsupported file type: {file_type}")
-                    continue
-                
-                if text_content.strip():
-                    doc = Document(page_content=text_content, metadata={"source": original_filename, "file_id": file_info['id']})
-                    all_docs.append(doc)
-                    logger.info(f"Successfully processed and created Document for {original_filename}. Length: {len(text_content)}")
-                else:
-                    logger.warning(f"No text content extracted from {original_filename} (Type: {file_type})")
-
-            except Exception as e:
-                logger.error(f"Error processing file {original_filename}: {e}", exc_info=True)
-                # Optionally, update file status to 'failed' here if processing fails at this stage
-                # await update_file_processing_status(file_info['id'], status=ProcessingStatus.FAILED.value, error_message=f"Content extraction failed: {str(e)}")
-
-        if not all_docs:
-             return {
-                "query": query, "query_type": "rag", "success": True,
-                "answer": f"No processable (TXT, PDF, DOCX, CSV, XLSX) file content found in data source '{datasource['name']}'.",
-                "data": {"source_datasource_id": datasource['id'], "source_datasource_name": datasource['name'], "retrieved_documents": []}
-            }
+    try:
+        qa_chain, response = await _prepare_rag_chain(query, datasource)
+        if qa_chain is None:
+            return response
+        logger.info(f"Executing RAG query: '{query}'")
+        with span("rag.chain"):
+            result = await qa_chain.ainvoke({"query": query})
+        return _rag_response(query, datasource, result)
 
-        # 3. Text chunking
-        logger.info(f"Splitting {len(all_docs)} documents into chunks.")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunked_docs = text_splitter.split_documents(all_docs)
-        logger.info(f"Created {len(chunked_docs)} chunks.")
+    except Exception as e:
+        return _rag_error_response(query, datasource, e)
 
-        if not chunked_docs:
-            logger.warning("No chunks were created from the documents. Cannot proceed with RAG.")
-            return {
-                "query": query, "query_type": "rag", "success": True,
-                "answer": f"Could not extract valid content chunks from files in data source '{datasource['name']}' for querying.",
-                "data": {"source_datasource_id": datasource['id'], "source_datasource_name": datasource['name'], "retrieved_documents": []}
-            }
+async def stream_rag_query(query: str, datasource: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of perform_rag_query. Yields ("context", retrieved chunks) as soon as
+    retrieval finishes, then ("token", text) for each LLM token and finally ("answer", response).
+    """
+    logger.info(f"Attempting streaming RAG query on datasource: {datasource['name']} (ID: {datasource['id']}) for query: '{query}'")
+    try:
+        qa_chain, response = await _prepare_rag_chain(query, datasource)
+        if qa_chain is None:
+            yield "answer", response
+            return
+
+        result: Dict[str, Any] = {}
+        async for event in qa_chain.astream_events({"query": query}, version="v2"):
+            if event["event"] == "on_retriever_end":
+                yield "context", {
+                    "query_type": "rag",
+                    "data": {
+                        "source_datasource_id": datasource['id'],
+                        "source_datasource_name": datasource['name'],
+                        "retrieved_documents": _source_documents_data(event["data"].get("output") or [])
+                    }
+                }
+            elif event["event"] == "on_chat_model_stream":
+                text = event["data"]["chunk"].content
+                if text:
+                    yield "token", {"text": text}
+            elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                result = event["data"].get("output") or {}
+        yield "answer", _rag_response(query, datasource, result)
 
-        # 4. Create in-memory vector store (FAISS)
-        logger.info("Creating FAISS vector store from chunks...")
-        vector_store = FAISS.from_documents(chunked_docs, embeddings)
-        logger.info("FAISS vector store created.")
-
-        # 5. Perform retrieval (RetrievalQA chain)
-        logger.info("Setting up RetrievalQA chain...")
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff", # Other types: map_reduce, refine, map_rerank
-            retriever=vector_store.as_retriever(search_kwargs={"k": 3}), # Retrieve top 3 chunks
-            return_source_documents=True
-        )
-        logger.info(f"Executing RAG query: '{query}'")
-        result = await qa_chain.ainvoke({"query": query})
-        
-        answer = result.get("result", "Could not find a clear answer in the knowledge base.")
-        source_documents_data = []
-        if result.get("source_documents"):
-            for doc_source in result["source_documents"]:
-                source_documents_data.append({
-                    "source": doc_source.metadata.get("source", "Unknown source"),
-                    "content_preview": doc_source.page_content[:200] + "..." # Preview of content
-                })
-
-        logger.info(f"RAG query successful. Answer: {answer[:100]}... Sources: {len(source_documents_data)}")
-        return {
-            "query": query,
-            "query_type": "rag",
-            "answer": answer,
-            "data": {
-                "source_datasource_id": datasource['id'],
-                "source_datasource_name": datasource['name'],
-                "retrieved_documents": source_documents_data
-            },
-            "success": True
+    except Exception as e:
+        yield "answer", _rag_error_response(query, datasource, e)
+
+def _get_sqlite_engine():
+    """The engine over smart_erp.db, created on first use instead of once per question."""
+    global sqlite_engine
+    if sqlite_engine is None:
+        sqlite_engine = create_engine(DB_URI)
+    return sqlite_engine
+
+def _sql_rows_response(query: str, active_datasource: Dict[str, Any], sql_query: str,
+                       rows: List[Dict[str, Any]], truncated: bool, execution_mode: str) -> Dict[str, Any]:
+    """Response for SQL executed without the agent (cached or single-shot), answered from the rows themselves."""
+    return {
+        "query": query, "query_type": "sql_agent", "success": True,
+        "answer": format_rows_answer(rows, truncated),
+        "data": {
+            "source_datasource_id": active_datasource['id'],
+            "source_datasource_name": active_datasource['name'],
+            "queried_table": active_datasource.get("db_table_name"),
+            "sql_query": sql_query,
+            "execution_mode": execution_mode,
+            "rows": rows,
+            "truncated": truncated
         }
+    }
 
+async def _run_direct_sql(query: str, db: GuardedSQLDatabase, table_name: str, schema_hash: str,
+                          table_summary: Optional[str] = None) -> Optional[tuple[str, List[Dict[str, Any]], bool]]:
+    """
+    Translate the question with a single LLM call and execute the SQL under the guard.
+    Returns (sql, rows, truncated), or None when the caller should fall back to the SQL agent.
+    """
+    try:
+        # Prefer the statistics stored at ingestion; tables ingested before profiling existed are sampled live
+        schema_summary = table_summary
+        if not schema_summary:
+            with span("sql.schema"):
+                schema_summary = await asyncio.to_thread(get_schema_summary, db, table_name, schema_hash)
+        prompt = build_direct_sql_prompt(query, schema_summary, db.dialect, db.max_rows)
+        llm_response = await llm.ainvoke(prompt)
+        sql = extract_sql_from_completion(llm_response.content)
+        if not sql:
+            logger.info(f"Direct SQL: LLM declined to translate '{query}', using SQL Agent.")
+            return None
+        rejection = validate_direct_sql(sql, table_name, db)
+        if rejection:
+            logger.info(f"Direct SQL rejected ({rejection}): {sql}")
+            return None
+        with span("sql.execute"):
+            rows, truncated = await asyncio.to_thread(db.fetch_rows, sql)
+        logger.info(f"Direct SQL answered '{query}' with: {sql}")
+        return sql, rows, truncated
     except Exception as e:
-        logger.error(f"Error during RAG for datasource {datasource['name']}: {e}", exc_info=True)
-        return {
-            "query": query, "query_type": "rag", "success": False,
-            "answer": f"A critical error occurred while processing your query '{query}' in data source '{datasource['name']}'.",
-            "data": {"source_datasource_id": datasource['id'], "source_datasource_name": datasource['name']},
-            "error": str(e)
-        }
+        logger.warning(f"Direct SQL failed for query '{query}', using SQL Agent: {e}")
+        return None
 
 async def get_answer_from_sqltable_datasource(query: str, active_datasource: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -321,16 +432,65 @@ async def get_answer_from_sqltable_datasource(query: str, active_datasource: Dic
         }
 
     try:
-        logger.info(f"Initializing SQLDatabase for table: {db_table_name} using URI: {DB_URI}")
-        # SQLDatabase will connect to the main smart_erp.db, but we tell it to only include the specific table.
-        db = SQLDatabase.from_uri(DB_URI, include_tables=[db_table_name])
+        # Tables of DuckDB-backed datasources live in the analytics database; everything else in smart_erp.db
+        if active_datasource.get("storage_engine") == StorageEngine.DUCKDB.value:
+            if not is_duckdb_available():
+                raise RuntimeError("Datasource uses the DuckDB storage engine but 'duckdb'/'duckdb-engine' are not installed.")
+            dialect, engine = "duckdb", get_duckdb_engine()
+        else:
+            dialect, engine = "sqlite", _get_sqlite_engine()
+        logger.info(f"Initializing SQLDatabase for table: {db_table_name} using {dialect} engine")
+        # SQLDatabase will connect to the selected database, but we tell it to only include the specific table.
+        # The guarded variant bounds every query the agent runs (row cap, timeout, full-scan rejection).
+        # A stored profile replaces the live row sampling SQLDatabase does to describe the table
+        table_summary = None
+        table_info_kwargs = {}
+        table_profile = await get_table_profile(db_table_name)
+        if table_profile:
+            table_summary = format_profile_summary(db_table_name, table_profile, dialect)
+            table_info_kwargs = {"sample_rows_in_table_info": 0, "custom_table_info": {db_table_name: table_summary}}
+        db = GuardedSQLDatabase(engine, include_tables=[db_table_name], **table_info_kwargs)
+
+        schema_hash = compute_schema_hash(db, [db_table_name])
+
+        # Questions answered before against the same table schema reuse the validated SQL without any LLM call
+        cache_key = None
+        if NL_SQL_CACHE_ENABLED:
+            cache_key = (normalize_question(query), schema_hash)
+            cached_sql = await get_cached_sql(*cache_key)
+            NL_SQL_CACHE_LOOKUPS.inc(result="hit" if cached_sql else "miss")
+            rejection = validate_direct_sql(cached_sql, db_table_name, db) if cached_sql else None
+            if rejection:
+                logger.warning(f"Cached SQL rejected ({rejection}), falling back to SQL Agent: {cached_sql}")
+                await delete_cached_sql(*cache_key)
+            elif cached_sql:
+                try:
+                    with span("sql.execute"):
+                        rows, truncated = await asyncio.to_thread(db.fetch_rows, cached_sql)
+                    logger.info(f"NL-to-SQL cache hit for query '{query}': {cached_sql}")
+                    return _sql_rows_response(query, active_datasource, cached_sql, rows, truncated, "cache")
+                except Exception as e:
+                    logger.warning(f"Cached SQL failed for query '{query}', falling back to SQL Agent: {e}")
+                    await delete_cached_sql(*cache_key)
+
+        # Single-shot translation (one LLM call); the multi-step agent below is the fallback
+        if SQL_DIRECT_MODE_ENABLED:
+            direct_result = await _run_direct_sql(query, db, db_table_name, schema_hash, table_summary)
+            if direct_result:
+                direct_sql, rows, truncated = direct_result
+                if cache_key:
+                    await save_cached_sql(*cache_key, direct_sql, max_entries=NL_SQL_CACHE_MAX_ENTRIES)
+                return _sql_rows_response(query, active_datasource, direct_sql, rows, truncated, "direct")
         
         logger.info(f"Creating SQL Agent for table: {db_table_name}")
         # If using a non-OpenAI LLM that doesn't support function calling well,
         # you might need to use AgentType.ZERO_SHOT_REACT_DESCRIPTION
         # sql_agent_executor = create_sql_agent(llm=llm, db=db, agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION, verbose=True)
         # For OpenAI models that support function calling, the default agent type is usually better.
-        sql_agent_executor = create_sql_agent(llm=llm, db=db, verbose=True, handle_parsing_errors=True) # Added handle_parsing_errors
+        sql_agent_executor = create_sql_agent(
+            llm=llm, db=db, verbose=True, handle_parsing_errors=True, # Added handle_parsing_errors
+            agent_executor_kwargs={"return_intermediate_steps": True} # Needed to recover the final SQL for the cache
+        )
         
         logger.info(f"Executing SQL Agent with query: {query}")
         # The agent's invoke method expects a dictionary with an "input" key
@@ -346,10 +506,19 @@ async def get_answer_from_sqltable_datasource(query: str, active_datasource: Dic
         # The direct string input might also work depending on the agent version/type.
         
         # Let's stick to the common .invoke pattern for better compatibility
-        response = await sql_agent_executor.ainvoke({"input": query}) # Using ainvoke for async
+        with span("sql.agent"):
+            response = await sql_agent_executor.ainvoke({"input": query}) # Using ainvoke for async
         
         answer = response.get("output", "Could not get an answer from SQL Agent.")
         logger.info(f"SQL Agent execution complete. Answer: {answer}")
+        final_sql = extract_final_sql(response.get("intermediate_steps"))
+        if cache_key and final_sql and "output" in response:
+            # Agent SQL is replayed without the agent on later hits, so it must pass the same checks as direct SQL
+            rejection = validate_direct_sql(final_sql, db_table_name, db)
+            if rejection:
+                logger.info(f"Agent SQL not cached ({rejection}): {final_sql}")
+            else:
+                await save_cached_sql(*cache_key, final_sql, max_entries=NL_SQL_CACHE_MAX_ENTRIES)
         
         return {
             "query": query, "query_type": "sql_agent", "success": True,
@@ -358,7 +527,8 @@ async def get_answer_from_sqltable_datasource(query: str, active_datasource: Dic
                 "source_datasource_id": active_datasource['id'],
                 "source_datasource_name": active_datasource['name'],
                 "queried_table": db_table_name,
-                # We could potentially include the generated SQL query from the agent's intermediate steps if verbose=True captures it.
+                "sql_query": final_sql,
+                "execution_mode": "agent"
             }
         }
 
@@ -371,6 +541,14 @@ async def get_answer_from_sqltable_datasource(query: str, active_datasource: Dic
             "error": str(e)
         }
 
+def _erp_route(query: str, query_type: str) -> str:
+    """Handler of a default ERP query: "sales", "inventory", "report" or "general_erp"."""
+    if query_type in ("sales", "inventory"):
+        return query_type
+    if query_type == "report" or "report" in query or "summary" in query:
+        return "report"
+    return "general_erp"
+
 async def get_answer_from_erp(query: str, query_type: str = "sales", active_datasource: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Main function to get answers from the ERP system.
@@ -421,13 +599,14 @@ async def get_answer_from_erp(query: str, query_type: str = "sales", active_data
     # Existing ERP logic based on query_type (sales, inventory, report)
     # This part might need LLM for interpretation or can use direct DB queries for simple cases.
     # For now, it assumes direct DB queries or simplified LLM interaction.
-    if query_type == "sales":
+    erp_route = _erp_route(query, query_type)
+    if erp_route == "sales":
         answer, data = await get_sales_query_response(query)
         return {"answer": answer, "data": data, "query_type": "sales", "source_datasource_name": ds_name}
-    elif query_type == "inventory":
+    elif erp_route == "inventory":
         data, answer = await get_inventory_check_response_by_query(query)
         return {"answer": answer, "data": {"low_stock_items": data}, "query_type": "inventory", "source_datasource_name": ds_name}
-    elif query_type == "report" or "report" in query or "summary" in query:
+    elif erp_route == "report":
         answer, report_data, chart_data = await get_daily_sales_report_response_from_agent()
         return {"answer": answer, "data": report_data, "chart_data": chart_data, "query_type": "report", "source_datasource_name": ds_name}
     else: # Default/Fallback for ERP if query_type is not specific
@@ -437,6 +616,61 @@ async def get_answer_from_erp(query: str, query_type: str = "sales", active_data
         answer, data = await get_sales_query_response(query) # Or a more generic ERP query handler
         return {"answer": answer, "data": data, "query_type": "general_erp", "source_datasource_name": ds_name}
 
+async def stream_answer_from_erp(query: str, query_type: str = "sales",
+                                 active_datasource: Optional[Dict[str, Any]] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of get_answer_from_erp. Yields (event, payload) pairs:
+      - ("context", {"query_type", "data"}): retrieved chunks / fetched ERP rows, before any LLM call
+      - ("token", {"text"}): LLM answer tokens, as they are generated
+      - ("answer", result): the complete result, shaped like get_answer_from_erp's
+    Knowledge bases and the sales/inventory summarizers stream tokens; SQL table datasources
+    and the daily report are answered in one piece after their context.
+    """
+    ds_type = active_datasource.get('type') if active_datasource else DataSourceType.DEFAULT.value
+    ds_name = active_datasource.get('name', 'Default ERP') if active_datasource else 'Default ERP'
+
+    if ds_type == DataSourceType.KNOWLEDGE_BASE.value and llm:
+        async for event in stream_rag_query(query, active_datasource):
+            yield event
+        return
+
+    erp_route = _erp_route(query, query_type)
+    if ds_type != DataSourceType.DEFAULT.value or erp_route == "report":
+        result = await get_answer_from_erp(query, query_type, active_datasource=active_datasource)
+        yield "context", {"query_type": result.get("query_type", query_type), "data": result.get("data") or {}}
+        yield "answer", result
+        return
+
+    logger.info(f"Streaming default ERP answer for datasource: {ds_name} (route: {erp_route})")
+    prompt = None
+    if erp_route == "inventory":
+        items_to_report, answer = await _collect_inventory_for_query(query)
+        data = {"low_stock_items": items_to_report}
+        if llm:
+            prompt = _inventory_summary_prompt(query, answer, items_to_report)
+    else:
+        sales_summary = await fetch_sales_summary_for_query(query)
+        if not sales_summary["summary_stats"]["total_records"]:
+            answer, data = "Based on your query, I couldn't find related sales data.", None
+        elif llm:
+            answer, data = _sales_llm_error_answer(sales_summary), _sales_response_data(sales_summary)
+            prompt = _sales_summary_prompt(query, sales_summary)
+        else:
+            answer, data = _sales_fallback_answer(query, sales_summary)
+    yield "context", {"query_type": erp_route, "data": data}
+
+    if prompt:
+        tokens: List[str] = []
+        try:
+            async for chunk in llm.astream(prompt):
+                if chunk.content:
+                    tokens.append(chunk.content)
+                    yield "token", {"text": chunk.content}
+            answer = "".join(tokens)
+        except Exception as e:
+            # Keep the rule-based answer; tokens already sent are superseded by the final answer event
+            logger.error(f"LLM streaming failed for {erp_route} query summarization: {e}", exc_info=True)
+    yield "answer", {"answer": answer, "data": data, "query_type": erp_route, "source_datasource_name": ds_name}
 
 async def get_sales_query_response(query: str) -> tuple[str, Optional[dict]]:
     """
@@ -449,51 +683,98 @@ async def get_sales_query_response(query: str) -> tuple[str, Optional[dict]]:
     # It might use LLM for understanding the query and formatting the response,
     # or use simpler rule-based logic for predefined questions.
     
-    # Example: Fetch raw data first
-    sales_data = await fetch_sales_data_for_query(query) # This function already exists
+    # Totals, rankings and breakdowns are computed in SQL; only they and a few sample rows come back
+    sales_summary = await fetch_sales_summary_for_query(query)
 
-    if not sales_data:
+    if not sales_summary["summary_stats"]["total_records"]:
         return "Based on your query, I couldn't find related sales data.", None
 
-    # Simplified response for now. A real scenario might use LLM to summarize.
     if llm:
-        # Prepare a prompt for the LLM to summarize the sales_data based on the query
-        prompt = f"""
-        User query: "{query}"
-        Relevant sales data (JSON):
-        {str(sales_data[:5])} ... (showing first 5 records for brevity)
-        
-        Please generate a concise answer in English based on the user query and the data above.
-        If the user query asks for specific metrics (e.g., total sales, average order value), calculate and include them.
-        """
         try:
-            response = llm.invoke(prompt)
+            response = await llm.ainvoke(_sales_summary_prompt(query, sales_summary))
             answer = response.content
             logger.info(f"LLM generated sales answer: {answer}")
-            return answer, {"detailed_sales": sales_data}
+            return answer, _sales_response_data(sales_summary)
         except Exception as e:
             logger.error(f"LLM invocation failed for sales query summarization: {e}", exc_info=True)
-            return f"Found {len(sales_data)} related sales records. Unable to provide detailed summary due to LLM processing error.", {"detailed_sales": sales_data}
+            return _sales_llm_error_answer(sales_summary), _sales_response_data(sales_summary)
     else:
-        # Fallback if LLM is not available for sales query
-        num_records = len(sales_data)
-        total_sales_amount = sum(item['total_amount'] for item in sales_data)
-        
-        answer = f"Found {num_records} sales records. Total sales amount approximately {total_sales_amount:.2f}."
-        if "best selling" in query or "top selling" in query:
-            # Simple logic for top selling - could be more sophisticated
-            from collections import Counter
-            product_counts = Counter(item['product_name'] for item in sales_data)
-            top_product, count = product_counts.most_common(1)[0] if product_counts else ("Unknown", 0)
-            answer += f" The most frequently sold product is '{top_product}' (sold {count} times)."
+        return _sales_fallback_answer(query, sales_summary)
+
+def _sales_response_data(sales_summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Response data of a sales answer: the SQL aggregates, with the sample rows as detailed_sales."""
+    data = {key: value for key, value in sales_summary.items() if key != "sample"}
+    data["detailed_sales"] = sales_summary["sample"]
+    return data
+
+# Sections of the sales prompt, most important first: the token budget trims the last ones first
+_SALES_PROMPT_TABLES = (
+    ("top_products_by_revenue", "Top products by revenue"),
+    ("top_products_by_quantity", "Top products by quantity"),
+    ("by_category", "Sales by category"),
+    ("by_day", "Sales by day"),
+    ("sample", "Most recent matching sales"),
+)
+# Sample sales rows shown to the LLM (the aggregates carry the totals)
+SALES_PROMPT_SAMPLE_ROWS = 5
+
+def _sales_summary_prompt(query: str, sales_summary: Dict[str, Any]) -> str:
+    """Prompt for the LLM to answer the query from the sales aggregates, as CSV tables within PROMPT_TOKEN_BUDGET."""
+    tables = {name: sales_summary[name] for name, _ in _SALES_PROMPT_TABLES if name in sales_summary}
+    tables["sample"] = tables["sample"][:SALES_PROMPT_SAMPLE_ROWS]
+
+    def render(formatted: Dict[str, str]) -> str:
+        sections = "\n\n".join(f"{title} (CSV):\n{formatted[name]}" for name, title in _SALES_PROMPT_TABLES if name in formatted)
+        return (
+            f'User query: "{query}"\n'
+            f"Sales aggregates for the requested period, computed over all matching sales.\n"
+            f"time_range: {json.dumps(sales_summary['time_range'], default=str)}\n"
+            f"product_filter: {sales_summary['product_filter']}\n"
+            f"{format_fields(sales_summary['summary_stats'])}\n\n"
+            f"{sections}\n\n"
+            "Please generate a concise answer in English based on the user query and the data above.\n"
+            "Use the aggregates (not the sample records) for totals, averages and rankings."
+        )
+
+    return fit_prompt("sales_summary", render, tables)
+
+def _sales_llm_error_answer(sales_summary: Dict[str, Any]) -> str:
+    return f"Found {sales_summary['summary_stats']['total_records']} related sales records. Unable to provide detailed summary due to LLM processing error."
+
+def _sales_fallback_answer(query: str, sales_summary: Dict[str, Any]) -> tuple[str, dict]:
+    """Rule-based sales answer used when the LLM is not available."""
+    stats = sales_summary["summary_stats"]
+    
+    answer = f"Found {stats['total_records']} sales records. Total sales amount approximately {stats['total_amount']:.2f}."
+    if ("best selling" in query or "top selling" in query) and sales_summary["top_products_by_quantity"]:
+        top_product = sales_summary["top_products_by_quantity"][0]
+        answer += f" The best selling product is '{top_product['product_name']}' ({top_product['total_quantity']} units sold)."
 
-        return answer, {"detailed_sales": sales_data, "summary_stats": {"total_records": num_records, "total_amount": total_sales_amount}}
+    return answer, _sales_response_data(sales_summary)
 
 async def get_inventory_check_response_by_query(query: str) -> tuple[List[Dict[str, Any]], str]:
     """
     Handles inventory-related queries by trying to extract a product ID or using general low stock.
     (This is part of the original ERP logic)
     """
+    items_to_report, response_summary = await _collect_inventory_for_query(query)
+
+    # If LLM is available, it could rephrase `response_summary` or interpret `items_to_report`
+    if llm:
+        try:
+            llm_response = await llm.ainvoke(_inventory_summary_prompt(query, response_summary, items_to_report))
+            final_answer = llm_response.content
+            logger.info(f"LLM generated inventory answer: {final_answer}")
+            return items_to_report, final_answer
+        except Exception as e:
+            logger.error(f"LLM invocation failed for inventory query summarization: {e}", exc_info=True)
+            # Fallback to pre-LLM summary if LLM fails during try block
+            return items_to_report, response_summary
+    else: # This is the corrected else for 'if llm:'
+        return items_to_report, response_summary
+
+async def _collect_inventory_for_query(query: str) -> tuple[List[Dict[str, Any]], str]:
+    """Inventory items relevant to the query and a rule-based summary of them."""
     logger.info(f"Processing inventory query for default ERP: {query}")
     # Simple check for a product ID (e.g., "库存 P001") - this could be more robust
     # For a more general query, it might default to showing low stock items.
@@ -564,28 +845,24 @@ async def get_inventory_check_response_by_query(query: str) -> tuple[List[Dict[s
         else: # Corresponds to if low_stock_items
             response_summary = "Currently all products have stock above the warning threshold (50 units)."
             # items_to_report will remain empty
-            
-    # If LLM is available, it could rephrase `response_summary` or interpret `items_to_report`
-    if llm:
-        prompt = f"""
-        User inventory query: "{query}"
-        Retrieved inventory information/summary: "{response_summary}"
-        Relevant product data (JSON):
-        {str(items_to_report[:3])} ... (showing first 3 items for brevity if many)
-
-        Please generate a natural answer in English based on the user query and the data above.
-        """
-        try:
-            llm_response = llm.invoke(prompt)
-            final_answer = llm_response.content
-            logger.info(f"LLM generated inventory answer: {final_answer}")
-            return items_to_report, final_answer
-        except Exception as e:
-            logger.error(f"LLM invocation failed for inventory query summarization: {e}", exc_info=True)
-            # Fallback to pre-LLM summary if LLM fails during try block
-            return items_to_report, response_summary
-    else: # This is the corrected else for 'if llm:'
-        return items_to_report, response_summary
+
+    return items_to_report, response_summary
+
+# Inventory items shown to the LLM (the rule-based summary covers all of them)
+INVENTORY_PROMPT_ITEMS = 3
+
+def _inventory_summary_prompt(query: str, response_summary: str, items_to_report: List[Dict[str, Any]]) -> str:
+    """Prompt for the LLM to rephrase the inventory summary for the user's query."""
+    def render(formatted: Dict[str, str]) -> str:
+        return (
+            f'User inventory query: "{query}"\n'
+            f'Retrieved inventory information/summary: "{response_summary}"\n'
+            f"Relevant product data (CSV, first {min(INVENTORY_PROMPT_ITEMS, len(items_to_report))} of {len(items_to_report)} items):\n"
+            f"{formatted['items']}\n\n"
+            "Please generate a natural answer in English based on the user query and the data above."
+        )
+
+    return fit_prompt("inventory_summary", render, {"items": items_to_report[:INVENTORY_PROMPT_ITEMS]})
 
 async def get_inventory_check_response() -> tuple[List[Dict[str, Any]], str]:
     # This is a simplified version, assuming a general "check inventory" means "show low stock"
@@ -607,13 +884,9 @@ async def get_daily_sales_report_response_from_agent() -> tuple[str, Dict[str, A
     logger.info("Generating daily sales report for default ERP.")
     # This uses the existing report generation logic.
     # If LLM is available, it could enhance the summary.
-    summary, report_data, chart_data = await generate_daily_sales_summary_report(llm=llm) # Pass LLM if needed by report
-    
-    # The summary from generate_daily_sales_summary_report might already be LLM-generated or template-based.
-    # If not, and LLM is available here, we could try to enhance it.
-    # For now, we assume the summary is good as is.
-    
-    return summary, report_data, chart_data
+    # The report module summarizes with its own LLM client (or a template when none is configured)
+    summary, report_data = await generate_daily_sales_summary_report()
+    return summary, report_data, None
 
 def initialize_app_state():
     """
@@ -0,0 +1,126 @@
+"""
+Optional columnar analytics backend (DuckDB) for SQL_TABLE_FROM_FILE datasources.
+
+Datasources created with storage_engine="duckdb" keep their uploaded tables in a
+DuckDB database file instead of SQLite, so the aggregate-heavy SQL generated by the
+SQL agent runs on a vectorized column store. DuckDB is an optional dependency:
+install `duckdb` (and `duckdb-engine` for the LangChain SQL agent) to enable it.
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # Optional dependency
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "analytics.duckdb"
+
+# DuckDB refuses a second connection to the same file with a different configuration, so the
+# process opens the database once; the helpers below and the SQL agent's engine use cursors of it
+_duckdb_connection = None
+_duckdb_engine = None
+_duckdb_lock = threading.Lock()
+
+def is_duckdb_available() -> bool:
+    """Check whether the DuckDB backend can be used (duckdb and its SQLAlchemy dialect are installed)."""
+    if duckdb is None:
+        return False
+    try:
+        import duckdb_engine  # noqa: F401  SQLAlchemy dialect used by the SQL agent
+    except ImportError:
+        return False
+    return True
+
+def _get_shared_connection():
+    """The process-wide connection to the analytics database, opened on first use."""
+    global _duckdb_connection
+    if duckdb is None:
+        raise RuntimeError("DuckDB backend requested but the 'duckdb' package is not installed.")
+    with _duckdb_lock:
+        if _duckdb_connection is None:
+            ANALYTICS_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+            _duckdb_connection = duckdb.connect(str(ANALYTICS_DB_PATH))
+        return _duckdb_connection
+
+def get_duckdb_connection():
+    """A cursor of the shared analytics connection (close it when done; the database stays open)."""
+    return _get_shared_connection().cursor()
+
+def get_duckdb_engine():
+    """
+    SQLAlchemy engine over the analytics database, for LangChain's SQLDatabase.
+    Created once; its pooled connections are cursors of the shared connection.
+    """
+    global _duckdb_engine
+    if _duckdb_engine is None:
+        from duckdb_engine import ConnectionWrapper
+        from sqlalchemy import create_engine
+        shared = _get_shared_connection()
+        with _duckdb_lock:
+            if _duckdb_engine is None:
+                _duckdb_engine = create_engine("duckdb://", creator=lambda: ConnectionWrapper(shared.cursor()))
+    return _duckdb_engine
+
+def close_duckdb():
+    """Dispose of the engine and close the shared connection (called on application shutdown)."""
+    global _duckdb_connection, _duckdb_engine
+    with _duckdb_lock:
+        if _duckdb_engine is not None:
+            _duckdb_engine.dispose()
+            _duckdb_engine = None
+        if _duckdb_connection is not None:
+            _duckdb_connection.close()
+            _duckdb_connection = None
+
+def write_frames_to_table(table_name: str, frames: List[pd.DataFrame]) -> int:
+    """
+    Create a DuckDB table from one or more DataFrames sharing the same columns.
+    Column types are inferred from the DataFrames, so numeric columns stay numeric.
+    Returns the number of rows written.
+    """
+    total_rows = 0
+    conn = get_duckdb_connection()
+    try:
+        for index, frame in enumerate(frames):
+            conn.register("incoming_frame", frame)
+            if index == 0:
+                conn.execute(f'CREATE TABLE "{table_name}" AS SELECT * FROM incoming_frame')
+            else:
+                conn.execute(f'INSERT INTO "{table_name}" BY NAME SELECT * FROM incoming_frame')
+            conn.unregister("incoming_frame")
+            total_rows += len(frame)
+    finally:
+        conn.close()
+    logger.info(f"[Analytics] Wrote {total_rows} rows into DuckDB table '{table_name}'")
+    return total_rows
+
+def table_exists(table_name: str) -> bool:
+    """Check whether a table exists in the analytics database."""
+    if duckdb is None or not ANALYTICS_DB_PATH.exists():
+        return False
+    conn = get_duckdb_connection()
+    try:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [table_name]
+        ).fetchone()
+        return bool(row and row[0])
+    finally:
+        conn.close()
+
+def drop_table(table_name: str):
+    """Drop a table from the analytics database if it exists."""
+    if duckdb is None or not ANALYTICS_DB_PATH.exists():
+        return
+    conn = get_duckdb_connection()
+    try:
+        conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    finally:
+        conn.close()
+    logger.info(f"[Analytics] Dropped DuckDB table '{table_name}'")
@@ -1,12 +1,27 @@
 import sqlite3
 import os
+import copy
+import functools
+import inspect
+import threading
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import re
 import csv
 import json
+import logging
 # Import DataSourceType to check the type of datasource being deleted
-from .models import DataSourceType # Ensure this is imported
+from .models import DataSourceType, StorageEngine, VectorIndexType, VectorQuantization # Ensure this is imported
+from . import analytics
+from .records import ProductRecord, SaleRecord, StockRecord
+from .pagination import decode_cursor, split_page
+from .timing import timed
+from .metrics import observe_sql, register_collector
+from .slow_query_log import record_sqlite_statement
+
+logger = logging.getLogger(__name__)
 
 # Database configuration - Updated for root directory structure
 DATABASE_DIR = Path(__file__).resolve().parent.parent / "data" # Adjusted for app/db.py
@@ -27,17 +42,231 @@ SHORT_DATE_FORMAT = "%Y-%m-%d"
 if 'UPLOAD_DIR' not in globals():
     UPLOAD_DIR = Path(__file__).resolve().parent.parent / "data" / "uploads"
 
+# ================== Metadata Cache ==================
+
+# Seconds a cached metadata read stays valid. Writes in this process invalidate the cache immediately;
+# the TTL bounds staleness when several worker processes share the database (0 disables caching).
+METADATA_CACHE_TTL_SECONDS = float(os.getenv("METADATA_CACHE_TTL_SECONDS", "30"))
+
+class _MetadataCache:
+    """
+    Versioned in-process cache for reads of the datasources, files and table_profiles tables.
+    Every write to those tables in this module calls invalidate(), which bumps the version and
+    drops all entries. A read only populates the cache if no write happened while it ran.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._entries: Dict[Tuple[Any, ...], Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Tuple[Any, ...]) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self._hits += 1
+                return True, copy.deepcopy(entry[1])
+            self._misses += 1
+            return False, None
+
+    def put(self, key: Tuple[Any, ...], value: Any, read_version: int):
+        with self._lock:
+            if self.ttl_seconds > 0 and read_version == self.version:
+                self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"version": self.version, "entries": len(self._entries), "hits": self._hits,
+                    "misses": self._misses, "ttl_seconds": self.ttl_seconds}
+
+_metadata_cache = _MetadataCache(METADATA_CACHE_TTL_SECONDS)
+
+class _Uncached:
+    """A metadata read's result that is returned to the caller but never cached (e.g. the fallback of an error path)."""
+    def __init__(self, value: Any):
+        self.value = value
+
+def _cached_metadata(func):
+    """
+    Serve an async metadata read from the metadata cache, keyed by function name and arguments
+    (bound to the signature, so positional, keyword and defaulted arguments share an entry).
+    Results wrapped in `_Uncached` are returned without being cached, so a transient error
+    does not make a datasource look missing for the cache TTL.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__name__, *bound.arguments.items())
+        found, value = _metadata_cache.get(key)
+        if found:
+            return value
+        read_version = _metadata_cache.version
+        value = await func(*bound.args, **bound.kwargs)
+        if isinstance(value, _Uncached):
+            return value.value
+        _metadata_cache.put(key, value, read_version)
+        return value
+    return wrapper
+
+def get_metadata_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and size of the metadata cache."""
+    return _metadata_cache.stats()
+
+def invalidate_metadata_cache():
+    """Drop all cached metadata (e.g. after modifying the database outside this module)."""
+    _metadata_cache.invalidate()
+
+class _InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor timing every statement for the SQLite metrics and the slow query log.
+    A statement returning rows is timed until its rows are read with fetchall()/fetchone()
+    (or the cursor is reused or closed), so slow scans are not hidden behind lazy fetching.
+    """
+
+    # [sql, parameters, elapsed seconds, explainable] of the statement whose rows are still being read
+    _statement = None
+
+    def _run(self, method, sql, parameters, explainable: bool):
+        self._finish_statement()
+        start = time.perf_counter()
+        try:
+            return method(self, sql, parameters) if parameters is not None else method(self, sql)
+        finally:
+            self._statement = [sql, parameters, time.perf_counter() - start, explainable]
+            if self.description is None:  # Nothing to fetch: the statement is complete
+                self._finish_statement()
+
+    def _fetch(self, method):
+        start = time.perf_counter()
+        try:
+            return method(self)
+        finally:
+            if self._statement is not None:
+                self._statement[2] += time.perf_counter() - start
+                self._finish_statement()
+
+    def _finish_statement(self):
+        statement, self._statement = self._statement, None
+        if statement is not None:
+            sql, parameters, elapsed, explainable = statement
+            observe_sql("app", sql, elapsed)
+            record_sqlite_statement("app", self.connection if explainable else None, sql, parameters, elapsed)
+
+    def execute(self, sql, parameters=()):
+        return self._run(sqlite3.Cursor.execute, sql, parameters, explainable=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Parameters are a batch (possibly a generator): neither logged nor explained
+        return self._run(lambda cursor, statement: sqlite3.Cursor.executemany(cursor, statement, seq_of_parameters),
+                         sql, None, explainable=False)
+
+    def executescript(self, sql_script):
+        return self._run(sqlite3.Cursor.executescript, sql_script, None, explainable=False)
+
+    def fetchall(self):
+        return self._fetch(sqlite3.Cursor.fetchall)
+
+    def fetchone(self):
+        return self._fetch(sqlite3.Cursor.fetchone)
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+class _InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including those behind conn.execute) are instrumented."""
+
+    def cursor(self, factory=_InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection's shortcuts create their cursor internally, bypassing cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def _collect_metrics():
+    """Scrape-time metrics: metadata cache counters and the processing status of uploaded files."""
+    stats = _metadata_cache.stats()
+    yield "metadata_cache_lookups", "counter", "Metadata cache lookups by result (hit, miss).", [
+        ({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])
+    ]
+    yield "metadata_cache_entries", "gauge", "Entries held in the metadata cache.", [({}, stats["entries"])]
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("SELECT processing_status, COUNT(*) FROM files GROUP BY processing_status").fetchall()
+    finally:
+        conn.close()
+    # pending + processing files are the ingestion backlog
+    yield "files", "gauge", "Uploaded files by processing status.", [({"status": row[0]}, row[1]) for row in rows]
+
+register_collector(_collect_metrics)
+
 def get_db_connection():
     """Get a database connection."""
     # Ensure the data directory exists when first connecting
     DATABASE_DIR.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(DATABASE_PATH, factory=_InstrumentedConnection)
     conn.row_factory = sqlite3.Row  # Enable column access by name
     return conn
 
+def _ensure_column(cursor, table_name: str, column_name: str, column_definition: str):
+    """Add a column to an existing table if it is missing (lightweight schema migration)."""
+    cursor.execute(f'PRAGMA table_info("{table_name}")')
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    if column_name not in existing_columns:
+        logger.info(f"[DB-SQLite] Adding column '{column_name}' to table '{table_name}'")
+        cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN {column_name} {column_definition}')
+
+def _ensure_chunk_fts_index(cursor):
+    """Create the FTS5 index over vector_chunks.content (external content table) and its sync triggers."""
+    try:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'vector_chunks_fts'")
+        is_new_index = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS vector_chunks_fts
+            USING fts5(content, content='vector_chunks', content_rowid='id')
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS vector_chunks_fts_insert AFTER INSERT ON vector_chunks BEGIN
+                INSERT INTO vector_chunks_fts (rowid, content) VALUES (new.id, new.content);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS vector_chunks_fts_delete AFTER DELETE ON vector_chunks BEGIN
+                INSERT INTO vector_chunks_fts (vector_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS vector_chunks_fts_update AFTER UPDATE OF content ON vector_chunks BEGIN
+                INSERT INTO vector_chunks_fts (vector_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO vector_chunks_fts (rowid, content) VALUES (new.id, new.content);
+            END
+        ''')
+        if is_new_index:
+            # Index chunks stored before the full-text index existed
+            cursor.execute("INSERT INTO vector_chunks_fts (vector_chunks_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"[DB-SQLite] Full-text search (FTS5) unavailable, keyword retrieval disabled: {e}")
+
 def initialize_database_schema():
     """Initialize the database schema with all necessary tables."""
-    print(f"[DB-SQLite] Initializing database schema at: {DATABASE_PATH}")
+    logger.info(f"[DB-SQLite] Initializing database schema at: {DATABASE_PATH}")
     
     conn = get_db_connection() # Ensures directory exists
     cursor = conn.cursor()
@@ -87,6 +316,9 @@ def initialize_database_schema():
                 is_active BOOLEAN NOT NULL DEFAULT 0,
                 file_count INTEGER NOT NULL DEFAULT 0,
                 db_table_name TEXT,
+                storage_engine TEXT NOT NULL DEFAULT 'sqlite',
+                vector_index_type TEXT NOT NULL DEFAULT 'flat',
+                vector_quantization TEXT NOT NULL DEFAULT 'float32',
                 created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
                 updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
             )
@@ -106,6 +338,8 @@ def initialize_database_schema():
                 error_message TEXT,
                 uploaded_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
                 processed_at DATETIME,
+                content_hash TEXT,
+                derived_table_name TEXT,
                 FOREIGN KEY (datasource_id) REFERENCES datasources (id) ON DELETE CASCADE
             )
         ''')
@@ -118,15 +352,60 @@ def initialize_database_schema():
                 chunk_index INTEGER NOT NULL,
                 content TEXT NOT NULL,
                 metadata TEXT,
+                embedding BLOB,
+                embedding_format TEXT,
                 created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
             )
         ''')
         
+        # Create full-text (BM25) index over chunk contents, kept in sync with vector_chunks by triggers
+        _ensure_chunk_fts_index(cursor)
+        
+        # Create NL-to-SQL translation cache for the SQL agent
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS nl_sql_cache (
+                normalized_question TEXT NOT NULL,
+                schema_hash TEXT NOT NULL,
+                sql_query TEXT NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                last_used_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (normalized_question, schema_hash)
+            )
+        ''')
+        
+        # Create column statistics table for tables built from uploaded files
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS table_profiles (
+                table_name TEXT PRIMARY KEY,
+                row_count INTEGER NOT NULL,
+                column_stats TEXT NOT NULL,
+                profiled_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Migrate databases created before content-addressed uploads were introduced
+        _ensure_column(cursor, "files", "content_hash", "TEXT")
+        _ensure_column(cursor, "files", "derived_table_name", "TEXT")
+        _ensure_column(cursor, "vector_chunks", "embedding", "BLOB")
+        _ensure_column(cursor, "datasources", "storage_engine", "TEXT NOT NULL DEFAULT 'sqlite'")
+        _ensure_column(cursor, "datasources", "vector_index_type", "TEXT NOT NULL DEFAULT 'flat'")
+        _ensure_column(cursor, "datasources", "vector_quantization", "TEXT NOT NULL DEFAULT 'float32'")
+        _ensure_column(cursor, "vector_chunks", "embedding_format", "TEXT")
+        
         # Create indexes for better performance
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_datasource_id ON files(datasource_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_derived_table_name ON files(derived_table_name)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_vector_chunks_file_id ON vector_chunks(file_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_datasources_is_active ON datasources(is_active)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_nl_sql_cache_last_used_at ON nl_sql_cache(last_used_at)')
+        # Keyset pagination: one index per listing, matching its sort order
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_datasource_uploaded ON files(datasource_id, uploaded_at, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_sale_date_id ON sales(sale_date, sale_id)')
+        # Covers the per-product aggregation of a time window (fetch_sales_summary_for_query)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_date_product_amounts ON sales(sale_date, product_id, quantity_sold, total_amount)')
         
         # Insert default ERP datasource if not exists
         cursor.execute('''
@@ -135,17 +414,18 @@ def initialize_database_schema():
         ''')
         
         conn.commit()
-        print("[DB-SQLite] Database schema initialized successfully")
+        _metadata_cache.invalidate()
+        logger.info("[DB-SQLite] Database schema initialized successfully")
         
     except Exception as e:
-        print(f"[DB-SQLite] Error initializing database schema: {e}")
+        logger.error(f"[DB-SQLite] Error initializing database schema: {e}")
         conn.rollback()
     finally:
         conn.close()
 
 def import_csv_data_to_db():
     """Import data from CSV files into SQLite database."""
-    print("[DB-SQLite] Starting CSV data import...")
+    logger.info("[DB-SQLite] Starting CSV data import...")
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -158,15 +438,15 @@ def import_csv_data_to_db():
         
         # Import products data
         if PRODUCTS_CSV.exists():
-            print(f"[DB-SQLite] Importing products from {PRODUCTS_CSV}")
+            logger.info(f"[DB-SQLite] Importing products from {PRODUCTS_CSV}")
             with open(PRODUCTS_CSV, 'r', encoding='utf-8-sig') as csvfile:  # utf-8-sig handles BOM
                 reader = csv.DictReader(csvfile)
                 product_count = 0
                 for row_num, row in enumerate(reader, 1):
                     try:
-                        # Debug: print first few rows
+                        # Debug: log first few rows
                         if row_num <= 3:
-                            print(f"[DEBUG] Row {row_num}: {dict(row)}")
+                            logger.debug("[DB-SQLite] Row %s: %s", row_num, row)
                         
                         # Clean up any extra None keys (CSV parsing artifacts)
                         clean_row = {k: v for k, v in row.items() if k is not None and v is not None}
@@ -174,7 +454,7 @@ def import_csv_data_to_db():
                         # Validate required fields
                         required_fields = ['product_id', 'product_name', 'category', 'unit_price']
                         if not all(field in clean_row for field in required_fields):
-                            print(f"[DB-SQLite] Missing required fields in product row {row_num}: {clean_row}")
+                            logger.warning(f"[DB-SQLite] Missing required fields in product row {row_num}: {clean_row}")
                             continue
                             
                         cursor.execute('''
@@ -184,13 +464,13 @@ def import_csv_data_to_db():
                               clean_row['category'], float(clean_row['unit_price'])))
                         product_count += 1
                     except (ValueError, KeyError) as e:
-                        print(f"[DB-SQLite] Error processing product row {row_num}: {e}. Data: {dict(row)}")
+                        logger.error(f"[DB-SQLite] Error processing product row {row_num}: {e}. Data: {dict(row)}")
                         continue
-            print(f"[DB-SQLite] Imported {product_count} products")
+            logger.info(f"[DB-SQLite] Imported {product_count} products")
         
         # Import inventory data
         if INVENTORY_CSV.exists():
-            print(f"[DB-SQLite] Importing inventory from {INVENTORY_CSV}")
+            logger.info(f"[DB-SQLite] Importing inventory from {INVENTORY_CSV}")
             with open(INVENTORY_CSV, 'r', encoding='utf-8-sig') as csvfile:
                 reader = csv.DictReader(csvfile)
                 inventory_count = 0
@@ -202,13 +482,13 @@ def import_csv_data_to_db():
                         ''', (row['product_id'], int(row['stock_level']), row['last_updated']))
                         inventory_count += 1
                     except (ValueError, KeyError) as e:
-                        print(f"[DB-SQLite] Error processing inventory row {row_num}: {e}. Data: {dict(row)}")
+                        logger.error(f"[DB-SQLite] Error processing inventory row {row_num}: {e}. Data: {dict(row)}")
                         continue
-            print(f"[DB-SQLite] Imported {inventory_count} inventory records")
+            logger.info(f"[DB-SQLite] Imported {inventory_count} inventory records")
         
         # Import sales data
         if SALES_CSV.exists():
-            print(f"[DB-SQLite] Importing sales from {SALES_CSV}")
+            logger.info(f"[DB-SQLite] Importing sales from {SALES_CSV}")
             with open(SALES_CSV, 'r', encoding='utf-8-sig') as csvfile:
                 reader = csv.DictReader(csvfile)
                 sales_count = 0
@@ -223,15 +503,15 @@ def import_csv_data_to_db():
                               float(row['total_amount']), row['sale_date']))
                         sales_count += 1
                     except (ValueError, KeyError) as e:
-                        print(f"[DB-SQLite] Error processing sales row {row_num}: {e}. Data: {dict(row)}")
+                        logger.error(f"[DB-SQLite] Error processing sales row {row_num}: {e}. Data: {dict(row)}")
                         continue
-            print(f"[DB-SQLite] Imported {sales_count} sales records")
+            logger.info(f"[DB-SQLite] Imported {sales_count} sales records")
         
         conn.commit()
-        print("[DB-SQLite] CSV data import completed successfully")
+        logger.info("[DB-SQLite] CSV data import completed successfully")
         
     except Exception as e:
-        print(f"[DB-SQLite] Error importing CSV data: {e}")
+        logger.error(f"[DB-SQLite] Error importing CSV data: {e}")
         conn.rollback()
     finally:
         conn.close()
@@ -255,18 +535,40 @@ def check_database_exists() -> bool:
         cursor.execute("SELECT COUNT(*) FROM sales")
         sales_count = cursor.fetchone()[0]
         
-        print(f"[DB-SQLite] Database contains: {products_count} products, {inventory_count} inventory records, {sales_count} sales records")
+        logger.info(f"[DB-SQLite] Database contains: {products_count} products, {inventory_count} inventory records, {sales_count} sales records")
         
         return products_count > 0 and inventory_count > 0 and sales_count > 0
         
     except Exception as e:
-        print(f"[DB-SQLite] Error checking database: {e}")
+        logger.error(f"[DB-SQLite] Error checking database: {e}")
         return False
     finally:
         conn.close()
 
 # ================== Data Source Management Functions ==================
 
+_DATASOURCE_COLUMNS = '''id, name, description, type, is_active, file_count,
+                   db_table_name, storage_engine, vector_index_type, vector_quantization,
+                   created_at, updated_at'''
+
+def _datasource_to_dict(row) -> Dict[str, Any]:
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'description': row['description'],
+        'type': row['type'],
+        'is_active': bool(row['is_active']),
+        'file_count': row['file_count'],
+        'db_table_name': row['db_table_name'],
+        'storage_engine': row['storage_engine'],
+        'vector_index_type': row['vector_index_type'],
+        'vector_quantization': row['vector_quantization'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at']
+    }
+
+@timed()
+@_cached_metadata
 async def get_datasources() -> List[Dict[str, Any]]:
     """Fetch a list of all data sources"""
     conn = get_db_connection()
@@ -275,34 +577,54 @@ async def get_datasources() -> List[Dict[str, Any]]:
     try:
         cursor.execute('''
             SELECT id, name, description, type, is_active, file_count, 
-                   db_table_name, created_at, updated_at 
+                   db_table_name, storage_engine, vector_index_type, vector_quantization,
+                   created_at, updated_at 
             FROM datasources 
             ORDER BY is_active DESC, created_at ASC
         ''')
         rows = cursor.fetchall()
         
-        datasources = []
-        for row in rows:
-            datasources.append({
-                'id': row['id'],
-                'name': row['name'],
-                'description': row['description'],
-                'type': row['type'],
-                'is_active': bool(row['is_active']),
-                'file_count': row['file_count'],
-                'db_table_name': row['db_table_name'],
-                'created_at': row['created_at'],
-                'updated_at': row['updated_at']
-            })
+        return [_datasource_to_dict(row) for row in rows]
         
-        return datasources
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error fetching datasources: {e}")
+        return _Uncached([])
+    finally:
+        conn.close()
+
+@timed()
+@_cached_metadata
+async def get_datasources_page(limit: int, page_cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of data sources (by id) and the cursor of the next page.
+    Pages are keyed on id alone: is_active changes whenever another datasource is activated, so a
+    key including it would skip or repeat rows between page fetches. The active datasource is
+    served by get_active_datasource.
+    Raises InvalidCursorError for a cursor not issued by this listing.
+    """
+    after = decode_cursor("datasources", page_cursor, 1) if page_cursor else None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(f'''
+            SELECT {_DATASOURCE_COLUMNS}
+            FROM datasources
+            WHERE id > ?
+            ORDER BY id ASC
+            LIMIT ?
+        ''', (after[0] if after else 0, limit + 1))
+        rows = [_datasource_to_dict(row) for row in cursor.fetchall()]
+        return split_page(rows, limit, "datasources", lambda ds: (ds['id'],))
         
     except Exception as e:
-        print(f"[DB-SQLite] Error fetching datasources: {e}")
-        return []
+        logger.error(f"[DB-SQLite] Error fetching datasources page: {e}")
+        return _Uncached(([], None))
     finally:
         conn.close()
 
+@timed()
+@_cached_metadata
 async def get_datasource(datasource_id: int) -> Optional[Dict[str, Any]]:
     """Fetch a specific data source"""
     conn = get_db_connection()
@@ -311,7 +633,8 @@ async def get_datasource(datasource_id: int) -> Optional[Dict[str, Any]]:
     try:
         cursor.execute('''
             SELECT id, name, description, type, is_active, file_count, 
-                   db_table_name, created_at, updated_at 
+                   db_table_name, storage_engine, vector_index_type, vector_quantization,
+                   created_at, updated_at 
             FROM datasources 
             WHERE id = ?
         ''', (datasource_id,))
@@ -326,18 +649,24 @@ async def get_datasource(datasource_id: int) -> Optional[Dict[str, Any]]:
                 'is_active': bool(row['is_active']),
                 'file_count': row['file_count'],
                 'db_table_name': row['db_table_name'],
+                'storage_engine': row['storage_engine'],
+                'vector_index_type': row['vector_index_type'],
+                'vector_quantization': row['vector_quantization'],
                 'created_at': row['created_at'],
                 'updated_at': row['updated_at']
             }
         return None
         
     except Exception as e:
-        print(f"[DB-SQLite] Error fetching datasource {datasource_id}: {e}")
-        return None
+        logger.error(f"[DB-SQLite] Error fetching datasource {datasource_id}: {e}")
+        return _Uncached(None)
     finally:
         conn.close()
 
-async def create_datasource(name: str, description: str = None, ds_type: str = "knowledge_base", db_table_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+async def create_datasource(name: str, description: str = None, ds_type: str = "knowledge_base", db_table_name: Optional[str] = None,
+                            storage_engine: str = StorageEngine.SQLITE.value,
+                            vector_index_type: str = VectorIndexType.FLAT.value,
+                            vector_quantization: str = VectorQuantization.FLOAT32.value) -> Optional[Dict[str, Any]]:
     """Create a new data source"""
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -346,20 +675,22 @@ async def create_datasource(name: str, description: str = None, ds_type: str = "
         # 对于 SQL_TABLE_FROM_FILE 类型，db_table_name 初始可以为 None，后续文件处理时填充
         # 但如果调用时提供了，就使用它
         cursor.execute('''
-            INSERT INTO datasources (name, description, type, db_table_name, is_active, file_count)
-            VALUES (?, ?, ?, ?, 0, 0)
-        ''', (name, description, ds_type, db_table_name))
+            INSERT INTO datasources (name, description, type, db_table_name, storage_engine,
+                                     vector_index_type, vector_quantization, is_active, file_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0)
+        ''', (name, description, ds_type, db_table_name, storage_engine, vector_index_type, vector_quantization))
         
         datasource_id = cursor.lastrowid
         conn.commit()
+        _metadata_cache.invalidate()
         
         return await get_datasource(datasource_id)
         
     except sqlite3.IntegrityError:
-        print(f"[DB-SQLite] Datasource with name '{name}' already exists")
+        logger.warning(f"[DB-SQLite] Datasource with name '{name}' already exists")
         return None
     except Exception as e:
-        print(f"[DB-SQLite] Error creating datasource: {e}")
+        logger.error(f"[DB-SQLite] Error creating datasource: {e}")
         conn.rollback()
         return None
     finally:
@@ -389,14 +720,15 @@ async def update_datasource(datasource_id: int, name: str = None, description: s
             query = f"UPDATE datasources SET {', '.join(updates)} WHERE id = ?"
             cursor.execute(query, params)
             conn.commit()
+            _metadata_cache.invalidate()
         
         return await get_datasource(datasource_id)
         
     except sqlite3.IntegrityError:
-        print(f"[DB-SQLite] Datasource name already exists")
+        logger.warning(f"[DB-SQLite] Datasource name already exists")
         return None
     except Exception as e:
-        print(f"[DB-SQLite] Error updating datasource: {e}")
+        logger.error(f"[DB-SQLite] Error updating datasource: {e}")
         conn.rollback()
         return None
     finally:
@@ -405,7 +737,7 @@ async def update_datasource(datasource_id: int, name: str = None, description: s
 async def delete_datasource(datasource_id: int) -> bool:
     """Delete a data source and clean up associated dynamic SQL tables (if applicable)"""
     if datasource_id == 1:  # Default data source cannot be deleted
-        print("[DB-SQLite] Cannot delete default datasource (ID: 1)")
+        logger.warning("[DB-SQLite] Cannot delete default datasource (ID: 1)")
         return False
     
     conn = get_db_connection()
@@ -413,45 +745,59 @@ async def delete_datasource(datasource_id: int) -> bool:
     
     try:
         # 首先获取数据源的详细信息，特别是 type 和 db_table_name
-        cursor.execute("SELECT type, db_table_name, is_active FROM datasources WHERE id = ?", (datasource_id,))
+        cursor.execute("SELECT type, db_table_name, storage_engine, is_active FROM datasources WHERE id = ?", (datasource_id,))
         ds_to_delete = cursor.fetchone()
         
         if not ds_to_delete:
-            print(f"[DB-SQLite] Datasource with ID {datasource_id} not found for deletion.")
+            logger.warning(f"[DB-SQLite] Datasource with ID {datasource_id} not found for deletion.")
             return False
         
         ds_type = ds_to_delete['type']
         db_table_name_to_drop = ds_to_delete['db_table_name']
         was_active = ds_to_delete['is_active']
         
-        # 如果是 SQL_TABLE_FROM_FILE 类型且有关联的表，则先删除该表
-        if ds_type == DataSourceType.SQL_TABLE_FROM_FILE.value and db_table_name_to_drop:
+        # 释放该数据源下的文件记录；内容相同的上传可能被其他数据源引用，只有最后一个引用才删除物理文件
+        cursor.execute("SELECT id, filename, content_hash FROM files WHERE datasource_id = ?", (datasource_id,))
+        files_to_release = cursor.fetchall()
+        physical_files_to_delete = []
+        for file_row in files_to_release:
+            unreferenced_path = _release_file_content(cursor, file_row['id'], file_row['filename'], file_row['content_hash'])
+            cursor.execute("DELETE FROM files WHERE id = ?", (file_row['id'],))
+            if unreferenced_path:
+                physical_files_to_delete.append(unreferenced_path)
+        
+        # 如果是 SQL_TABLE_FROM_FILE 类型且有关联的表，则先删除该表（被其他数据源复用的表保留）
+        if (ds_type == DataSourceType.SQL_TABLE_FROM_FILE.value and db_table_name_to_drop
+                and _is_table_shared(cursor, db_table_name_to_drop, datasource_id)):
+            logger.info(f"[DB-SQLite] Table '{db_table_name_to_drop}' is still referenced by another datasource, keeping it.")
+        elif ds_type == DataSourceType.SQL_TABLE_FROM_FILE.value and db_table_name_to_drop:
             try:
                 # 确保表名是安全的，尽管它来自数据库，但以防万一
                 # 通常SQLite表名如果包含特殊字符会被双引号包围，但这里我们直接使用
                 # DROP TABLE IF EXISTS "{table_name}" 语法是安全的
-                drop_table_sql = f'DROP TABLE IF EXISTS "{db_table_name_to_drop}"'
-                print(f"[DB-SQLite] Attempting to drop table: {drop_table_sql}")
-                cursor.execute(drop_table_sql)
-                print(f"[DB-SQLite] Successfully dropped table '{db_table_name_to_drop}' for datasource ID {datasource_id}.")
+                _drop_dynamic_table(cursor, db_table_name_to_drop, ds_to_delete['storage_engine'])
+                logger.info(f"[DB-SQLite] Successfully dropped table '{db_table_name_to_drop}' for datasource ID {datasource_id}.")
             except Exception as table_drop_error:
                 # 如果删表失败，记录错误但继续删除数据源记录（可能表已不存在或权限问题）
-                print(f"[DB-SQLite] Error dropping table '{db_table_name_to_drop}': {table_drop_error}. Proceeding with datasource record deletion.")
+                logger.error(f"[DB-SQLite] Error dropping table '{db_table_name_to_drop}': {table_drop_error}. Proceeding with datasource record deletion.")
 
         # 删除数据源记录（会级联删除相关文件和chunks）
         cursor.execute("DELETE FROM datasources WHERE id = ?", (datasource_id,))
-        print(f"[DB-SQLite] Deleted datasource record with ID {datasource_id}.")
+        logger.info(f"[DB-SQLite] Deleted datasource record with ID {datasource_id}.")
         
         # 如果删除的是激活数据源，激活默认数据源
         if was_active:
             cursor.execute("UPDATE datasources SET is_active = 1 WHERE id = 1")
-            print("[DB-SQLite] Reactivated default datasource (ID: 1) as the deleted one was active.")
+            logger.info("[DB-SQLite] Reactivated default datasource (ID: 1) as the deleted one was active.")
         
         conn.commit()
+        _metadata_cache.invalidate()
+        for physical_file_path in physical_files_to_delete:
+            _delete_physical_upload(physical_file_path)
         return True
         
     except Exception as e:
-        print(f"[DB-SQLite] Error deleting datasource ID {datasource_id}: {e}")
+        logger.error(f"[DB-SQLite] Error deleting datasource ID {datasource_id}: {e}")
         conn.rollback()
         return False
     finally:
@@ -475,15 +821,18 @@ async def set_active_datasource(datasource_id: int) -> bool:
         cursor.execute("UPDATE datasources SET is_active = 1 WHERE id = ?", (datasource_id,))
         
         conn.commit()
+        _metadata_cache.invalidate()
         return True
         
     except Exception as e:
-        print(f"[DB-SQLite] Error setting active datasource: {e}")
+        logger.error(f"[DB-SQLite] Error setting active datasource: {e}")
         conn.rollback()
         return False
     finally:
         conn.close()
 
+@timed()
+@_cached_metadata
 async def get_active_datasource() -> Optional[Dict[str, Any]]:
     """Fetch the currently active data source"""
     conn = get_db_connection()
@@ -492,7 +841,8 @@ async def get_active_datasource() -> Optional[Dict[str, Any]]:
     try:
         cursor.execute('''
             SELECT id, name, description, type, is_active, file_count, 
-                   db_table_name, created_at, updated_at 
+                   db_table_name, storage_engine, vector_index_type, vector_quantization,
+                   created_at, updated_at 
             FROM datasources 
             WHERE is_active = 1
             LIMIT 1
@@ -508,14 +858,17 @@ async def get_active_datasource() -> Optional[Dict[str, Any]]:
                 'is_active': bool(row['is_active']),
                 'file_count': row['file_count'],
                 'db_table_name': row['db_table_name'],
+                'storage_engine': row['storage_engine'],
+                'vector_index_type': row['vector_index_type'],
+                'vector_quantization': row['vector_quantization'],
                 'created_at': row['created_at'],
                 'updated_at': row['updated_at']
             }
         return None
         
     except Exception as e:
-        print(f"[DB-SQLite] Error fetching active datasource: {e}")
-        return None
+        logger.error(f"[DB-SQLite] Error fetching active datasource: {e}")
+        return _Uncached(None)
     finally:
         conn.close()
 
@@ -530,9 +883,10 @@ async def set_datasource_table_name(datasource_id: int, db_table_name: str) -> b
             WHERE id = ?
         ''', (db_table_name, datasource_id))
         conn.commit()
+        _metadata_cache.invalidate()
         return cursor.rowcount > 0 # True if a row was updated
     except Exception as e:
-        print(f"[DB-SQLite] Error setting db_table_name for datasource {datasource_id}: {e}")
+        logger.error(f"[DB-SQLite] Error setting db_table_name for datasource {datasource_id}: {e}")
         conn.rollback()
         return False
     finally:
@@ -540,8 +894,78 @@ async def set_datasource_table_name(datasource_id: int, db_table_name: str) -> b
 
 # ================== File Management Functions ==================
 
+_FILE_COLUMNS = '''id, filename, original_filename, file_type, file_size,
+                   datasource_id, processing_status, processed_chunks,
+                   error_message, uploaded_at, processed_at, content_hash'''
+
+def _file_to_dict(row) -> Dict[str, Any]:
+    return {
+        'id': row['id'],
+        'filename': row['filename'],
+        'original_filename': row['original_filename'],
+        'file_type': row['file_type'],
+        'file_size': row['file_size'],
+        'datasource_id': row['datasource_id'],
+        'processing_status': row['processing_status'],
+        'processed_chunks': row['processed_chunks'],
+        'error_message': row['error_message'],
+        'uploaded_at': row['uploaded_at'],
+        'processed_at': row['processed_at'],
+        'content_hash': row['content_hash']
+    }
+
+def _is_table_shared(cursor, table_name: str, datasource_id: int) -> bool:
+    """Check whether a dynamic SQL table is still referenced outside the given datasource."""
+    cursor.execute("SELECT COUNT(*) FROM datasources WHERE db_table_name = ? AND id != ?", (table_name, datasource_id))
+    if cursor.fetchone()[0] > 0:
+        return True
+    cursor.execute("SELECT COUNT(*) FROM files WHERE derived_table_name = ? AND datasource_id != ?", (table_name, datasource_id))
+    return cursor.fetchone()[0] > 0
+
+def _drop_dynamic_table(cursor, table_name: str, storage_engine: Optional[str]):
+    """Drop a table created from uploaded files, in whichever engine stores it."""
+    if storage_engine == StorageEngine.DUCKDB.value:
+        analytics.drop_table(table_name)
+    else:
+        cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    cursor.execute("DELETE FROM table_profiles WHERE table_name = ?", (table_name,))
+
+def _release_file_content(cursor, file_id: int, stored_filename: str, content_hash: Optional[str]) -> Optional[Path]:
+    """
+    Drop a file record's reference to its stored content and derived chunks.
+    Chunks are handed over to another record with the same content hash if one exists.
+    Returns the physical path to delete once the transaction commits, or None if it is still referenced.
+    """
+    other_reference = None
+    if content_hash:
+        cursor.execute("SELECT id FROM files WHERE content_hash = ? AND id != ? ORDER BY id LIMIT 1", (content_hash, file_id))
+        other_reference = cursor.fetchone()
+    
+    if other_reference:
+        cursor.execute("UPDATE vector_chunks SET file_id = ? WHERE file_id = ?", (other_reference['id'], file_id))
+        logger.info(f"[DB-SQLite] Handed chunks of file ID {file_id} over to file ID {other_reference['id']} (same content).")
+    else:
+        cursor.execute("DELETE FROM vector_chunks WHERE file_id = ?", (file_id,))
+    
+    cursor.execute("SELECT COUNT(*) FROM files WHERE filename = ? AND id != ?", (stored_filename, file_id))
+    if cursor.fetchone()[0] > 0:
+        logger.info(f"[DB-SQLite] Stored file '{stored_filename}' is still referenced, keeping it.")
+        return None
+    return UPLOAD_DIR / stored_filename
+
+def _delete_physical_upload(physical_file_path: Path):
+    """Delete a stored upload from disk, logging instead of raising on failure."""
+    if physical_file_path.exists():
+        try:
+            physical_file_path.unlink()
+            logger.info(f"[DB-SQLite] Successfully deleted physical file: {physical_file_path}")
+        except Exception as e_phys_delete:
+            logger.error(f"[DB-SQLite] Error deleting physical file {physical_file_path}: {e_phys_delete}")
+    else:
+        logger.warning(f"[DB-SQLite] Physical file not found, skipping deletion: {physical_file_path}")
+
 async def save_file_info(filename: str, original_filename: str, file_type: str, 
-                        file_size: int, datasource_id: int) -> Optional[int]:
+                        file_size: int, datasource_id: int, content_hash: Optional[str] = None) -> Optional[int]:
     """Save file information to the database"""
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -549,9 +973,9 @@ async def save_file_info(filename: str, original_filename: str, file_type: str,
     try:
         cursor.execute('''
             INSERT INTO files (filename, original_filename, file_type, file_size, 
-                              datasource_id, processing_status)
-            VALUES (?, ?, ?, ?, ?, 'pending')
-        ''', (filename, original_filename, file_type, file_size, datasource_id))
+                              datasource_id, processing_status, content_hash)
+            VALUES (?, ?, ?, ?, ?, 'pending', ?)
+        ''', (filename, original_filename, file_type, file_size, datasource_id, content_hash))
         
         file_id = cursor.lastrowid
         
@@ -563,15 +987,18 @@ async def save_file_info(filename: str, original_filename: str, file_type: str,
         ''', (datasource_id,))
         
         conn.commit()
+        _metadata_cache.invalidate()
         return file_id
         
     except Exception as e:
-        print(f"[DB-SQLite] Error saving file info: {e}")
+        logger.error(f"[DB-SQLite] Error saving file info: {e}")
         conn.rollback()
         return None
     finally:
         conn.close()
 
+@timed()
+@_cached_metadata
 async def get_files_by_datasource(datasource_id: int) -> List[Dict[str, Any]]:
     """Fetch all files for a specific data source"""
     conn = get_db_connection()
@@ -581,34 +1008,55 @@ async def get_files_by_datasource(datasource_id: int) -> List[Dict[str, Any]]:
         cursor.execute('''
             SELECT id, filename, original_filename, file_type, file_size, 
                    datasource_id, processing_status, processed_chunks, 
-                   error_message, uploaded_at, processed_at
+                   error_message, uploaded_at, processed_at, content_hash
             FROM files 
             WHERE datasource_id = ?
             ORDER BY uploaded_at DESC
         ''', (datasource_id,))
         rows = cursor.fetchall()
         
-        files = []
-        for row in rows:
-            files.append({
-                'id': row['id'],
-                'filename': row['filename'],
-                'original_filename': row['original_filename'],
-                'file_type': row['file_type'],
-                'file_size': row['file_size'],
-                'datasource_id': row['datasource_id'],
-                'processing_status': row['processing_status'],
-                'processed_chunks': row['processed_chunks'],
-                'error_message': row['error_message'],
-                'uploaded_at': row['uploaded_at'],
-                'processed_at': row['processed_at']
-            })
-        
-        return files
-        
-    except Exception as e:
-        print(f"[DB-SQLite] Error fetching files: {e}")
-        return []
+        return [_file_to_dict(row) for row in rows]
+        
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error fetching files: {e}")
+        return _Uncached([])
+    finally:
+        conn.close()
+
+@timed()
+@_cached_metadata
+async def get_files_page(datasource_id: int, limit: int, page_cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of a data source's files (newest first) and the cursor of the next page.
+    Raises InvalidCursorError for a cursor not issued by this listing.
+    """
+    after = decode_cursor("files", page_cursor, 2) if page_cursor else None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        if after:
+            cursor.execute(f'''
+                SELECT {_FILE_COLUMNS}
+                FROM files
+                WHERE datasource_id = ? AND (uploaded_at, id) < (?, ?)
+                ORDER BY uploaded_at DESC, id DESC
+                LIMIT ?
+            ''', (datasource_id, after[0], after[1], limit + 1))
+        else:
+            cursor.execute(f'''
+                SELECT {_FILE_COLUMNS}
+                FROM files
+                WHERE datasource_id = ?
+                ORDER BY uploaded_at DESC, id DESC
+                LIMIT ?
+            ''', (datasource_id, limit + 1))
+        rows = [_file_to_dict(row) for row in cursor.fetchall()]
+        return split_page(rows, limit, "files", lambda f: (f['uploaded_at'], f['id']))
+        
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error fetching files page: {e}")
+        return _Uncached(([], None))
     finally:
         conn.close()
 
@@ -638,11 +1086,12 @@ async def update_file_processing_status(file_id: int, status: str, chunks: int =
         query = f"UPDATE files SET {', '.join(updates)} WHERE id = ?"
         cursor.execute(query, params)
         conn.commit()
+        _metadata_cache.invalidate()
         
         return True
         
     except Exception as e:
-        print(f"[DB-SQLite] Error updating file status: {e}")
+        logger.error(f"[DB-SQLite] Error updating file status: {e}")
         conn.rollback()
         return False
     finally:
@@ -654,22 +1103,23 @@ async def delete_file_record_and_associated_data(file_id: int) -> bool:
     cursor = conn.cursor()
     
     try:
-        # 1. 获取文件信息 (filename, datasource_id)
-        cursor.execute("SELECT filename, datasource_id FROM files WHERE id = ?", (file_id,))
+        # 1. 获取文件信息 (filename, datasource_id, content_hash)
+        cursor.execute("SELECT filename, datasource_id, content_hash FROM files WHERE id = ?", (file_id,))
         file_info = cursor.fetchone()
         if not file_info:
-            print(f"[DB-SQLite] File with ID {file_id} not found. Cannot delete.")
+            logger.warning(f"[DB-SQLite] File with ID {file_id} not found. Cannot delete.")
             return False
         
         stored_filename = file_info['filename']
         datasource_id = file_info['datasource_id']
+        content_hash = file_info['content_hash']
 
         # 2. 获取数据源信息 (type, db_table_name, file_count)
-        cursor.execute("SELECT type, db_table_name, file_count FROM datasources WHERE id = ?", (datasource_id,))
+        cursor.execute("SELECT type, db_table_name, storage_engine, file_count FROM datasources WHERE id = ?", (datasource_id,))
         ds_info = cursor.fetchone()
         if not ds_info:
             # This case should ideally not happen if file_info was found due to foreign key, but good practice.
-            print(f"[DB-SQLite] Associated datasource ID {datasource_id} for file ID {file_id} not found. Inconsistent data?")
+            logger.warning(f"[DB-SQLite] Associated datasource ID {datasource_id} for file ID {file_id} not found. Inconsistent data?")
             # Proceed to delete file record and physical file, but log this anomaly.
             ds_type = None
             db_table_name_to_check = None
@@ -679,47 +1129,43 @@ async def delete_file_record_and_associated_data(file_id: int) -> bool:
             db_table_name_to_check = ds_info['db_table_name']
             current_file_count = ds_info['file_count']
 
-        # 3. 删除物理文件
-        physical_file_path = UPLOAD_DIR / stored_filename
-        if physical_file_path.exists():
-            try:
-                physical_file_path.unlink()
-                print(f"[DB-SQLite] Successfully deleted physical file: {physical_file_path}")
-            except Exception as e_phys_delete:
-                print(f"[DB-SQLite] Error deleting physical file {physical_file_path}: {e_phys_delete}. Continuing with DB record deletion.")
-        else:
-            print(f"[DB-SQLite] Physical file not found, skipping deletion: {physical_file_path}")
+        # 3. 释放内容引用 - 仅当没有其他文件记录引用相同内容时才删除物理文件和文本块
+        physical_file_path = _release_file_content(cursor, file_id, stored_filename, content_hash)
 
-        # 4. 删除文件数据库记录 (files table) - vector_chunks will be cascade deleted
+        # 4. 删除文件数据库记录 (files table)
         cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
         if cursor.rowcount == 0:
             # Should not happen if file_info was fetched successfully, means record was deleted by another process
-            print(f"[DB-SQLite] File record ID {file_id} was not found during deletion, possibly already deleted.")
+            logger.warning(f"[DB-SQLite] File record ID {file_id} was not found during deletion, possibly already deleted.")
             # If ds_info was fetched, we might still need to update its file_count if it wasn't already.
             # However, this state is ambiguous. For now, we'll assume if rowcount is 0, our job for this file is done.
             conn.rollback() # Rollback if no file record was deleted, as file_count update might be wrong
             return False # Indicate that the primary target (file record) wasn't deleted by this op.
 
-        print(f"[DB-SQLite] Successfully deleted file record ID {file_id} from 'files' table.")
+        logger.info(f"[DB-SQLite] Successfully deleted file record ID {file_id} from 'files' table.")
 
         # 5. 更新数据源的 file_count 及处理特定逻辑 (如 SQL_TABLE_FROM_FILE)
         if ds_info: # Only proceed if datasource info was successfully fetched
             new_file_count = max(0, current_file_count - 1)
             
             if ds_type == DataSourceType.SQL_TABLE_FROM_FILE.value:
-                if new_file_count == 0 and db_table_name_to_check:
+                if new_file_count == 0 and db_table_name_to_check and _is_table_shared(cursor, db_table_name_to_check, datasource_id):
+                    # The table was deduplicated and is reused by another datasource, only detach it here
+                    cursor.execute("UPDATE datasources SET file_count = ?, db_table_name = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?", 
+                                   (new_file_count, datasource_id))
+                    logger.info(f"[DB-SQLite] Table '{db_table_name_to_check}' is shared with another datasource. Detached from datasource ID {datasource_id} without dropping.")
+                elif new_file_count == 0 and db_table_name_to_check:
                     # This was the last file for this SQL table datasource, drop the table and clear db_table_name
                     try:
-                        drop_table_sql = f'DROP TABLE IF EXISTS "{db_table_name_to_check}"'
-                        print(f"[DB-SQLite] SQL_TABLE_FROM_FILE: Last file. Dropping table: {drop_table_sql}")
-                        cursor.execute(drop_table_sql)
-                        print(f"[DB-SQLite] Successfully dropped table '{db_table_name_to_check}'.")
+                        logger.info(f"[DB-SQLite] SQL_TABLE_FROM_FILE: Last file. Dropping table '{db_table_name_to_check}'")
+                        _drop_dynamic_table(cursor, db_table_name_to_check, ds_info['storage_engine'])
+                        logger.info(f"[DB-SQLite] Successfully dropped table '{db_table_name_to_check}'.")
                         # Clear db_table_name and update file_count
                         cursor.execute("UPDATE datasources SET file_count = ?, db_table_name = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?", 
                                        (new_file_count, datasource_id))
-                        print(f"[DB-SQLite] Datasource ID {datasource_id} updated: file_count={new_file_count}, db_table_name cleared.")
+                        logger.info(f"[DB-SQLite] Datasource ID {datasource_id} updated: file_count={new_file_count}, db_table_name cleared.")
                     except Exception as e_drop_sql_table:
-                        print(f"[DB-SQLite] Error dropping table '{db_table_name_to_check}': {e_drop_sql_table}. File count still updated.")
+                        logger.error(f"[DB-SQLite] Error dropping table '{db_table_name_to_check}': {e_drop_sql_table}. File count still updated.")
                         # Still update file_count even if table drop fails, but db_table_name remains (problematic state)
                         # Potentially log this as a critical issue for manual review
                         cursor.execute("UPDATE datasources SET file_count = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", 
@@ -729,18 +1175,323 @@ async def delete_file_record_and_associated_data(file_id: int) -> bool:
                     # Just update file_count
                     cursor.execute("UPDATE datasources SET file_count = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", 
                                    (new_file_count, datasource_id))
-                    print(f"[DB-SQLite] Datasource ID {datasource_id} (SQL_TABLE_FROM_FILE) updated: file_count={new_file_count}.")
+                    logger.info(f"[DB-SQLite] Datasource ID {datasource_id} (SQL_TABLE_FROM_FILE) updated: file_count={new_file_count}.")
             else:
                 # For other datasource types (default, knowledge_base, etc.)
                 cursor.execute("UPDATE datasources SET file_count = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", 
                                (new_file_count, datasource_id))
-                print(f"[DB-SQLite] Datasource ID {datasource_id} (Type: {ds_type}) updated: file_count={new_file_count}.")
+                logger.info(f"[DB-SQLite] Datasource ID {datasource_id} (Type: {ds_type}) updated: file_count={new_file_count}.")
         
         conn.commit()
+        _metadata_cache.invalidate()
+
+        # 6. 提交后删除不再被引用的物理文件
+        if physical_file_path:
+            _delete_physical_upload(physical_file_path)
         return True
 
     except Exception as e:
-        print(f"[DB-SQLite] Error deleting file ID {file_id} and associated data: {e}")
+        logger.error(f"[DB-SQLite] Error deleting file ID {file_id} and associated data: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+# ================== Content Deduplication Functions ==================
+
+async def set_file_derived_table(file_id: int, table_name: str) -> bool:
+    """Record the dynamic SQL table that was built from (or reused for) a file."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE files SET derived_table_name = ? WHERE id = ?", (table_name, file_id))
+        conn.commit()
+        _metadata_cache.invalidate()
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error setting derived table for file {file_id}: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+async def find_reusable_table(content_hash: str, exclude_file_id: int,
+                              storage_engine: str = StorageEngine.SQLITE.value) -> Optional[Dict[str, Any]]:
+    """Find an existing dynamic SQL table, stored in the same engine, built from identical file content."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT f.derived_table_name, f.processed_chunks
+            FROM files f
+            JOIN datasources d ON d.id = f.datasource_id
+            WHERE f.content_hash = ? AND f.id != ? AND f.processing_status = 'completed'
+              AND f.derived_table_name IS NOT NULL AND d.storage_engine = ?
+            ORDER BY f.id
+        ''', (content_hash, exclude_file_id, storage_engine))
+        for row in cursor.fetchall():
+            table_name = row['derived_table_name']
+            if storage_engine == StorageEngine.DUCKDB.value:
+                exists = analytics.table_exists(table_name)
+            else:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+                exists = cursor.fetchone() is not None
+            if exists:
+                return {'table_name': table_name, 'row_count': row['processed_chunks'] or 0}
+        return None
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error looking up reusable table for content {content_hash}: {e}")
+        return None
+    finally:
+        conn.close()
+
+async def get_chunk_count_for_content_hash(content_hash: str) -> int:
+    """Count stored RAG chunks already derived from identical file content."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT COUNT(*)
+            FROM vector_chunks vc
+            JOIN files f ON vc.file_id = f.id
+            WHERE f.content_hash = ?
+        ''', (content_hash,))
+        return cursor.fetchone()[0]
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error counting chunks for content {content_hash}: {e}")
+        return 0
+    finally:
+        conn.close()
+
+async def save_vector_chunks(file_id: int, chunks: List[Dict[str, Any]]) -> int:
+    """
+    Store text chunks (and optional embedding bytes) derived from a file.
+    Each chunk is a dict with 'content', optional 'metadata' (dict), optional 'embedding' (bytes)
+    and optional 'embedding_format' (quantization of the embedding bytes, float32 if omitted).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM vector_chunks WHERE file_id = ?", (file_id,))
+        cursor.executemany('''
+            INSERT INTO vector_chunks (file_id, chunk_index, content, metadata, embedding, embedding_format)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (file_id, index, chunk['content'], json.dumps(chunk.get('metadata') or {}), chunk.get('embedding'),
+             chunk.get('embedding_format') if chunk.get('embedding') is not None else None)
+            for index, chunk in enumerate(chunks)
+        ])
+        conn.commit()
+        return len(chunks)
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error saving chunks for file {file_id}: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _chunk_owner_conditions(files: List[Dict[str, Any]]) -> Tuple[List[str], List[Any]]:
+    """SQL conditions (on alias f = files) selecting the chunks that belong to the given file records."""
+    content_hashes = sorted({f['content_hash'] for f in files if f.get('content_hash')})
+    legacy_file_ids = [f['id'] for f in files if not f.get('content_hash')]
+    conditions = []
+    params: List[Any] = []
+    if content_hashes:
+        conditions.append(f"f.content_hash IN ({', '.join('?' for _ in content_hashes)})")
+        params.extend(content_hashes)
+    if legacy_file_ids:
+        conditions.append(f"f.id IN ({', '.join('?' for _ in legacy_file_ids)})")
+        params.extend(legacy_file_ids)
+    return conditions, params
+
+def build_fts_match_query(query: str) -> Optional[str]:
+    """
+    Turn a free-text question into an FTS5 MATCH expression: any of its terms (ranked by BM25),
+    plus exact phrases for code-like tokens such as part numbers or SKUs (e.g. "PN-4821-X").
+    """
+    terms = list(dict.fromkeys(re.findall(r"\w+", query.lower())))
+    if not terms:
+        return None
+    codes = re.findall(r"\w+(?:[-_./:]\w+)+", query.lower())
+    phrases = [" ".join(re.findall(r"\w+", code)) for code in dict.fromkeys(codes)]
+    return " OR ".join(f'"{term}"' for term in phrases + terms)
+
+def search_chunk_ids_by_keywords(query: str, files: List[Dict[str, Any]], limit: int = 20) -> List[int]:
+    """
+    BM25 keyword search over the chunks of the given file records.
+    Returns chunk ids, best match first. Synchronous: used by retrievers running in worker threads.
+    """
+    match_query = build_fts_match_query(query)
+    conditions, params = _chunk_owner_conditions(files)
+    if not match_query or not conditions:
+        return []
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            SELECT vc.id
+            FROM vector_chunks_fts
+            JOIN vector_chunks vc ON vc.id = vector_chunks_fts.rowid
+            JOIN files f ON vc.file_id = f.id
+            WHERE vector_chunks_fts MATCH ? AND ({' OR '.join(conditions)})
+            ORDER BY bm25(vector_chunks_fts)
+            LIMIT ?
+        ''', [match_query, *params, limit])
+        return [row['id'] for row in cursor.fetchall()]
+    except sqlite3.OperationalError as e:
+        logger.info(f"[DB-SQLite] Keyword search failed: {e}")
+        return []
+    finally:
+        conn.close()
+
+@timed()
+async def get_vector_chunks_for_files(files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fetch stored chunks for the given file records.
+    Chunks are shared between records with the same content hash, so they are looked up by hash.
+    """
+    conditions, params = _chunk_owner_conditions(files)
+    if not conditions:
+        return []
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            SELECT vc.id, vc.file_id, vc.chunk_index, vc.content, vc.metadata, vc.embedding, vc.embedding_format, f.content_hash
+            FROM vector_chunks vc
+            JOIN files f ON vc.file_id = f.id
+            WHERE {' OR '.join(conditions)}
+            ORDER BY vc.file_id, vc.chunk_index
+        ''', params)
+        return [
+            {
+                'id': row['id'],
+                'file_id': row['file_id'],
+                'chunk_index': row['chunk_index'],
+                'content': row['content'],
+                'metadata': json.loads(row['metadata']) if row['metadata'] else {},
+                'embedding': row['embedding'],
+                'embedding_format': row['embedding_format'],
+                'content_hash': row['content_hash']
+            }
+            for row in cursor.fetchall()
+        ]
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error fetching chunks: {e}")
+        return []
+    finally:
+        conn.close()
+
+async def save_table_profile(table_name: str, profile: Dict[str, Any]) -> bool:
+    """Store the column statistics computed for a table at ingestion time."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            INSERT OR REPLACE INTO table_profiles (table_name, row_count, column_stats, profiled_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (table_name, profile.get('row_count', 0), json.dumps(profile.get('columns', []))))
+        conn.commit()
+        _metadata_cache.invalidate()
+        return True
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error saving profile for table {table_name}: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+@timed()
+@_cached_metadata
+async def get_table_profile(table_name: str) -> Optional[Dict[str, Any]]:
+    """Get the stored column statistics of a table, or None if it was not profiled."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT table_name, row_count, column_stats, profiled_at FROM table_profiles WHERE table_name = ?",
+            (table_name,)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'table_name': row['table_name'],
+            'row_count': row['row_count'],
+            'columns': json.loads(row['column_stats']),
+            'profiled_at': row['profiled_at']
+        }
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error fetching profile for table {table_name}: {e}")
+        return _Uncached(None)
+    finally:
+        conn.close()
+
+@timed()
+async def get_cached_sql(normalized_question: str, schema_hash: str) -> Optional[str]:
+    """Look up the SQL previously validated for a question against a table schema, recording the hit."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT sql_query FROM nl_sql_cache WHERE normalized_question = ? AND schema_hash = ?",
+            (normalized_question, schema_hash)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
+        cursor.execute('''
+            UPDATE nl_sql_cache SET hit_count = hit_count + 1, last_used_at = CURRENT_TIMESTAMP
+            WHERE normalized_question = ? AND schema_hash = ?
+        ''', (normalized_question, schema_hash))
+        conn.commit()
+        return row['sql_query']
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error reading NL-to-SQL cache: {e}")
+        return None
+    finally:
+        conn.close()
+
+async def save_cached_sql(normalized_question: str, schema_hash: str, sql_query: str, max_entries: int = 1000) -> bool:
+    """Store validated SQL for a question/schema pair, evicting the least recently used entries beyond max_entries."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            INSERT INTO nl_sql_cache (normalized_question, schema_hash, sql_query)
+            VALUES (?, ?, ?)
+            ON CONFLICT(normalized_question, schema_hash)
+            DO UPDATE SET sql_query = excluded.sql_query, last_used_at = CURRENT_TIMESTAMP
+        ''', (normalized_question, schema_hash, sql_query))
+        cursor.execute('''
+            DELETE FROM nl_sql_cache WHERE rowid IN (
+                SELECT rowid FROM nl_sql_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (max_entries,))
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error saving NL-to-SQL cache entry: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+async def delete_cached_sql(normalized_question: str, schema_hash: str) -> bool:
+    """Remove a cached translation, e.g. when its SQL no longer executes."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM nl_sql_cache WHERE normalized_question = ? AND schema_hash = ?",
+            (normalized_question, schema_hash)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error deleting NL-to-SQL cache entry: {e}")
         conn.rollback()
         return False
     finally:
@@ -748,146 +1499,294 @@ async def delete_file_record_and_associated_data(file_id: int) -> bool:
 
 # ================== Original Data Query Functions ==================
 
-async def fetch_all_products() -> List[Dict[str, Any]]:
+@timed()
+async def fetch_all_products() -> List[ProductRecord]:
     """Fetches all products from the database."""
-    print("[DB-SQLite] Fetching all products")
+    logger.debug("[DB-SQLite] Fetching all products")
     
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.row_factory = ProductRecord.row_factory
     
     try:
-        cursor.execute("SELECT * FROM products ORDER BY product_id")
-        rows = cursor.fetchall()
+        cursor.execute("SELECT product_id, product_name, category, unit_price FROM products ORDER BY product_id")
+        return cursor.fetchall()
         
-        products = []
-        for row in rows:
-            products.append({
-                'product_id': row['product_id'],
-                'product_name': row['product_name'],
-                'category': row['category'],
-                'unit_price': row['unit_price']
-            })
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error fetching products: {e}")
+        return []
+    finally:
+        conn.close()
+
+@timed()
+async def fetch_products_page(limit: int, page_cursor: Optional[str] = None) -> Tuple[List[ProductRecord], Optional[str]]:
+    """
+    One page of products ordered by product_id and the cursor of the next page.
+    Raises InvalidCursorError for a cursor not issued by this listing.
+    """
+    after = decode_cursor("products", page_cursor, 1) if page_cursor else None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = ProductRecord.row_factory
+    
+    try:
+        cursor.execute('''
+            SELECT product_id, product_name, category, unit_price
+            FROM products
+            WHERE product_id > ?
+            ORDER BY product_id
+            LIMIT ?
+        ''', (after[0] if after else "", limit + 1))
+        return split_page(cursor.fetchall(), limit, "products", lambda product: (product.product_id,))
         
-        return products
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error fetching products page: {e}")
+        return [], None
+    finally:
+        conn.close()
+
+@timed()
+async def fetch_sales_page(limit: int, page_cursor: Optional[str] = None) -> Tuple[List[SaleRecord], Optional[str]]:
+    """
+    One page of sales (most recent first) and the cursor of the next page.
+    Raises InvalidCursorError for a cursor not issued by this listing.
+    """
+    after = decode_cursor("sales", page_cursor, 2) if page_cursor else None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = SaleRecord.row_factory
+    
+    try:
+        seek_filter = "WHERE (s.sale_date, s.sale_id) < (?, ?)" if after else ""
+        cursor.execute(f'''
+            SELECT s.sale_id, s.product_id, s.product_name, s.quantity_sold, s.price_per_unit,
+                   s.total_amount, s.sale_date, p.category
+            FROM sales s
+            LEFT JOIN products p ON s.product_id = p.product_id
+            {seek_filter}
+            ORDER BY s.sale_date DESC, s.sale_id DESC
+            LIMIT ?
+        ''', (*(after or ()), limit + 1))
+        return split_page(cursor.fetchall(), limit, "sales", lambda sale: (sale.sale_date, sale.sale_id))
         
     except Exception as e:
-        print(f"[DB-SQLite] Error fetching products: {e}")
-        return []
+        logger.error(f"[DB-SQLite] Error fetching sales page: {e}")
+        return [], None
     finally:
         conn.close()
 
-async def get_product_details(product_id: str) -> Optional[Dict[str, Any]]:
+@timed()
+async def get_product_details(product_id: str) -> Optional[ProductRecord]:
     """Fetches details for a specific product_id from the database."""
-    print(f"[DB-SQLite] Fetching product details for: {product_id}")
+    logger.debug("[DB-SQLite] Fetching product details for: %s", product_id)
     
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.row_factory = ProductRecord.row_factory
     
     try:
-        cursor.execute("SELECT * FROM products WHERE product_id = ?", (product_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            return {
-                'product_id': row['product_id'],
-                'product_name': row['product_name'],
-                'category': row['category'],
-                'unit_price': row['unit_price']
-            }
+        cursor.execute("SELECT product_id, product_name, category, unit_price FROM products WHERE product_id = ?", (product_id,))
+        return cursor.fetchone()
         
+    except Exception as e:
+        logger.error(f"[DB-SQLite] Error fetching product {product_id}: {e}")
         return None
+    finally:
+        conn.close()
+
+# Rows of the time window returned with a sales summary (the aggregates cover the whole window)
+SALES_SAMPLE_SIZE = int(os.getenv("SALES_SAMPLE_SIZE", "20"))
+# Products listed in the top-by-revenue / top-by-quantity rankings of a sales summary
+SALES_TOP_N = int(os.getenv("SALES_TOP_N", "5"))
+
+_SALES_PRODUCT_KEYWORDS = ['laptop', 'mouse', 'keyboard', 'monitor']
+_SALES_DAILY_KEYWORDS = ['daily', 'per day', 'by day', 'each day', 'trend']
+
+def _plan_sales_query(natural_language_query: str) -> Dict[str, Any]:
+    """
+    Interpret a sales question as SQL building blocks: the time window (as a range on the raw
+    sale_date column, so the sale_date index applies), an optional product/category filter,
+    and whether a per-day breakdown was asked for.
+    """
+    query_lower = natural_language_query.lower()
+    
+    # sale_date is 'YYYY-MM-DD HH:MM:SS', so comparing it with a 'YYYY-MM-DD' bound selects whole days
+    if 'today' in query_lower:
+        time_range, date_filter = "today", "s.sale_date >= DATE('now') AND s.sale_date < DATE('now', '+1 day')"
+    elif 'yesterday' in query_lower:
+        time_range, date_filter = "yesterday", "s.sale_date >= DATE('now', '-1 day') AND s.sale_date < DATE('now')"
+    elif 'this week' in query_lower:
+        time_range, date_filter = "this_week", "s.sale_date >= DATE('now', 'weekday 0', '-7 days')"
+    elif 'last week' in query_lower:
+        time_range, date_filter = "last_week", "s.sale_date >= DATE('now', 'weekday 0', '-14 days') AND s.sale_date < DATE('now', 'weekday 0', '-7 days')"
+    elif 'this month' in query_lower:
+        time_range, date_filter = "this_month", "s.sale_date >= DATE('now', 'start of month')"
+    elif 'last month' in query_lower:
+        time_range, date_filter = "last_month", "s.sale_date >= DATE('now', 'start of month', '-1 month') AND s.sale_date < DATE('now', 'start of month')"
+    elif any(term in query_lower for term in ['past 7 days', 'last 7 days']):
+        time_range, date_filter = "last_7_days", "s.sale_date >= DATE('now', '-7 days')"
+    else:
+        # 'past/last 30 days', and the default if no specific time range is mentioned
+        time_range, date_filter = "last_30_days", "s.sale_date >= DATE('now', '-30 days')"
+    
+    # Check for specific product or category filters
+    product_keyword = next((keyword for keyword in _SALES_PRODUCT_KEYWORDS if keyword in query_lower), None)
+    product_filter = None
+    if product_keyword:
+        # Resolved against the (small) products table, so the sales scan stays on the covering index
+        product_filter = (f"s.product_id IN (SELECT product_id FROM products "
+                          f"WHERE LOWER(product_name) LIKE '%{product_keyword}%' OR LOWER(category) LIKE '%{product_keyword}%')")
+    
+    return {
+        "time_range": time_range,
+        "product_keyword": product_keyword,
+        "where": f"{date_filter} AND {product_filter}" if product_filter else date_filter,
+        "group_by_day": any(term in query_lower for term in _SALES_DAILY_KEYWORDS),
+    }
+
+def _fetch_sales_rows(cursor, plan: Dict[str, Any], limit: Optional[int]) -> List[SaleRecord]:
+    """Sales of the plan's window, most recent first, at most `limit` rows (all if None)."""
+    cursor.row_factory = SaleRecord.row_factory
+    cursor.execute(f"""
+        SELECT s.sale_id, s.product_id, s.product_name, s.quantity_sold, s.price_per_unit,
+               s.total_amount, s.sale_date, p.category
+        FROM sales s
+        LEFT JOIN products p ON s.product_id = p.product_id
+        WHERE {plan['where']}
+        ORDER BY s.sale_date DESC, s.sale_id DESC
+        {'LIMIT ?' if limit is not None else ''}
+    """, (limit,) if limit is not None else ())
+    return cursor.fetchall()
+
+@timed()
+async def fetch_sales_data_for_query(natural_language_query: str, limit: Optional[int] = SALES_SAMPLE_SIZE) -> List[SaleRecord]:
+    """
+    Fetch the most recent sales matching a natural language query, at most `limit` rows
+    (pass None for every row of the window). Use fetch_sales_summary_for_query for totals.
+    """
+    logger.debug("[DB-SQLite] Processing sales query: %s", natural_language_query)
+    
+    conn = get_db_connection()
+    
+    try:
+        sales_data = _fetch_sales_rows(conn.cursor(), _plan_sales_query(natural_language_query), limit)
+        logger.debug("[DB-SQLite] Found %d sales records", len(sales_data))
+        return sales_data
         
     except Exception as e:
-        print(f"[DB-SQLite] Error fetching product {product_id}: {e}")
-        return None
+        logger.error(f"[DB-SQLite] Error fetching sales data: {e}")
+        return []
     finally:
         conn.close()
 
-async def fetch_sales_data_for_query(natural_language_query: str) -> List[Dict[str, Any]]:
-    """Fetch sales data based on natural language query interpretation."""
-    print(f"[DB-SQLite] Processing sales query: {natural_language_query}")
+@timed()
+async def fetch_sales_summary_for_query(natural_language_query: str) -> Dict[str, Any]:
+    """
+    Aggregate the sales matching a natural language query in SQL.
+
+    The time window is scanned once (on the covering sale_date index) into a per-product (or, for a
+    daily breakdown, per-day-and-product) temporary table; totals, top products and the per-category
+    and per-day breakdowns are computed from that small table.
+    Only the aggregates and a sample of the most recent SALES_SAMPLE_SIZE rows are returned:
+      {time_range, product_filter, summary_stats, top_products_by_revenue, top_products_by_quantity,
+       by_category, by_day (only if a daily breakdown was asked for), sample}
+    """
+    logger.debug("[DB-SQLite] Summarizing sales query: %s", natural_language_query)
+    plan = _plan_sales_query(natural_language_query)
+    summary = {
+        "time_range": plan["time_range"],
+        "product_filter": plan["product_keyword"],
+        "summary_stats": {"total_records": 0, "total_amount": 0.0, "total_quantity": 0, "average_order_value": 0.0,
+                          "first_sale": None, "last_sale": None},
+        "top_products_by_revenue": [],
+        "top_products_by_quantity": [],
+        "by_category": [],
+        "sample": [],
+    }
     
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        # Parse the query to determine time range and other filters
-        query_lower = natural_language_query.lower()
-        
-        # Determine date range
-        if 'today' in query_lower:
-            date_filter = "DATE(sale_date) = DATE('now')"
-        elif 'yesterday' in query_lower:
-            date_filter = "DATE(sale_date) = DATE('now', '-1 day')"
-        elif 'this week' in query_lower:
-            date_filter = "DATE(sale_date) >= DATE('now', 'weekday 0', '-7 days')"
-        elif 'last week' in query_lower:
-            date_filter = "DATE(sale_date) >= DATE('now', 'weekday 0', '-14 days') AND DATE(sale_date) < DATE('now', 'weekday 0', '-7 days')"
-        elif 'this month' in query_lower:
-            date_filter = "DATE(sale_date) >= DATE('now', 'start of month')"
-        elif 'last month' in query_lower:
-            date_filter = "DATE(sale_date) >= DATE('now', 'start of month', '-1 month') AND DATE(sale_date) < DATE('now', 'start of month')"
-        elif any(term in query_lower for term in ['past 7 days', 'last 7 days']):
-            date_filter = "DATE(sale_date) >= DATE('now', '-7 days')"
-        elif any(term in query_lower for term in ['past 30 days', 'last 30 days']):
-            date_filter = "DATE(sale_date) >= DATE('now', '-30 days')"
-        else:
-            # Default to last 30 days if no specific time range is mentioned
-            date_filter = "DATE(sale_date) >= DATE('now', '-30 days')"
-        
-        # Base query
-        base_query = f"""
-            SELECT s.*, p.category 
+        # A daily breakdown scans at (day, product) grain and derives the per-product table from it
+        scan_table, day_column = ("sales_by_day_product", "SUBSTR(s.sale_date, 1, 10) AS day, ") if plan["group_by_day"] else ("sales_by_product", "")
+        cursor.execute(f"""
+            CREATE TEMP TABLE {scan_table} AS
+            SELECT {day_column}s.product_id, COUNT(*) AS sales_count, SUM(s.quantity_sold) AS total_quantity,
+                   SUM(s.total_amount) AS total_revenue, MIN(s.sale_date) AS first_sale, MAX(s.sale_date) AS last_sale
             FROM sales s
-            LEFT JOIN products p ON s.product_id = p.product_id
-            WHERE {date_filter}
-        """
-        
-        # Check for specific product or category filters
-        if any(term in query_lower for term in ['laptop', 'laptop pro']):
-            base_query += " AND (LOWER(s.product_name) LIKE '%laptop%' OR LOWER(p.category) LIKE '%laptop%')"
-        elif 'mouse' in query_lower:
-            base_query += " AND (LOWER(s.product_name) LIKE '%mouse%' OR LOWER(p.category) LIKE '%mouse%')"
-        elif 'keyboard' in query_lower:
-            base_query += " AND (LOWER(s.product_name) LIKE '%keyboard%' OR LOWER(p.category) LIKE '%keyboard%')"
-        elif 'monitor' in query_lower:
-            base_query += " AND (LOWER(s.product_name) LIKE '%monitor%' OR LOWER(p.category) LIKE '%monitor%')"
-        
-        # Add ordering
-        base_query += " ORDER BY s.sale_date DESC"
-        
-        print(f"[DB-SQLite] Executing query: {base_query}")
-        cursor.execute(base_query)
-        rows = cursor.fetchall()
+            WHERE {plan['where']}
+            GROUP BY {'day, ' if day_column else ''}s.product_id
+        """)
+        if plan["group_by_day"]:
+            cursor.execute('''
+                CREATE TEMP TABLE sales_by_product AS
+                SELECT product_id, SUM(sales_count) AS sales_count, SUM(total_quantity) AS total_quantity,
+                       SUM(total_revenue) AS total_revenue, MIN(first_sale) AS first_sale, MAX(last_sale) AS last_sale
+                FROM sales_by_day_product
+                GROUP BY product_id
+            ''')
         
-        sales_data = []
-        for row in rows:
-            sales_data.append({
-                'sale_id': row['sale_id'],
-                'product_id': row['product_id'],
-                'product_name': row['product_name'],
-                'quantity_sold': row['quantity_sold'],
-                'price_per_unit': row['price_per_unit'],
-                'total_amount': row['total_amount'],
-                'sale_date': row['sale_date'],
-                'category': dict(row).get('category', 'Unknown')
-            })
-        
-        print(f"[DB-SQLite] Found {len(sales_data)} sales records")
-        return sales_data
+        cursor.execute('''
+            SELECT COALESCE(SUM(sales_count), 0) AS total_records, COALESCE(ROUND(SUM(total_revenue), 2), 0) AS total_amount,
+                   COALESCE(SUM(total_quantity), 0) AS total_quantity, MIN(first_sale) AS first_sale, MAX(last_sale) AS last_sale
+            FROM sales_by_product
+        ''')
+        totals = dict(cursor.fetchone())
+        if not totals['total_records']:
+            return summary
+        totals['average_order_value'] = round(totals['total_amount'] / totals['total_records'], 2)
+        summary["summary_stats"] = totals
+        
+        for ranking, order_column in (("top_products_by_revenue", "total_revenue"), ("top_products_by_quantity", "total_quantity")):
+            cursor.execute(f'''
+                SELECT t.product_id, COALESCE(p.product_name, t.product_id) AS product_name, p.category,
+                       t.sales_count, t.total_quantity, ROUND(t.total_revenue, 2) AS total_revenue
+                FROM sales_by_product t
+                LEFT JOIN products p ON t.product_id = p.product_id
+                ORDER BY t.{order_column} DESC, t.product_id
+                LIMIT ?
+            ''', (SALES_TOP_N,))
+            summary[ranking] = [dict(row) for row in cursor.fetchall()]
+        
+        cursor.execute('''
+            SELECT p.category, SUM(t.sales_count) AS sales_count, SUM(t.total_quantity) AS total_quantity,
+                   ROUND(SUM(t.total_revenue), 2) AS total_revenue
+            FROM sales_by_product t
+            LEFT JOIN products p ON t.product_id = p.product_id
+            GROUP BY p.category
+            ORDER BY total_revenue DESC
+        ''')
+        summary["by_category"] = [dict(row) for row in cursor.fetchall()]
+        
+        if plan["group_by_day"]:
+            cursor.execute('''
+                SELECT day, SUM(sales_count) AS sales_count, SUM(total_quantity) AS total_quantity,
+                       ROUND(SUM(total_revenue), 2) AS total_revenue
+                FROM sales_by_day_product
+                GROUP BY day
+                ORDER BY day
+            ''')
+            summary["by_day"] = [dict(row) for row in cursor.fetchall()]
+        
+        summary["sample"] = _fetch_sales_rows(conn.cursor(), plan, SALES_SAMPLE_SIZE)
+        logger.debug("[DB-SQLite] Summarized %d sales records", totals['total_records'])
+        return summary
         
     except Exception as e:
-        print(f"[DB-SQLite] Error fetching sales data: {e}")
-        return []
+        logger.error(f"[DB-SQLite] Error summarizing sales data: {e}")
+        return summary
     finally:
         conn.close()
 
-async def fetch_low_stock_products(threshold: int = 50) -> List[Dict[str, Any]]:
+@timed()
+async def fetch_low_stock_products(threshold: int = 50) -> List[StockRecord]:
     """Fetch products with stock levels below the specified threshold."""
-    print(f"[DB-SQLite] Fetching products with stock below {threshold}")
+    logger.debug("[DB-SQLite] Fetching products with stock below %s", threshold)
     
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.row_factory = StockRecord.row_factory
     
     try:
         cursor.execute('''
@@ -899,81 +1798,62 @@ async def fetch_low_stock_products(threshold: int = 50) -> List[Dict[str, Any]]:
             ORDER BY i.stock_level ASC
         ''', (threshold,))
         
-        rows = cursor.fetchall()
+        low_stock_products = cursor.fetchall()
         
-        low_stock_products = []
-        for row in rows:
-            low_stock_products.append({
-                'product_id': row['product_id'], 
-                'product_name': row['product_name'],
-                'category': row['category'],
-                'unit_price': row['unit_price'],
-                'stock_level': row['stock_level'],
-                'last_updated': row['last_updated']
-            })
-        
-        print(f"[DB-SQLite] Found {len(low_stock_products)} low stock products")
+        logger.debug("[DB-SQLite] Found %d low stock products", len(low_stock_products))
         return low_stock_products
         
     except Exception as e:
-        print(f"[DB-SQLite] Error fetching low stock products: {e}")
+        logger.error(f"[DB-SQLite] Error fetching low stock products: {e}")
         return []
     finally:
         conn.close()
 
-async def fetch_sales_for_day(target_date: datetime) -> List[Dict[str, Any]]:
+@timed()
+async def fetch_sales_for_day(target_date: datetime) -> List[SaleRecord]:
     """Fetch sales data for a specific day."""
     date_str = target_date.strftime(SHORT_DATE_FORMAT)
-    print(f"[DB-SQLite] Fetching sales for {date_str}")
+    next_date_str = (target_date + timedelta(days=1)).strftime(SHORT_DATE_FORMAT)
+    logger.debug("[DB-SQLite] Fetching sales for %s", date_str)
     
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.row_factory = SaleRecord.row_factory
     
     try:
+        # A half-open range on the raw column (as in _plan_sales_query), so the sale_date index applies
         cursor.execute('''
-            SELECT s.*, p.category 
+            SELECT s.sale_id, s.product_id, s.product_name, s.quantity_sold, s.price_per_unit,
+                   s.total_amount, s.sale_date, p.category
             FROM sales s
             LEFT JOIN products p ON s.product_id = p.product_id
-            WHERE DATE(s.sale_date) = ?
+            WHERE s.sale_date >= ? AND s.sale_date < ?
             ORDER BY s.sale_date DESC
-        ''', (date_str,))
+        ''', (date_str, next_date_str))
         
-        rows = cursor.fetchall()
+        sales_data = cursor.fetchall()
         
-        sales_data = []
-        for row in rows:
-            sales_data.append({
-                'sale_id': row['sale_id'], 
-                'product_id': row['product_id'],
-                'product_name': row['product_name'], 
-                'quantity_sold': row['quantity_sold'], 
-                'price_per_unit': row['price_per_unit'], 
-                'total_amount': row['total_amount'],
-                'sale_date': row['sale_date'],
-                'category': row.get('category', 'Unknown')
-            })
-        
-        print(f"[DB-SQLite] Found {len(sales_data)} sales for {date_str}")
+        logger.debug("[DB-SQLite] Found %d sales for %s", len(sales_data), date_str)
         return sales_data
         
     except Exception as e:
-        print(f"[DB-SQLite] Error fetching sales for {date_str}: {e}")
+        logger.error(f"[DB-SQLite] Error fetching sales for {date_str}: {e}")
         return []
     finally:
         conn.close()
 
 def initialize_database():
     """Initialize the application database (schema and initial data)."""
-    print("[DB-SQLite] Initializing application database (schema and initial data)...")
+    logger.info("[DB-SQLite] Initializing application database (schema and initial data)...")
     
     # Initialize schema
     initialize_database_schema()
     
     # Check if data exists
     if not check_database_exists():
-        print("[DB-SQLite] No data found, importing from CSV files...")
+        logger.info("[DB-SQLite] No data found, importing from CSV files...")
         import_csv_data_to_db()
     else:
-        print("[DB-SQLite] Database already contains data")
+        logger.info("[DB-SQLite] Database already contains data")
     
-    print("[DB-SQLite] Application database initialization complete") 
\ No newline at end of file
+    logger.info("[DB-SQLite] Application database initialization complete")
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Federated querying across several datasources.
+
+A federated query sends the same question to a set of datasources (the default
+ERP, knowledge bases, SQL tables) concurrently, each bounded by its own timeout,
+and merges the per-source answers. Total latency is that of the slowest source
+(capped by the timeout) rather than the sum of all sources.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from . import agent
+from .db import get_datasource, get_datasources
+from .models import DataSourceType
+from .utils import parse_query_intent
+
+logger = logging.getLogger(__name__)
+
+FEDERATED_SOURCE_TIMEOUT_SECONDS = float(os.getenv("FEDERATED_SOURCE_TIMEOUT_SECONDS", "30"))
+# Upper bound on datasources queried by one federated query
+FEDERATED_MAX_SOURCES = int(os.getenv("FEDERATED_MAX_SOURCES", "10"))
+
+def _query_type_for(datasource: Dict[str, Any], intent: Dict[str, Any]) -> str:
+    """Agent route for a datasource, mirroring the single-datasource routing of /api/v1/query."""
+    if datasource['type'] == DataSourceType.SQL_TABLE_FROM_FILE.value:
+        return "sql_agent"
+    if datasource['type'] != DataSourceType.DEFAULT.value:
+        return "rag"
+    return intent['type'] if intent['type'] in ("sales", "inventory", "report") else "sales"
+
+async def resolve_federated_datasources(datasource_ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+    """
+    Datasources targeted by a federated query: the requested ids (in order, duplicates removed),
+    or every datasource when none are given. Unknown ids are returned as {'id': ..., 'missing': True}.
+    """
+    if not datasource_ids:
+        return (await get_datasources())[:FEDERATED_MAX_SOURCES]
+    datasources = []
+    for datasource_id in list(dict.fromkeys(datasource_ids))[:FEDERATED_MAX_SOURCES]:
+        datasource = await get_datasource(datasource_id)
+        datasources.append(datasource or {'id': datasource_id, 'missing': True})
+    return datasources
+
+async def _query_source(query: str, datasource: Dict[str, Any], intent: Dict[str, Any], timeout_seconds: float) -> Dict[str, Any]:
+    """Answer the query from one datasource within the timeout. Never raises."""
+    source = {
+        "datasource_id": datasource['id'],
+        "datasource_name": datasource.get('name'),
+        "datasource_type": datasource.get('type'),
+    }
+    if datasource.get('missing'):
+        return {**source, "status": "error", "error": f"Data source {datasource['id']} not found", "elapsed_ms": 0.0}
+
+    query_type = _query_type_for(datasource, intent)
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(agent.get_answer_from_erp(query, query_type, active_datasource=datasource), timeout_seconds)
+        status = "ok" if result.get("success", True) else "error"
+        return {
+            **source,
+            "status": status,
+            "query_type": result.get("query_type", query_type),
+            "answer": result.get("answer"),
+            "data": result.get("data"),
+            "error": result.get("error"),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+    except asyncio.TimeoutError:
+        logger.warning(f"[Federation] Datasource {datasource['id']} ({datasource.get('name')}) timed out after {timeout_seconds}s")
+        return {**source, "status": "timeout", "query_type": query_type,
+                "error": f"No answer within {timeout_seconds:g}s", "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+    except Exception as e:
+        logger.error(f"[Federation] Datasource {datasource['id']} ({datasource.get('name')}) failed: {e}", exc_info=True)
+        return {**source, "status": "error", "query_type": query_type, "error": str(e),
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+def _merge_answers(sources: List[Dict[str, Any]]) -> str:
+    """Combine per-source answers into one text, one section per answering datasource."""
+    answered = [source for source in sources if source["status"] == "ok" and source.get("answer")]
+    if not answered:
+        return "None of the selected data sources could answer this question."
+    if len(answered) == 1:
+        return answered[0]["answer"]
+    return "\n\n".join(f"[{source['datasource_name']}] {source['answer']}" for source in answered)
+
+async def federated_query(query: str, datasources: List[Dict[str, Any]],
+                          timeout_seconds: float = FEDERATED_SOURCE_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """Fan the query out to all datasources concurrently and merge their answers."""
+    intent = parse_query_intent(query)
+    logger.info(f"[Federation] Querying {len(datasources)} datasources concurrently (timeout {timeout_seconds}s): '{query}'")
+    start = time.perf_counter()
+    sources = await asyncio.gather(*(_query_source(query, datasource, intent, timeout_seconds) for datasource in datasources))
+    total_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    return {
+        "query": query,
+        "query_type": "federated",
+        "intent": intent,
+        "answer": _merge_answers(sources),
+        "data": {
+            "sources": sources,
+            "answered": sum(1 for source in sources if source["status"] == "ok"),
+            "timed_out": sum(1 for source in sources if source["status"] == "timeout"),
+            "failed": sum(1 for source in sources if source["status"] == "error"),
+            "total_ms": total_ms,
+            # Sequential execution would have taken roughly the sum of the per-source times
+            "sum_source_ms": round(sum(source["elapsed_ms"] for source in sources), 1),
+        },
+    }
@@ -1,14 +1,220 @@
 import asyncio
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import List, Dict, Optional, Tuple, Union
 import pandas as pd
+import numpy as np
 import re # For sanitizing column names
 import uuid # For unique table name suffix
-from .db import update_file_processing_status, get_datasource, set_datasource_table_name, get_db_connection # Assuming get_db_connection might be needed for other ops
-from .models import ProcessingStatus, DataSourceType, FileType # Ensure enums are available
+import PyPDF2
+from docx import Document as DocxDocument
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from .db import (
+    update_file_processing_status, get_datasource, set_datasource_table_name, get_db_connection, # Assuming get_db_connection might be needed for other ops
+    set_file_derived_table, find_reusable_table, get_chunk_count_for_content_hash, save_vector_chunks,
+    save_table_profile
+)
+from .models import ProcessingStatus, DataSourceType, FileType, StorageEngine, VectorQuantization # Ensure enums are available
+from . import analytics
+from .table_profiler import profile_frames, duckdb_storage_types
+from .vector_index import encode_vectors
+from .metrics import FILE_PROCESSING_DURATION, INGEST_IN_PROGRESS, track_embedding
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Chunking parameters for knowledge base ingestion (compare settings with benchmarks/bench_rag_retrieval.py).
+# They apply to files ingested afterwards; stored chunks are not re-split.
+RAG_CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "1000"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+
+# Worker processes used to parse workbook sheets concurrently (1 disables the pool)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Column added to the SQL table when several sheets are unioned into it
+SHEET_COLUMN_NAME = "source_sheet"
+
+_sheet_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_sheet_executor() -> ProcessPoolExecutor:
+    """Lazily create the process pool used for sheet parsing."""
+    global _sheet_executor
+    if _sheet_executor is None:
+        # spawn avoids forking a multi-threaded server process
+        _sheet_executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"[FileProcessor] Started sheet parsing pool with {INGEST_WORKERS} workers")
+    return _sheet_executor
+
+def shutdown_ingest_workers():
+    """Shut down the sheet parsing pool (called on application shutdown)."""
+    global _sheet_executor
+    if _sheet_executor is not None:
+        _sheet_executor.shutdown(wait=False, cancel_futures=True)
+        _sheet_executor = None
+
+# ================== Workbook Parsing Helpers ==================
+# These run inside worker processes, so they must stay top-level and picklable.
+
+def _dataframe_to_text(df: pd.DataFrame) -> str:
+    """Render each row as 'column: value, ...' lines, building the strings column-wise."""
+    if df.empty:
+        return ""
+    row_texts = None
+    for col in df.columns:
+        column_text = f"{col}: " + df[col].astype(str)
+        row_texts = column_text if row_texts is None else row_texts + ", " + column_text
+    return "\n".join(row_texts.tolist())
+
+def _parse_excel_sheet(source: Union[str, pd.ExcelFile], sheet_name: str) -> pd.DataFrame:
+    """
+    Parse a single sheet, converting datetimes to text so rows can be bound as SQLite parameters.
+    `source` is a path in worker processes; in-process callers pass the already opened workbook, since
+    every open re-reads its shared strings (about 0.1s per sheet for a workbook with 150k distinct strings).
+    """
+    df = pd.read_excel(source, sheet_name=sheet_name)
+    for col in df.select_dtypes(include=["datetime", "datetimetz"]).columns:
+        df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df
+
+def _excel_sheet_to_text(source: Union[str, pd.ExcelFile], sheet_name: str) -> str:
+    df = pd.read_excel(source, sheet_name=sheet_name)
+    return f"Sheet: {sheet_name}\n" + _dataframe_to_text(df)
+
+async def parse_excel_sheets(file_path: Path) -> List[Tuple[str, pd.DataFrame]]:
+    """Parse every sheet of a workbook, fanning sheets out to worker processes when there are several."""
+    with pd.ExcelFile(file_path) as workbook:
+        sheet_names = workbook.sheet_names
+        if len(sheet_names) <= 1 or INGEST_WORKERS <= 1:
+            return [(name, await asyncio.to_thread(_parse_excel_sheet, workbook, name)) for name in sheet_names]
+
+    loop = asyncio.get_running_loop()
+    executor = _get_sheet_executor()
+    logger.info(f"[FileProcessor] Parsing {len(sheet_names)} sheets of {file_path.name} in parallel")
+    frames = await asyncio.gather(*[
+        loop.run_in_executor(executor, _parse_excel_sheet, str(file_path), name) for name in sheet_names
+    ])
+    return list(zip(sheet_names, frames))
+
+# ================== Text Extraction Helpers ==================
+
+def extract_text_from_pdf(file_path: Path) -> str:
+    logger.info(f"Extracting text from PDF: {file_path}")
+    text = ""
+    try:
+        with open(file_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            for page_num in range(len(reader.pages)):
+                page = reader.pages[page_num]
+                text += page.extract_text() or ""
+        logger.info(f"Successfully extracted {len(text)} characters from PDF: {file_path}")
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF {file_path}: {e}", exc_info=True)
+    return text
+
+def extract_text_from_docx(file_path: Path) -> str:
+    logger.info(f"Extracting text from DOCX: {file_path}")
+    text = ""
+    try:
+        doc = DocxDocument(file_path)
+        for para in doc.paragraphs:
+            text += para.text + "\n"
+        logger.info(f"Successfully extracted {len(text)} characters from DOCX: {file_path}")
+    except Exception as e:
+        logger.error(f"Error extracting text from DOCX {file_path}: {e}", exc_info=True)
+    return text
+
+def extract_text_from_csv(file_path: Path) -> str:
+    logger.info(f"Extracting text from CSV using pandas: {file_path}")
+    text = ""
+    try:
+        df = pd.read_csv(file_path, on_bad_lines='skip')
+        # Each original row becomes a line in the text document, with column names for context.
+        # For example: "column1: value1, column2: value2, ..."
+        text = _dataframe_to_text(df)
+        logger.info(f"Successfully extracted text from CSV {file_path}. Total characters: {len(text)}")
+    except Exception as e:
+        logger.error(f"Error extracting text from CSV {file_path} with pandas: {e}", exc_info=True)
+    return text
+
+def extract_text_from_xlsx(file_path: Path) -> str:
+    logger.info(f"Extracting text from XLSX using pandas: {file_path}")
+    text = ""
+    try:
+        with pd.ExcelFile(file_path) as workbook:
+            sheet_names = workbook.sheet_names
+            if len(sheet_names) > 1 and INGEST_WORKERS > 1:
+                # Sheets are independent, so they are rendered concurrently in worker processes
+                sheet_texts = list(_get_sheet_executor().map(_excel_sheet_to_text, [str(file_path)] * len(sheet_names), sheet_names))
+            else:
+                sheet_texts = [_excel_sheet_to_text(workbook, name) for name in sheet_names]
+        text = "\n\n".join(sheet_texts) # Separate sheets by a double newline
+        logger.info(f"Successfully extracted text from XLSX {file_path}. Total characters: {len(text)}")
+    except Exception as e:
+        logger.error(f"Error extracting text from XLSX {file_path} with pandas: {e}", exc_info=True)
+    return text
+
+def extract_file_text(file_path: Path, file_type: str) -> Optional[str]:
+    """Extract plain text from a supported file. Returns None for unsupported file types."""
+    file_type = file_type.lower()
+    if file_type == FileType.TXT.value:
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            return f.read()
+    elif file_type == FileType.PDF.value:
+        return extract_text_from_pdf(file_path)
+    elif file_type == FileType.DOCX.value:
+        return extract_text_from_docx(file_path)
+    elif file_type == FileType.CSV.value:
+        return extract_text_from_csv(file_path)
+    elif file_type == FileType.XLSX.value:
+        return extract_text_from_xlsx(file_path)
+    return None
+
+# ================== Chunking and Embedding Helpers ==================
+
+def chunk_text(text: str) -> List[str]:
+    """Split extracted text into overlapping chunks for retrieval."""
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=RAG_CHUNK_SIZE, chunk_overlap=RAG_CHUNK_OVERLAP)
+    return text_splitter.split_text(text)
+
+def generate_embeddings(chunks: List[str], quantization: str = VectorQuantization.FLOAT32.value) -> Optional[List[bytes]]:
+    """Embed chunks with the local embedding model. Returns encoded bytes per chunk (see vector_index), or None if unavailable."""
+    from .agent import embeddings # Imported lazily: agent.py imports this module
+    if not embeddings or not chunks:
+        return None
+    with track_embedding("ingest", len(chunks)):
+        vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    return encode_vectors(vectors, quantization)
+
+async def _ingest_knowledge_base_file(file_id: int, file_path: Path, original_filename: str, file_type: str,
+                                      quantization: str = VectorQuantization.FLOAT32.value) -> int:
+    """Extract, chunk and embed a knowledge base file, storing the chunks for retrieval. Returns the chunk count."""
+    text_content = await asyncio.to_thread(extract_file_text, file_path, file_type)
+    if text_content is None:
+        logger.info(f"[FileProcessor] Unsupported file type '{file_type}' for knowledge base file {original_filename}. Nothing to index.")
+        return 0
+
+    chunks = chunk_text(text_content) if text_content.strip() else []
+    if not chunks:
+        logger.warning(f"[FileProcessor] No text content extracted from {original_filename} (Type: {file_type})")
+        return 0
+
+    vectors = await asyncio.to_thread(generate_embeddings, chunks, quantization)
+    if vectors is None:
+        logger.warning(f"[FileProcessor] Embedding model unavailable. Storing {len(chunks)} chunks of {original_filename} without vectors.")
+
+    await save_vector_chunks(file_id, [
+        {
+            'content': chunk,
+            'metadata': {'source': original_filename, 'chunk_index': index},
+            'embedding': vectors[index] if vectors else None,
+            'embedding_format': quantization
+        }
+        for index, chunk in enumerate(chunks)
+    ])
+    return len(chunks)
+
 def sanitize_column_name(col_name: str) -> str:
     """Converts a column name to a safe SQL column name."""
     # Remove or replace illegal characters, e.g., spaces, special symbols.
@@ -61,17 +267,28 @@ async def _insert_df_to_table(conn, table_name: str, df_renamed: pd.DataFrame):
         logger.error(f"Error inserting data into '{table_name}': {e}", exc_info=True)
         raise
 
+async def _profile_table(table_name: str, frames: List[pd.DataFrame], storage_types: Dict[str, str]):
+    """Compute and store column statistics for a newly written table. Failures only skip the profile."""
+    try:
+        profile = await asyncio.to_thread(profile_frames, frames, storage_types)
+        await save_table_profile(table_name, profile)
+        logger.info(f"[FileProcessor] Profiled table '{table_name}': {profile['row_count']} rows, {len(profile['columns'])} columns")
+    except Exception as e:
+        logger.warning(f"[FileProcessor] Could not profile table '{table_name}': {e}", exc_info=True)
+
 async def process_uploaded_file(
     file_id: int, 
     datasource_id: int, 
     file_path: Path, 
     original_filename: str, 
-    file_type: str 
+    file_type: str,
+    content_hash: Optional[str] = None
 ):
     """
     Background task to process uploaded files.
     - If data source type is SQL_TABLE_FROM_FILE and file is CSV/XLSX, parse and store in a new table.
-    - Other cases (e.g., knowledge base files) currently simulate processing and update status.
+    - Knowledge base files are extracted, chunked and embedded into vector_chunks.
+    - When identical content (same content_hash) was already processed, its table or chunks are reused.
     """
     logger.info(f"[FileProcessor] Starting processing for file ID: {file_id}, DS_ID: {datasource_id}, Name: {original_filename}")
 
@@ -82,7 +299,11 @@ async def process_uploaded_file(
         return
 
     ds_type = datasource_details.get('type')
+    storage_engine = datasource_details.get('storage_engine') or StorageEngine.SQLITE.value
     conn = None
+    processing_start = time.perf_counter()
+    outcome = "completed"
+    INGEST_IN_PROGRESS.inc()
 
     try:
         await update_file_processing_status(file_id, status=ProcessingStatus.PROCESSING.value)
@@ -91,21 +312,36 @@ async def process_uploaded_file(
         if ds_type == DataSourceType.SQL_TABLE_FROM_FILE.value and file_type.lower() in [FileType.CSV.value, FileType.XLSX.value]:
             logger.info(f"[FileProcessor] Processing '{file_type}' file '{original_filename}' for SQL table ingestion.")
             
+            if content_hash:
+                reusable = await find_reusable_table(content_hash, exclude_file_id=file_id, storage_engine=storage_engine)
+                if reusable:
+                    table_name = reusable['table_name']
+                    await set_file_derived_table(file_id, table_name)
+                    await set_datasource_table_name(datasource_id, table_name)
+                    await update_file_processing_status(file_id, status=ProcessingStatus.COMPLETED.value, chunks=reusable['row_count'])
+                    logger.info(f"[FileProcessor] File ID: {file_id} - Identical content already ingested. Reusing table '{table_name}' for datasource {datasource_id}")
+                    return
+
             if not file_path.exists():
                 logger.error(f"[FileProcessor] File not found at path: {file_path}. Cannot ingest.")
                 raise FileNotFoundError(f"Source file {original_filename} not found at {file_path}")
 
-            df = None
+            frames: List[pd.DataFrame] = []
             if file_type.lower() == FileType.CSV.value:
-                df = pd.read_csv(file_path, on_bad_lines='skip')
+                frames = [pd.read_csv(file_path, on_bad_lines='skip')]
             elif file_type.lower() == FileType.XLSX.value:
-                xls = pd.ExcelFile(file_path)
-                if xls.sheet_names:
-                    df = xls.parse(xls.sheet_names[0])
-                else:
+                sheets = await parse_excel_sheets(file_path)
+                if not sheets:
                     raise ValueError("Excel file contains no sheets.")
+                non_empty_sheets = [(name, sheet_df) for name, sheet_df in sheets if not sheet_df.empty]
+                if len(non_empty_sheets) > 1:
+                    # Union all sheets into one table, tagging each row with the sheet it came from
+                    frames = [sheet_df.assign(**{SHEET_COLUMN_NAME: name}) for name, sheet_df in non_empty_sheets]
+                else:
+                    frames = [sheet_df for _, sheet_df in non_empty_sheets]
             
-            if df is None or df.empty:
+            total_rows = sum(len(frame) for frame in frames)
+            if total_rows == 0:
                 logger.warning(f"[FileProcessor] DataFrame is empty for file {original_filename}. No data to ingest.")
                 await update_file_processing_status(file_id, status=ProcessingStatus.COMPLETED.value, chunks=0, error_message="File was empty or unreadable as table.")
                 return
@@ -117,15 +353,29 @@ async def process_uploaded_file(
             table_name = table_name[:60]
             logger.info(f"[FileProcessor] Generated table name: {table_name}")
 
-            conn = get_db_connection()
-            df_renamed = await _create_table_from_df(conn, table_name, df)
-            await _insert_df_to_table(conn, table_name, df_renamed)
+            # Single writer: all frames are inserted sequentially over one connection
+            renamed_frames = [frame.rename(columns={col: sanitize_column_name(col) for col in frame.columns}) for frame in frames]
+            union_columns = list(dict.fromkeys(col for frame in renamed_frames for col in frame.columns))
+            aligned_frames = [frame.reindex(columns=union_columns) for frame in renamed_frames]
+            if storage_engine == StorageEngine.DUCKDB.value:
+                # Columnar backend keeps the inferred column types instead of storing everything as TEXT
+                await asyncio.to_thread(analytics.write_frames_to_table, table_name, aligned_frames)
+                storage_types = duckdb_storage_types(aligned_frames)
+            else:
+                conn = get_db_connection()
+                await _create_table_from_df(conn, table_name, pd.DataFrame(columns=union_columns))
+                for frame in aligned_frames:
+                    await _insert_df_to_table(conn, table_name, frame)
+                storage_types = {col: "TEXT" for col in union_columns}
+
+            await _profile_table(table_name, renamed_frames, storage_types)
             
+            await set_file_derived_table(file_id, table_name)
             await set_datasource_table_name(datasource_id, table_name)
             logger.info(f"[FileProcessor] Successfully linked table '{table_name}' to datasource {datasource_id}")
             
-            await update_file_processing_status(file_id, status=ProcessingStatus.COMPLETED.value, chunks=len(df))
-            logger.info(f"[FileProcessor] File ID: {file_id} - SQL table ingestion COMPLETED. Rows: {len(df)}")
+            await update_file_processing_status(file_id, status=ProcessingStatus.COMPLETED.value, chunks=total_rows)
+            logger.info(f"[FileProcessor] File ID: {file_id} - SQL table ingestion COMPLETED. Rows: {total_rows} from {len(frames)} sheet(s)")
 
         else:
             # Handle knowledge_base files or other types that need text processing for RAG
@@ -133,47 +383,22 @@ async def process_uploaded_file(
             
             if ds_type == DataSourceType.KNOWLEDGE_BASE.value:
                 try:
-                    # For knowledge base files, we'll do a basic processing simulation
-                    # In a real implementation, this would extract text, chunk it, and create embeddings
-                    
+                    if content_hash:
+                        reused_chunks = await get_chunk_count_for_content_hash(content_hash)
+                        if reused_chunks:
+                            await update_file_processing_status(file_id, status=ProcessingStatus.COMPLETED.value, chunks=reused_chunks)
+                            logger.info(f"[FileProcessor] File ID: {file_id} - Identical content already indexed. Reusing {reused_chunks} chunks.")
+                            return
+
                     if not file_path.exists():
                         logger.error(f"[FileProcessor] File not found at path: {file_path}")
                         raise FileNotFoundError(f"Source file {original_filename} not found at {file_path}")
                     
-                    # Get file size for processing estimation
-                    file_size = file_path.stat().st_size
-                    
-                    # Simulate text extraction and chunking
-                    # In a real implementation, this would call text extraction functions
-                    # based on file type (PDF, DOCX, TXT, etc.)
+                    quantization = datasource_details.get('vector_quantization') or VectorQuantization.FLOAT32.value
+                    chunk_count = await _ingest_knowledge_base_file(file_id, file_path, original_filename, file_type, quantization)
                     
-                    if file_type.lower() in [FileType.TXT.value, FileType.TEXT.value]:
-                        # For text files, we can easily process them
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            text_content = f.read()
-                        estimated_chunks = max(1, len(text_content) // 1000)  # Rough estimate
-                        
-                    elif file_type.lower() == FileType.PDF.value:
-                        # For PDF files, estimate chunks based on file size
-                        estimated_chunks = max(1, file_size // 5000)  # Rough estimate
-                        
-                    elif file_type.lower() == FileType.DOCX.value:
-                        # For DOCX files, estimate chunks based on file size
-                        estimated_chunks = max(1, file_size // 3000)  # Rough estimate
-                        
-                    elif file_type.lower() in [FileType.CSV.value, FileType.XLSX.value]:
-                        # For CSV/XLSX in knowledge base, treat as structured text
-                        estimated_chunks = max(1, file_size // 2000)  # Rough estimate
-                        
-                    else:
-                        estimated_chunks = 1  # Unknown file type, minimal processing
-                    
-                    # Simulate processing time proportional to estimated chunks
-                    processing_time = min(10, max(2, estimated_chunks * 0.5))  # 2-10 seconds
-                    await asyncio.sleep(processing_time)
-                    
-                    await update_file_processing_status(file_id, status=ProcessingStatus.COMPLETED.value, chunks=estimated_chunks)
-                    logger.info(f"[FileProcessor] File ID: {file_id} - Knowledge base processing COMPLETED. Estimated chunks: {estimated_chunks}")
+                    await update_file_processing_status(file_id, status=ProcessingStatus.COMPLETED.value, chunks=chunk_count)
+                    logger.info(f"[FileProcessor] File ID: {file_id} - Knowledge base processing COMPLETED. Chunks: {chunk_count}")
                     
                 except Exception as e:
                     logger.error(f"[FileProcessor] Error in knowledge base processing for file ID: {file_id}. Error: {str(e)}")
@@ -189,14 +414,10 @@ async def process_uploaded_file(
     except Exception as e:
         logger.error(f"[FileProcessor] Error processing file ID: {file_id}, Name: {original_filename}. Error: {str(e)}", exc_info=True)
         await update_file_processing_status(file_id, status=ProcessingStatus.FAILED.value, error_message=str(e))
+        outcome = "failed"
     finally:
         if conn:
             conn.close()
+        INGEST_IN_PROGRESS.dec()
+        FILE_PROCESSING_DURATION.observe(time.perf_counter() - processing_start, file_type=file_type.lower(), status=outcome)
         logger.info(f"[FileProcessor] Finished processing attempt for file ID: {file_id}, Name: {original_filename}")
-
-# More file processing helper functions can be added here, for example:
-# async def parse_pdf(file_path: Path) -> str: ...
-# async def parse_docx(file_path: Path) -> str: ...
-# async def chunk_text(text: str) -> List[str]: ...
-# async def generate_embeddings(chunks: List[str]) -> List[List[float]]: ...
-# async def store_vector_chunks(file_id: int, chunks: List[str], embeddings: List[List[float]]): ... 
\ No newline at end of file
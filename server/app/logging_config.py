@@ -0,0 +1,141 @@
+"""
+Structured, non-blocking application logging.
+
+`configure_logging()` installs a single root handler: a QueueHandler that only puts
+records on an in-memory queue, drained by a QueueListener thread that formats them
+(JSON lines by default, LOG_JSON=false for plain text) and writes them to stdout.
+Request handlers therefore never block on stdout, and records below Config.LOG_LEVEL
+are discarded before any formatting.
+
+Every record carries the correlation id of the HTTP request it was emitted for
+(RequestIdMiddleware: the client's X-Request-ID header, or a generated id), which
+is also returned in the X-Request-ID response header.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from config import Config
+
+LOG_JSON = Config.LOG_JSON
+# Loggers of the ASGI server, routed through the same queue and format
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+# Attributes every LogRecord has; anything else was passed with `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id"}
+# Client-supplied request ids are echoed in headers and logs: keep them short and printable
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+def get_request_id() -> Optional[str]:
+    """Correlation id of the request being handled, if any."""
+    return _request_id.get()
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request id (runs in the emitting thread, where the context is set)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request_id, extra fields and exception text."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener, keeping message and traceback apart."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments and exceptions may not survive the thread hop (mutable or unpicklable): render them now
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def configure_logging(level: Optional[str] = None, json_output: bool = LOG_JSON):
+    """Route all logging through the background queue (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if json_output else logging.Formatter(Config.LOG_FORMAT + " [request_id=%(request_id)s]"))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel((level or Config.LOG_LEVEL).upper())
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        server_logger.handlers.clear()
+        server_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class RequestIdMiddleware:
+    """ASGI middleware assigning each HTTP request a correlation id (X-Request-ID) for its log records."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        supplied = dict(scope.get("headers", [])).get(b"x-request-id", b"").decode("latin-1")
+        request_id = supplied if _REQUEST_ID_PATTERN.match(supplied) else uuid.uuid4().hex
+        token = _request_id.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            _request_id.reset(token)
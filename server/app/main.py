@@ -1,6 +1,12 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Dict
+import asyncio
+import logging
+
+# Configure logging before the application modules are imported, so their import-time messages are captured
+from .logging_config import RequestIdMiddleware, configure_logging
+configure_logging()
 
 # Import Pydantic models from .models
 from .models import (
@@ -10,6 +16,13 @@ from .models import (
 
 # Import initialization function
 from .agent import initialize_app_state
+from .file_processor import shutdown_ingest_workers
+from .analytics import close_duckdb
+from .sql_guard import get_sql_guard_stats
+from .db import get_metadata_cache_stats
+from .timing import TimingMiddleware, get_timing_histograms
+from .token_budget import wait_for_encoding
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
 
 # Import agent functions (simplified)
 from .agent import (
@@ -18,6 +31,8 @@ from .agent import (
 
 from . import routes # Import the routes module
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="SmartERP AI Assistant API", version="0.5.0")
 
 # CORS Middleware Configuration
@@ -34,6 +49,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-request stage timings (Server-Timing header) and per-stage latency histograms
+app.add_middleware(TimingMiddleware)
+# Outermost: the request id is set before any other middleware or handler logs
+app.add_middleware(RequestIdMiddleware)
 
 # Include the router from routes.py
 app.include_router(routes.router) # This line registers all routes from routes.py
@@ -41,9 +60,17 @@ app.include_router(routes.router) # This line registers all routes from routes.p
 @app.on_event("startup")
 async def startup_event():
     """Initialize application state (e.g., DB schema, API keys) on startup."""
-    print("Application starting up...")
+    logger.info("Application starting up...")
     initialize_app_state()
-    print("Application startup completed.")
+    # tiktoken may download its encoding; wait for it (bounded) in a thread, not on the event loop
+    await asyncio.to_thread(wait_for_encoding)
+    logger.info("Application startup completed.")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release worker processes used for file ingestion and the analytics database."""
+    shutdown_ingest_workers()
+    close_duckdb()
 
 @app.get("/ping", tags=["Health Check"])
 async def ping():
@@ -94,16 +121,39 @@ async def api_info():
         },
         "endpoints": [
             "POST /api/v1/query",
+            "POST /api/v1/query/stream",
+            "POST /api/v1/query/federated",
             "GET /api/v1/datasources",
             "POST /api/v1/datasources",
-            "POST /api/v1/datasources/{id}/files/upload"
+            "POST /api/v1/datasources/{id}/files/upload",
+            "GET /api/v1/debug/timings",
+            "GET /metrics"
         ],
         "database": "SQLite with file processing",
-        "ai_powered": True
+        "ai_powered": True,
+        "sql_guard": get_sql_guard_stats(),
+        "metadata_cache": get_metadata_cache_stats()
     }
 
+@app.get("/api/v1/debug/timings", tags=["System Info"])
+async def debug_timings():
+    """
+    Latency histograms of the query pipeline stages (intent parsing, SQLite reads,
+    embedding, FAISS/BM25 search, LLM calls, ...) and of each HTTP route, since startup.
+    """
+    return {"unit": "ms", "stages": get_timing_histograms()}
+
+@app.get("/metrics", tags=["System Info"], include_in_schema=False)
+async def metrics():
+    """
+    Prometheus scrape endpoint: request latency by route and query type, SQLite statement
+    counts/durations, LLM calls/latency/tokens, embedding throughput, cache hit rates,
+    ingestion backlog and file processing durations.
+    """
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 # Example of how to run directly
 if __name__ == "__main__":
     import uvicorn
-    print("Starting FastAPI server. For production, use: uvicorn main:app --reload")
+    logger.info("Starting FastAPI server. For production, use: uvicorn main:app --reload")
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,264 @@
+"""
+Prometheus metrics for capacity planning, exposed at GET /metrics.
+
+A small in-process registry rendering the Prometheus text exposition format
+(version 0.0.4), so no client library is required. Instrumented code records into
+the module-level metrics below; values that already live elsewhere (cache and
+guard counters, file status counts) are read at scrape time by collectors that
+the owning modules register with `register_collector`.
+
+Metric names carry the `smarterp_` prefix; durations are in seconds.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRIC_PREFIX = "smarterp_"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+# A collector returns (name without prefix, type, help, [(labels, value), ...]) families
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+
+def _escape_label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self) -> List[Tuple[str, Dict[str, Any], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for sample_name, labels, value in self._samples():
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(f"{self.name}_total", dict(zip(self.label_names, key)), value) for key, value in values]
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, dict(zip(self.label_names, key)), value) for key, value in values]
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, with their sum and count."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, the last one unbounded; then sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in values:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, math.inf], counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+_registry: List[_Metric] = []
+_collectors: List[Collector] = []
+
+def register_collector(collector: Collector):
+    """Register a function read at every scrape, for values kept outside this registry."""
+    _collectors.append(collector)
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            families = list(collector())
+        except Exception as e:
+            lines.append(f"# collector {getattr(collector, '__name__', collector)} failed: {e}".replace("\n", " "))
+            continue
+        for name, type_name, documentation, samples in families:
+            full_name = METRIC_PREFIX + name
+            lines.append(f"# HELP {full_name} {documentation}")
+            lines.append(f"# TYPE {full_name} {type_name}")
+            sample_name = f"{full_name}_total" if type_name == "counter" else full_name
+            for labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+def reset_metrics():
+    for metric in _registry:
+        metric.reset()
+
+# ---- HTTP and query pipeline ----
+HTTP_REQUESTS = Counter("http_requests", "HTTP requests by method, route template and status code.", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency by method and route template.", ("method", "route"))
+QUERIES = Counter("queries", "Answered Q&A queries by query type and outcome.", ("query_type", "status"))
+QUERY_DURATION = Histogram("query_duration_seconds", "Q&A answer latency by query type (sales, inventory, report, rag, sql_agent, federated).",
+                           ("query_type",), buckets=LLM_BUCKETS)
+STAGE_DURATION = Histogram("stage_duration_seconds", "Latency of instrumented pipeline stages (timing spans).", ("stage",))
+
+# ---- SQLite ----
+# source: "app" (application connections from db.get_db_connection) or "sql_agent" (guarded datasource queries)
+SQLITE_QUERIES = Counter("sqlite_queries", "SQLite statements executed, by source and statement kind.", ("source", "operation"))
+SQLITE_QUERY_DURATION = Histogram("sqlite_query_duration_seconds",
+                                  "SQLite statement time (execution and reading its rows) by source and statement kind.",
+                                  ("source", "operation"))
+
+# ---- LLM and embeddings ----
+LLM_REQUESTS = Counter("llm_requests", "LLM calls by model and outcome.", ("model", "status"))
+LLM_REQUEST_DURATION = Histogram("llm_request_duration_seconds", "LLM call latency by model.", ("model",), buckets=LLM_BUCKETS)
+# route: template of the HTTP route that made the call ("none" outside requests)
+LLM_TOKENS = Counter("llm_tokens", "LLM tokens by route template, model and kind (prompt, completion).", ("route", "model", "kind"))
+LLM_COST = Counter("llm_cost_usd", "Estimated LLM cost in USD by route template and model (configured token prices).", ("route", "model"))
+PROMPT_TOKENS = Histogram("llm_prompt_budget_tokens", "Tokens of data-bearing prompts after budget enforcement, by prompt.", ("prompt",),
+                          buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+PROMPT_ROWS_DROPPED = Counter("llm_prompt_rows_dropped", "Data rows left out of prompts to stay within PROMPT_TOKEN_BUDGET, by prompt.", ("prompt",))
+EMBEDDING_TEXTS = Counter("embedding_texts", "Texts embedded, by operation (ingest, index, query).", ("operation",))
+EMBEDDING_DURATION = Histogram("embedding_duration_seconds", "Embedding batch latency by operation.", ("operation",))
+
+# ---- Caches ----
+NL_SQL_CACHE_LOOKUPS = Counter("nl_sql_cache_lookups", "NL-to-SQL cache lookups by result (hit, miss).", ("result",))
+VECTOR_INDEX_CACHE_LOOKUPS = Counter("vector_index_cache_lookups", "Built vector index cache lookups by result (hit, miss).", ("result",))
+
+# ---- Ingestion ----
+INGEST_IN_PROGRESS = Gauge("ingest_files_in_progress", "Uploaded files currently being processed.")
+FILE_PROCESSING_DURATION = Histogram("file_processing_duration_seconds", "Uploaded file processing time by file type and outcome.",
+                                     ("file_type", "status"), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+
+def sql_operation(sql: str) -> str:
+    """Statement kind used as a label: the first keyword (SELECT, INSERT, ...), or OTHER."""
+    keyword = sql.lstrip().split(None, 1)[0].upper() if sql and sql.strip() else ""
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH", "CREATE", "DROP", "ALTER", "PRAGMA", "EXPLAIN") else "OTHER"
+
+def observe_sql(source: str, sql: str, elapsed_seconds: float):
+    operation = sql_operation(sql)
+    SQLITE_QUERIES.inc(source=source, operation=operation)
+    SQLITE_QUERY_DURATION.observe(elapsed_seconds, source=source, operation=operation)
+
+def observe_query(query_type: str, succeeded: bool, elapsed_seconds: float):
+    QUERIES.inc(query_type=query_type, status="ok" if succeeded else "error")
+    QUERY_DURATION.observe(elapsed_seconds, query_type=query_type)
+
+@contextmanager
+def track_embedding(operation: str, count: int) -> Iterator[None]:
+    """Count `count` texts embedded by `operation` and time the batch."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        EMBEDDING_TEXTS.inc(count, operation=operation)
+        EMBEDDING_DURATION.observe(time.perf_counter() - start, operation=operation)
+
+def token_usage(response: Any) -> Tuple[int, int]:
+    """(prompt tokens, completion tokens) of an LLMResult, from message usage metadata or the provider's token_usage."""
+    prompt_tokens = completion_tokens = 0
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not prompt_tokens and not completion_tokens:
+        usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+def model_name(serialized: Optional[Dict[str, Any]], invocation_params: Optional[Dict[str, Any]]) -> str:
+    """Model label of an LLM call from the callback arguments."""
+    params = invocation_params or {}
+    name = params.get("model_name") or params.get("model")
+    if not name and serialized:
+        kwargs = serialized.get("kwargs") or {}
+        name = kwargs.get("model_name") or kwargs.get("model")
+    return str(name or params.get("_type") or "unknown")
@@ -18,6 +18,20 @@ class DataSourceType(str, Enum):
     KNOWLEDGE_BASE = "knowledge_base"  # Knowledge base/document collection (unstructured RAG, local embeddings)
     SQL_TABLE_FROM_FILE = "sql_table_from_file"  # Data source for SQL tables created from files (formatted, dynamic tables)
 
+class StorageEngine(str, Enum):
+    SQLITE = "sqlite"  # Row store in the main smart_erp.db (default)
+    DUCKDB = "duckdb"  # Columnar analytics store for SQL_TABLE_FROM_FILE datasources (optional dependency)
+
+class VectorIndexType(str, Enum):
+    FLAT = "flat"  # Exact search (default)
+    HNSW = "hnsw"  # Graph-based approximate search
+    IVF_PQ = "ivf_pq"  # Inverted lists with product-quantized codes, for very large knowledge bases
+
+class VectorQuantization(str, Enum):
+    FLOAT32 = "float32"  # Full precision (default)
+    FLOAT16 = "float16"  # Half precision, 2x smaller
+    INT8 = "int8"  # Scalar quantization with a per-vector scale, ~4x smaller
+
 class FileType(str, Enum):
     PDF = "pdf"
     TXT = "txt"
@@ -38,6 +52,9 @@ class DataSourceCreate(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
     description: Optional[str] = Field(None, max_length=500)
     type: DataSourceType = DataSourceType.KNOWLEDGE_BASE
+    storage_engine: StorageEngine = StorageEngine.SQLITE  # Only used by SQL_TABLE_FROM_FILE datasources
+    vector_index_type: VectorIndexType = VectorIndexType.FLAT  # Only used by KNOWLEDGE_BASE datasources
+    vector_quantization: VectorQuantization = VectorQuantization.FLOAT32  # Only used by KNOWLEDGE_BASE datasources
 
 class DataSourceUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
@@ -51,6 +68,9 @@ class DataSource(BaseModel):
     is_active: bool
     file_count: int = 0  # For SQL_TABLE_FROM_FILE, this might represent source file count (usually 1) or remain 0
     db_table_name: Optional[str] = None  # New: stores the associated database table name
+    storage_engine: StorageEngine = StorageEngine.SQLITE
+    vector_index_type: VectorIndexType = VectorIndexType.FLAT
+    vector_quantization: VectorQuantization = VectorQuantization.FLOAT32
     created_at: datetime
     updated_at: datetime
 
@@ -59,6 +79,7 @@ class DataSourceResponse(BaseResponse):
 
 class DataSourceListResponse(BaseResponse):
     data: List[DataSource] = []
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to fetch the next page; None on the last page
 
 # File Management Models
 class FileUpload(BaseModel):
@@ -79,9 +100,35 @@ class FileInfo(BaseModel):
     error_message: Optional[str] = None
     uploaded_at: datetime
     processed_at: Optional[datetime] = None
+    content_hash: Optional[str] = None  # SHA-256 of the file content, shared by identical uploads
 
 class FileListResponse(BaseResponse):
     data: List[FileInfo] = []
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to fetch the next page; None on the last page
+
+# Table Profile Models (column statistics computed at ingestion)
+class ColumnValueCount(BaseModel):
+    value: Any
+    count: int
+
+class ColumnProfile(BaseModel):
+    name: str
+    storage_type: str  # Column type in the storage engine (TEXT for SQLite tables)
+    inferred_type: str  # integer, float, date, datetime, boolean, text or empty
+    null_fraction: float
+    distinct_count: int  # HyperLogLog estimate
+    min: Optional[Any] = None
+    max: Optional[Any] = None
+    top_values: List[ColumnValueCount] = []
+
+class TableProfile(BaseModel):
+    table_name: str
+    row_count: int
+    columns: List[ColumnProfile] = []
+    profiled_at: Optional[datetime] = None
+
+class TableProfileResponse(BaseResponse):
+    data: Optional[TableProfile] = None
 
 # File Processing Status
 class FileProcessingStatus(BaseModel):
@@ -99,6 +146,11 @@ class QueryRequest(BaseModel):
     query: str
     datasource_id: Optional[int] = None  # Added data source support
 
+class FederatedQueryRequest(BaseModel):
+    query: str
+    datasource_ids: Optional[List[int]] = None  # Datasources to query; all datasources if omitted
+    timeout_seconds: Optional[float] = Field(None, gt=0, le=300)  # Per-datasource timeout; server default if omitted
+
 class InventoryQueryRequest(BaseModel):
     query: str
     threshold: Optional[int] = 50
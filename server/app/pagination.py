@@ -0,0 +1,50 @@
+"""
+Keyset (seek) pagination for list endpoints.
+
+A page is fetched with `WHERE (sort key) after (last key of the previous page)
+ORDER BY sort key LIMIT page_size + 1` on an index matching the sort order, so
+every page costs the same however deep the client has paged (unlike OFFSET,
+which scans and discards all earlier rows). The position is handed to clients
+as an opaque cursor: the sort key of the last returned row, tagged with the
+listing it belongs to, as URL-safe base64 JSON.
+"""
+import base64
+import binascii
+import json
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from config import Config
+
+DEFAULT_PAGE_SIZE = Config.DEFAULT_PAGE_SIZE
+MAX_PAGE_SIZE = Config.MAX_PAGE_SIZE
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor is malformed or belongs to another listing."""
+
+def encode_cursor(scope: str, key: Sequence[Any]) -> str:
+    """Opaque cursor for the position after the row with the given sort key."""
+    payload = json.dumps([scope, list(key)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(scope: str, cursor: str, key_length: int) -> List[Any]:
+    """Sort key stored in a cursor issued by the same listing."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_scope, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise InvalidCursorError("Malformed pagination cursor") from e
+    if cursor_scope != scope or not isinstance(key, list) or len(key) != key_length:
+        raise InvalidCursorError(f"Cursor does not belong to the {scope} listing")
+    return key
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+def split_page(rows: List[Any], limit: int, scope: str, key_of: Callable[[Any], Tuple[Any, ...]]) -> Tuple[List[Any], Optional[str]]:
+    """Split `limit + 1` fetched rows into the page and the cursor of the next page (None on the last page)."""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(scope, key_of(page[-1]))
@@ -0,0 +1,288 @@
+"""
+On-demand profiling of the running server (admin endpoints under /api/v1/admin/profile).
+
+CPU: a sampling profiler thread that, every PROFILE_INTERVAL_MS, records the Python
+stack of every other thread (event loop, thread-pool workers running ingestion,
+embedding or FAISS work, ...) for a bounded duration. Sampling only reads frames, so
+the profiled code runs unmodified and the overhead is set by the interval, not by the
+number of calls. Results are wall-clock samples: threads blocked waiting for work are
+left out unless `include_idle` is set.
+
+Memory: tracemalloc snapshots (tracing starts with the first snapshot and costs
+memory and CPU while active, until it is stopped), listed by allocation site or
+diffed against each other to find what grew.
+
+Both are available as "collapsed stacks" text (`frame;frame;frame count` per line),
+the input format of flamegraph.pl, speedscope and inferno.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter as _Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+# Longest CPU profile a single request may ask for
+PROFILE_MAX_DURATION_SECONDS = float(os.getenv("PROFILE_MAX_DURATION_SECONDS", "300"))
+# Frames kept per tracemalloc traceback (more frames: deeper flamegraphs, more tracing overhead)
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "25"))
+# Snapshots kept in memory; the oldest is dropped when a new one is taken
+MEMORY_SNAPSHOT_LIMIT = int(os.getenv("MEMORY_SNAPSHOT_LIMIT", "4"))
+
+# Innermost Python frames of threads that are waiting rather than working
+_IDLE_FRAMES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"), ("queue.py", "get"), ("thread.py", "_worker"), ("handlers.py", "dequeue"),
+    ("socket.py", "accept"), ("socketserver.py", "serve_forever"),
+}
+_SITE_PACKAGES = ("site-packages", "dist-packages")
+
+class ProfilerError(Exception):
+    """A profiling request that cannot be served in the profiler's current state."""
+    pass
+
+class ProfileNotFoundError(ProfilerError):
+    pass
+
+def _short_filename(filename: str) -> str:
+    """Path relative to site-packages or the standard library, or the file name."""
+    parts = filename.replace("\\", "/").split("/")
+    for marker in _SITE_PACKAGES:
+        if marker in parts:
+            return "/".join(parts[parts.index(marker) + 1:])
+    for index in range(len(parts) - 1, 0, -1):
+        if parts[index] == "app":
+            return "/".join(parts[index:])
+    return parts[-1]
+
+def _frame_label(code) -> str:
+    # ';' separates frames in the collapsed format
+    return f"{code.co_name} ({_short_filename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+def _collapse(weights: Dict[Tuple[str, ...], int]) -> str:
+    """Collapsed stacks text: one `root;...;leaf weight` line per stack, heaviest first."""
+    return "".join(f"{';'.join(stack)} {weight}\n"
+                   for stack, weight in sorted(weights.items(), key=lambda item: -item[1]) if weight > 0)
+
+# ==================== CPU sampling ====================
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads every `interval` seconds until `duration` elapses or stop()."""
+
+    def __init__(self, duration: float, interval: float, include_idle: bool = False):
+        self.duration = duration
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        self.started_at: Optional[datetime] = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="cpu-profiler", daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self):
+        self.started_at = datetime.now()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _sample(self, own_id: int, thread_names: Dict[int, str]):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+            key = tuple(reversed(stack))
+            with self._lock:
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        start = time.perf_counter()
+        deadline = start + self.duration
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self._sample(own_id, thread_names)
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.elapsed = time.perf_counter() - start
+        logger.info(f"[Profiler] CPU profile finished: {self.samples} samples over {self.elapsed:.1f}s")
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return _collapse(dict(self.stacks))
+
+    def summary(self, top: int = 25) -> Dict[str, Any]:
+        """Status and the functions seen most often on top of a stack (self) and anywhere on it (total)."""
+        with self._lock:
+            stacks = dict(self.stacks)
+        self_counts, total_counts = _Counter(), _Counter()
+        for stack, count in stacks.items():
+            self_counts[stack[-1]] += count
+            for frame in set(stack[1:]):
+                total_counts[frame] += count
+        observed = sum(stacks.values())
+
+        def ranking(counts):
+            return [{"function": name, "samples": count, "percent": round(100 * count / observed, 2)}
+                    for name, count in counts.most_common(top)]
+
+        return {
+            "running": self.running,
+            "started_at": self.started_at.isoformat(timespec="seconds") if self.started_at else None,
+            "duration_seconds": self.duration,
+            "interval_ms": self.interval * 1000,
+            "include_idle": self.include_idle,
+            "elapsed_seconds": round((datetime.now() - self.started_at).total_seconds() if self.running else self.elapsed, 3),
+            "samples": self.samples,
+            "stack_samples": observed,
+            "distinct_stacks": len(stacks),
+            "top_self": ranking(self_counts),
+            "top_total": ranking(total_counts),
+        }
+
+_cpu_profiler: Optional[SamplingProfiler] = None
+_cpu_lock = threading.Lock()
+
+def start_cpu_profile(duration_seconds: float, interval_ms: float = PROFILE_INTERVAL_MS,
+                      include_idle: bool = False) -> Dict[str, Any]:
+    """Start sampling for `duration_seconds`; the previous result is discarded. One profile runs at a time."""
+    global _cpu_profiler
+    if not 0 < duration_seconds <= PROFILE_MAX_DURATION_SECONDS:
+        raise ProfilerError(f"duration must be between 0 and {PROFILE_MAX_DURATION_SECONDS:g} seconds")
+    with _cpu_lock:
+        if _cpu_profiler is not None and _cpu_profiler.running:
+            raise ProfilerError("A CPU profile is already running")
+        _cpu_profiler = SamplingProfiler(duration_seconds, interval_ms / 1000, include_idle)
+        _cpu_profiler.start()
+    logger.info(f"[Profiler] CPU profile started for {duration_seconds:g}s every {interval_ms:g} ms")
+    return _cpu_profiler.summary()
+
+def stop_cpu_profile() -> Dict[str, Any]:
+    """Stop the running profile early and return its summary."""
+    profiler = _require_cpu_profile()
+    profiler.stop()
+    return profiler.summary()
+
+def get_cpu_profile(collapsed: bool = False, top: int = 25):
+    """Summary of the current or last profile, or its collapsed stacks (partial while it runs)."""
+    profiler = _require_cpu_profile()
+    return profiler.collapsed() if collapsed else profiler.summary(top)
+
+def _require_cpu_profile() -> SamplingProfiler:
+    if _cpu_profiler is None:
+        raise ProfileNotFoundError("No CPU profile has been started")
+    return _cpu_profiler
+
+# ==================== Memory (tracemalloc) ====================
+
+_snapshot_filters = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+_snapshots: Dict[int, Tuple[datetime, tracemalloc.Snapshot]] = {}
+_next_snapshot_id = 1
+_memory_lock = threading.Lock()
+
+def _statistics(stats, top: int) -> List[Dict[str, Any]]:
+    entries = []
+    for stat in stats[:top]:
+        frame = stat.traceback[-1]
+        entry = {"location": f"{_short_filename(frame.filename)}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        if hasattr(stat, "size_diff"):
+            entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+            entry["count_diff"] = stat.count_diff
+        entries.append(entry)
+    return entries
+
+def _traceback_key(traceback: tracemalloc.Traceback) -> Tuple[str, ...]:
+    # Traceback frames run from the oldest call to the allocation site, the collapsed stacks order
+    return tuple(f"{_short_filename(frame.filename)}:{frame.lineno}".replace(";", ":") for frame in traceback)
+
+def take_memory_snapshot(top: int = 20) -> Dict[str, Any]:
+    """Snapshot the traced allocations (starting tracemalloc first if needed) and list the largest sites."""
+    global _next_snapshot_id
+    with _memory_lock:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            logger.info(f"[Profiler] tracemalloc started ({TRACEMALLOC_FRAMES} frames)")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_snapshot_filters)
+        snapshot_id = _next_snapshot_id
+        _next_snapshot_id += 1
+        _snapshots[snapshot_id] = (datetime.now(), snapshot)
+        while len(_snapshots) > MEMORY_SNAPSHOT_LIMIT:
+            _snapshots.pop(min(_snapshots))
+    current, peak = tracemalloc.get_traced_memory()
+    stats = snapshot.statistics("lineno")
+    return {
+        "snapshot_id": snapshot_id,
+        # Allocations made before tracing started are not traced: the first snapshot is a baseline
+        "tracing_started": started,
+        "traced_kb": round(sum(stat.size for stat in stats) / 1024, 1),
+        "traced_current_kb": round(current / 1024, 1),
+        "traced_peak_kb": round(peak / 1024, 1),
+        "top": _statistics(stats, top),
+    }
+
+def list_memory_snapshots() -> Dict[str, Any]:
+    with _memory_lock:
+        snapshots = [{"snapshot_id": snapshot_id, "taken_at": taken_at.isoformat(timespec="seconds")}
+                     for snapshot_id, (taken_at, _) in sorted(_snapshots.items())]
+    return {"tracing": tracemalloc.is_tracing(), "frames": tracemalloc.get_traceback_limit(), "snapshots": snapshots}
+
+def _get_snapshot(snapshot_id: int) -> tracemalloc.Snapshot:
+    with _memory_lock:
+        entry = _snapshots.get(snapshot_id)
+    if entry is None:
+        raise ProfileNotFoundError(f"Memory snapshot {snapshot_id} not found (kept: the last {MEMORY_SNAPSHOT_LIMIT})")
+    return entry[1]
+
+def memory_snapshot_collapsed(snapshot_id: int) -> str:
+    """Collapsed stacks of the bytes allocated in a snapshot, by allocation traceback."""
+    stats = _get_snapshot(snapshot_id).statistics("traceback")
+    return _collapse({_traceback_key(stat.traceback): stat.size for stat in stats})
+
+def diff_memory_snapshots(base_id: int, target_id: int, top: int = 20, collapsed: bool = False):
+    """What changed from snapshot `base_id` to `target_id`: the sites that grew most, or the growth as collapsed stacks."""
+    base, target = _get_snapshot(base_id), _get_snapshot(target_id)
+    if collapsed:
+        diffs = target.compare_to(base, "traceback")
+        return _collapse({_traceback_key(stat.traceback): stat.size_diff for stat in diffs})
+    diffs = target.compare_to(base, "lineno")
+    return {
+        "base_snapshot_id": base_id,
+        "target_snapshot_id": target_id,
+        "size_diff_kb": round(sum(stat.size_diff for stat in diffs) / 1024, 1),
+        "top": _statistics(diffs, top),
+    }
+
+def stop_memory_tracing():
+    """Stop tracemalloc and drop the snapshots."""
+    with _memory_lock:
+        _snapshots.clear()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("[Profiler] tracemalloc stopped")
@@ -0,0 +1,111 @@
+"""
+Compact row records for the default ERP tables (products, sales, inventory).
+
+Query functions return one slotted object per row instead of a dict: a record
+holds its values in fixed slots (no per-row hash table), is built directly by the
+SQLite cursor through `row_factory` (no intermediate sqlite3.Row), and is only
+turned into a dict when a response is serialized (`serialize_records`).
+
+Records keep the dict-style read API of the rows they replace (`row['total_amount']`,
+`row.get('category')`, `dict(row)`), so existing consumers keep working; hot loops
+use attribute access (`row.total_amount`).
+"""
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+class Record:
+    """Base class of the row records. Subclasses declare their columns in `__slots__`, in SELECT order."""
+
+    __slots__ = ()
+
+    @classmethod
+    def row_factory(cls, cursor, row: Tuple[Any, ...]) -> "Record":
+        """sqlite3 row factory building records straight from the raw row tuple."""
+        return cls(*row)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.__slots__
+
+    def values(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return ((name, getattr(self, name)) for name in self.__slots__)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__slots__
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Record):
+            return type(self) is type(other) and self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        # Same text as the dict rows had, so prompts embedding rows are unchanged
+        return repr(self.to_dict())
+
+class ProductRecord(Record):
+    """A row of the products table."""
+
+    __slots__ = ("product_id", "product_name", "category", "unit_price")
+
+    def __init__(self, product_id: str, product_name: str, category: str, unit_price: float):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.category = category
+        self.unit_price = unit_price
+
+class SaleRecord(Record):
+    """A row of the sales table with the category of its product (None if the product is unknown)."""
+
+    __slots__ = ("sale_id", "product_id", "product_name", "quantity_sold", "price_per_unit",
+                 "total_amount", "sale_date", "category")
+
+    def __init__(self, sale_id: str, product_id: str, product_name: str, quantity_sold: int,
+                 price_per_unit: float, total_amount: float, sale_date: str, category: Optional[str]):
+        self.sale_id = sale_id
+        self.product_id = product_id
+        self.product_name = product_name
+        self.quantity_sold = quantity_sold
+        self.price_per_unit = price_per_unit
+        self.total_amount = total_amount
+        self.sale_date = sale_date
+        self.category = category
+
+class StockRecord(Record):
+    """A product joined with its inventory row."""
+
+    __slots__ = ("product_id", "product_name", "category", "unit_price", "stock_level", "last_updated")
+
+    def __init__(self, product_id: str, product_name: str, category: str, unit_price: float,
+                 stock_level: int, last_updated: str):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.category = category
+        self.unit_price = unit_price
+        self.stock_level = stock_level
+        self.last_updated = last_updated
+
+def serialize_records(value: Any) -> Any:
+    """Convert records nested in lists/tuples/dicts to plain dicts, for JSON responses."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: serialize_records(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [serialize_records(item) for item in value]
+    return value
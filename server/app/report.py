@@ -1,11 +1,16 @@
 from .db import fetch_sales_for_day  # Updated to use SQLite-based data fetching
+from .timing import LLM_TIMING_CALLBACK, timed
+from .token_budget import fit_prompt
 from datetime import datetime
 from langchain_openai import ChatOpenAI
 import os
 import traceback # Added for detailed error logging
+import logging
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 从环境变量或配置文件获取API Key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
@@ -18,7 +23,8 @@ if OPENAI_API_KEY and not OPENAI_API_KEY.startswith(("123456", "local_mode")):
         llm_kwargs = {
             "model_name": LLM_MODEL_NAME,
             "temperature": 0.3,
-            "openai_api_key": OPENAI_API_KEY
+            "openai_api_key": OPENAI_API_KEY,
+            "callbacks": [LLM_TIMING_CALLBACK]
         }
         
         # 如果有自定义base_url（OpenRouter），添加到配置中
@@ -26,18 +32,31 @@ if OPENAI_API_KEY and not OPENAI_API_KEY.startswith(("123456", "local_mode")):
             llm_kwargs["openai_api_base"] = OPENAI_BASE_URL
             
         llm = ChatOpenAI(**llm_kwargs)
-        print(f"[Report] LLM 初始化成功 - 模型: {LLM_MODEL_NAME}")
+        logger.info(f"[Report] LLM 初始化成功 - 模型: {LLM_MODEL_NAME}")
         if OPENAI_BASE_URL:
-            print(f"[Report] 使用自定义API端点: {OPENAI_BASE_URL}")
+            logger.info(f"[Report] 使用自定义API端点: {OPENAI_BASE_URL}")
     except Exception as e:
-        print(f"[Report] LLM 初始化失败: {e}")
+        logger.error(f"[Report] LLM 初始化失败: {e}")
         llm = None
 else:
-    print("[Report] 使用模拟API Key或无Key，LLM功能将被模拟或不可用")
+    logger.warning("[Report] 使用模拟API Key或无Key，LLM功能将被模拟或不可用")
+
+def aggregate_sales_by_product(sales_details) -> list[dict]:
+    """Per-product totals of sale rows (name, sales, quantity, revenue), highest revenue first."""
+    products = {}
+    for item in sales_details:
+        entry = products.get(item.product_id)
+        if entry is None:
+            entry = products[item.product_id] = {"name": item.product_name, "sales": 0, "quantity": 0, "revenue": 0.0}
+        entry["sales"] += 1
+        entry["quantity"] += item.quantity_sold
+        entry["revenue"] += item.total_amount
+    return sorted(products.values(), key=lambda entry: entry["revenue"], reverse=True)
 
+@timed()
 async def generate_daily_sales_summary_report() -> tuple[str, dict]:
     """Generates a summary and data for the daily sales report using SQLite database."""
-    print("[Report-SQLite] Generating daily sales report...")
+    logger.info("[Report-SQLite] Generating daily sales report...")
     
     # 1. Fetch data for today
     today = datetime.now()
@@ -47,20 +66,16 @@ async def generate_daily_sales_summary_report() -> tuple[str, dict]:
         return f"今日 ({today.strftime('%Y-%m-%d')}) 暂无销售数据。", {}
 
     # 2. Process data and generate summary
-    total_sales_amount = sum(item['total_amount'] for item in sales_details)
-    total_quantity = sum(item['quantity_sold'] for item in sales_details)
+    total_sales_amount = sum(item.total_amount for item in sales_details)
+    total_quantity = sum(item.quantity_sold for item in sales_details)
     
-    # Sort by quantity_sold to find top product, ensure units_sold is present and integer
-    for item in sales_details:
-        item['units_sold'] = int(item.get('quantity_sold', 0))
-        
-    top_product = max(sales_details, key=lambda x: x['units_sold']) if sales_details else None
-    top_revenue_product = max(sales_details, key=lambda x: x['total_amount']) if sales_details else None
+    top_product = max(sales_details, key=lambda x: x.quantity_sold) if sales_details else None
+    top_revenue_product = max(sales_details, key=lambda x: x.total_amount) if sales_details else None
 
     # Basic summary
     basic_summary = f"今日 ({today.strftime('%Y-%m-%d')}) 销售总额为 ¥{total_sales_amount:.2f}，总销量 {total_quantity} 件。"
-    if top_product and top_product['units_sold'] > 0:
-        basic_summary += f" 畅销产品为 {top_product['product_name']} (售出 {top_product['units_sold']} 件)。"
+    if top_product and top_product.quantity_sold > 0:
+        basic_summary += f" 畅销产品为 {top_product.product_name} (售出 {top_product.quantity_sold} 件)。"
     if top_revenue_product and top_revenue_product != top_product:
         basic_summary += f" 收入最高产品为 {top_revenue_product['product_name']} (¥{top_revenue_product['total_amount']:.2f})。"
 
@@ -68,24 +83,19 @@ async def generate_daily_sales_summary_report() -> tuple[str, dict]:
     summary = basic_summary
     if llm:
         try:
-            # Create detailed sales breakdown
-            product_summary_list = []
-            for item in sales_details:
-                product_summary_list.append({
-                    "name": item['product_name'],
-                    "quantity": item['quantity_sold'],
-                    "revenue": item['total_amount']
-                })
-            
-            prompt = f"""
+            # One row per product (not per sale), best sellers first, so the budget trims the long tail
+            product_summary_list = aggregate_sales_by_product(sales_details)
+
+            def render(formatted):
+                return f"""
 基于以下销售数据为 {today.strftime('%Y年%m月%d日')} 生成一份专业的每日销售报告摘要：
 
 总销售额: ¥{total_sales_amount:.2f}
 总销量: {total_quantity} 件
-销售产品数: {len(sales_details)} 种
+销售产品数: {len(product_summary_list)} 种
 
-产品销售详情:
-{product_summary_list}
+产品销售详情 (CSV，按收入排序):
+{formatted['products']}
 
 请生成一份简洁但信息丰富的销售报告摘要，包括：
 1. 整体销售表现评价
@@ -95,13 +105,14 @@ async def generate_daily_sales_summary_report() -> tuple[str, dict]:
 
 保持专业、简洁，适合管理层阅读。
 """
-            
+
+            prompt = fit_prompt("daily_sales_summary", render, {"products": product_summary_list})
             llm_response = await llm.ainvoke(prompt)
             summary = llm_response.content
-            print(f"[Report-SQLite] Enhanced summary generated using LLM")
+            logger.info("[Report-SQLite] Enhanced summary generated using LLM")
             
         except Exception as e:
-            print(f"[Report-SQLite] LLM summarization error: {e}")
+            logger.error(f"[Report-SQLite] LLM summarization error: {e}")
             summary = basic_summary  # Fallback to basic summary
 
     report_data = {
@@ -109,8 +120,8 @@ async def generate_daily_sales_summary_report() -> tuple[str, dict]:
         "total_sales": total_sales_amount,
         "total_quantity": total_quantity,
         "products_sold": len(sales_details),
-        "top_product_name": top_product['product_name'] if top_product and top_product['units_sold'] > 0 else "N/A",
-        "top_product_units_sold": top_product['units_sold'] if top_product and top_product['units_sold'] > 0 else 0,
+        "top_product_name": top_product.product_name if top_product and top_product.quantity_sold > 0 else "N/A",
+        "top_product_units_sold": top_product.quantity_sold if top_product and top_product.quantity_sold > 0 else 0,
         "top_revenue_product": top_revenue_product['product_name'] if top_revenue_product else "N/A",
         "top_revenue_amount": top_revenue_product['total_amount'] if top_revenue_product else 0,
         "detailed_sales": sales_details,  # Already contains product_name from database
@@ -120,15 +131,16 @@ async def generate_daily_sales_summary_report() -> tuple[str, dict]:
         }
     }
     
-    print(f"[Report-SQLite] Generated enhanced report with {len(sales_details)} sales records")
+    logger.info(f"[Report-SQLite] Generated enhanced report with {len(sales_details)} sales records")
     return summary, report_data
 
+@timed()
 async def generate_sales_daily_report() -> dict:
     """
     生成每日销售报告 - 新的API端点函数
     使用LLM结合数据库数据生成格式化的文本摘要和销售数据概览
     """
-    print("[Report-SQLite] Generating sales daily report for API...")
+    logger.info("[Report-SQLite] Generating sales daily report for API...")
     
     today = datetime.now()
     sales_details = await fetch_sales_for_day(today)
@@ -143,22 +155,22 @@ async def generate_sales_daily_report() -> dict:
         }
 
     # Calculate key metrics
-    total_sales = sum(item['total_amount'] for item in sales_details)
-    total_quantity = sum(item['quantity_sold'] for item in sales_details)
-    unique_products = len(set(item['product_id'] for item in sales_details))
+    total_sales = sum(item.total_amount for item in sales_details)
+    total_quantity = sum(item.quantity_sold for item in sales_details)
+    unique_products = len(set(item.product_id for item in sales_details))
     
     # Find top performers
     product_sales_dict = {}
     for item in sales_details:
-        pid = item['product_id']
+        pid = item.product_id
         if pid not in product_sales_dict:
             product_sales_dict[pid] = {
-                'name': item['product_name'],
+                'name': item.product_name,
                 'total_revenue': 0,
                 'total_quantity': 0
             }
-        product_sales_dict[pid]['total_revenue'] += item['total_amount']
-        product_sales_dict[pid]['total_quantity'] += item['quantity_sold']
+        product_sales_dict[pid]['total_revenue'] += item.total_amount
+        product_sales_dict[pid]['total_quantity'] += item.quantity_sold
     
     # Sort by revenue and quantity
     top_by_revenue = sorted(product_sales_dict.values(), key=lambda x: x['total_revenue'], reverse=True)[:5]
@@ -207,10 +219,10 @@ async def generate_sales_daily_report() -> dict:
             
         except Exception as e:
             error_str = str(e)
-            print(f"[Report-SQLite] LLM report generation error: {e}")
+            logger.error(f"[Report-SQLite] LLM report generation error: {e}")
             # 检查是否是配额错误
             if "429" in error_str or "quota" in error_str.lower():
-                print("[Report-SQLite] API配额不足，使用基础报告模式")
+                logger.warning("[Report-SQLite] API配额不足，使用基础报告模式")
                 # 生成基础版本的专业报告
                 summary_text = f"""📊 每日销售报告 - {today.strftime('%Y年%m月%d日')}
 
@@ -0,0 +1,97 @@
+"""
+Hybrid retrieval for knowledge base datasources.
+
+Dense (FAISS) retrieval misses exact identifiers such as part numbers or SKUs,
+while keyword search misses paraphrases. HybridRetriever runs both - FAISS over
+the chunk embeddings and SQLite FTS5/BM25 over the stored chunk text - and merges
+the two rankings with reciprocal rank fusion (RRF), which needs no score
+normalization between the two retrievers.
+"""
+import asyncio
+from typing import Any, Dict, Hashable, List, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+
+from .db import search_chunk_ids_by_keywords
+from .metrics import track_embedding
+from .timing import span
+
+# Constant of the RRF formula score = sum(1 / (RRF_K + rank)); 60 is the value from the original RRF paper
+RRF_K = 60
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATE_K = 20
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], rrf_k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Fuse several rankings (best first) into one, returning (key, score) pairs sorted by fused score."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def _document_key(document: Document) -> Hashable:
+    """Identify a chunk across retrievers: stored chunks by id, chunks built on the fly by content."""
+    chunk_id = document.metadata.get("chunk_id")
+    return ("chunk", chunk_id) if chunk_id is not None else ("text", document.page_content)
+
+class HybridRetriever(BaseRetriever):
+    """Retriever fusing FAISS similarity search with BM25 keyword search over the stored chunks."""
+
+    vector_store: FAISS
+    # Stored chunks by chunk id; only these are present in the full-text index
+    documents_by_chunk_id: Dict[int, Document]
+    # File records whose chunks may be returned by keyword search
+    files: List[Dict[str, Any]]
+    k: int = 3
+    candidate_k: int = HYBRID_CANDIDATE_K
+    rrf_k: int = RRF_K
+
+    def _keyword_documents(self, query: str) -> List[Document]:
+        with span("bm25.search"):
+            chunk_ids = search_chunk_ids_by_keywords(query, self.files, limit=self.candidate_k)
+        return [self.documents_by_chunk_id[chunk_id] for chunk_id in chunk_ids if chunk_id in self.documents_by_chunk_id]
+
+    def _fuse(self, dense_documents: List[Document], keyword_documents: List[Document]) -> List[Document]:
+        documents_by_key: Dict[Hashable, Document] = {}
+        for document in dense_documents + keyword_documents:
+            documents_by_key.setdefault(_document_key(document), document)
+        dense_keys = [_document_key(document) for document in dense_documents]
+        keyword_keys = [_document_key(document) for document in keyword_documents]
+
+        results = []
+        for key, score in reciprocal_rank_fusion([dense_keys, keyword_keys], self.rrf_k)[:self.k]:
+            document = documents_by_key[key]
+            retrieved_by = [name for name, keys in (("dense", dense_keys), ("keyword", keyword_keys)) if key in keys]
+            results.append(Document(
+                page_content=document.page_content,
+                metadata={**document.metadata, "retrieval_score": round(score, 6), "retrieved_by": retrieved_by}
+            ))
+        return results
+
+    def _dense_documents(self, query: str) -> List[Document]:
+        # Query embedding and index search are timed separately: the first dominates with local models
+        with span("embedding"), track_embedding("query", 1):
+            query_vector = self.vector_store.embeddings.embed_query(query)
+        with span("faiss.search"):
+            return self.vector_store.similarity_search_by_vector(query_vector, k=self.candidate_k)
+
+    async def _adense_documents(self, query: str) -> List[Document]:
+        with span("embedding"), track_embedding("query", 1):
+            query_vector = await self.vector_store.embeddings.aembed_query(query)
+        with span("faiss.search"):
+            return await self.vector_store.asimilarity_search_by_vector(query_vector, k=self.candidate_k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        dense_documents = self._dense_documents(query)
+        keyword_documents = self._keyword_documents(query)
+        return self._fuse(dense_documents, keyword_documents)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        dense_documents, keyword_documents = await asyncio.gather(
+            self._adense_documents(query),
+            asyncio.to_thread(self._keyword_documents, query)
+        )
+        return self._fuse(dense_documents, keyword_documents)
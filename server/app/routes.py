@@ -1,35 +1,61 @@
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, UploadFile, File, Form, BackgroundTasks
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import os
 import uuid
+import hashlib
+import time
+import hmac
+import asyncio
 import aiofiles
 from pathlib import Path
 from .models import (
-    QueryRequest, QueryResponse, 
+    QueryRequest, QueryResponse, FederatedQueryRequest,
     BaseResponse,
     DataSourceCreate, DataSourceUpdate, DataSource, DataSourceResponse, DataSourceListResponse,
-    FileInfo, FileListResponse, ProcessingStatus, FileType, DataSourceType
+    FileInfo, FileListResponse, ProcessingStatus, FileType, DataSourceType, StorageEngine, VectorIndexType, VectorQuantization,
+    TableProfile, TableProfileResponse
 )
 from .agent import (
     get_answer_from_erp, 
+    stream_answer_from_erp,
     initialize_app_state
 )
 from .db import (
     # Data source management functions
-    get_datasources, get_datasource, create_datasource, update_datasource,
+    get_datasources_page, get_datasource, create_datasource, update_datasource,
     delete_datasource, set_active_datasource, get_active_datasource,
     # File management functions
-    save_file_info, get_files_by_datasource, update_file_processing_status,
-    delete_file_record_and_associated_data
+    save_file_info, get_files_page, update_file_processing_status,
+    delete_file_record_and_associated_data,
+    # Table statistics
+    get_table_profile,
+    # ERP data listings
+    fetch_products_page, fetch_sales_page
 )
 from .utils import (
     create_api_response, parse_query_intent
 )
 from .file_processor import process_uploaded_file
+from .analytics import is_duckdb_available
+from .vector_index import invalidate_vector_index
+from .records import serialize_records
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError
+from .federation import federated_query, resolve_federated_datasources, FEDERATED_SOURCE_TIMEOUT_SECONDS
+from .timing import span
+from .metrics import observe_query
+from .slow_query_log import get_slow_queries, clear_slow_queries
+from .profiling import (
+    ProfilerError, ProfileNotFoundError, PROFILE_INTERVAL_MS, start_cpu_profile, stop_cpu_profile, get_cpu_profile,
+    take_memory_snapshot, list_memory_snapshots, memory_snapshot_collapsed, diff_memory_snapshots, stop_memory_tracing
+)
+from config import Config
 import json
+import logging
 import sqlite3
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["Smart ERP API"])
 
@@ -81,15 +107,19 @@ async def download_sample_data_file(filename: str):
 # ==================== Data Source Management API ====================
 
 @router.get("/api/v1/datasources", response_model=DataSourceListResponse, summary="Get Data Source List")
-async def get_datasources_list():
-    """Get a list of all data sources"""
+async def get_datasources_list(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                               cursor: Optional[str] = Query(None, description="next_cursor of the previous page")):
+    """Get a page of data sources (by id; the active one is at /datasources/active). Follow next_cursor for the following pages."""
     try:
-        datasources = await get_datasources()
+        datasources, next_cursor = await get_datasources_page(limit, cursor)
         return DataSourceListResponse(
             success=True,
             data=datasources,
+            next_cursor=next_cursor,
             message=f"Retrieved {len(datasources)} data sources"
         )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         return DataSourceListResponse(
             success=False,
@@ -101,10 +131,22 @@ async def get_datasources_list():
 async def create_datasource_api(request: DataSourceCreate):
     """Create a new data source"""
     try:
+        if request.storage_engine == StorageEngine.DUCKDB:
+            if request.type != DataSourceType.SQL_TABLE_FROM_FILE:
+                return DataSourceResponse(success=False, error="The DuckDB storage engine is only supported for SQL table datasources.")
+            if not is_duckdb_available():
+                return DataSourceResponse(success=False, error="The DuckDB storage engine is not installed on this server (requires 'duckdb' and 'duckdb-engine').")
+        if ((request.vector_index_type != VectorIndexType.FLAT or request.vector_quantization != VectorQuantization.FLOAT32)
+                and request.type != DataSourceType.KNOWLEDGE_BASE):
+            return DataSourceResponse(success=False, error="Vector index types and quantization are only supported for knowledge base datasources.")
+
         datasource = await create_datasource(
             name=request.name,
             description=request.description,
-            ds_type=request.type.value
+            ds_type=request.type.value,
+            storage_engine=request.storage_engine.value,
+            vector_index_type=request.vector_index_type.value,
+            vector_quantization=request.vector_quantization.value
         )
         
         if datasource:
@@ -227,6 +269,7 @@ async def delete_datasource_api(datasource_id: int):
     try:
         success = await delete_datasource(datasource_id)
         if success:
+            invalidate_vector_index(datasource_id)
             return BaseResponse(
                 success=True,
                 message=f"Data source {datasource_id} deleted successfully"
@@ -309,15 +352,20 @@ async def upload_file(
         if not datasource:
             raise HTTPException(status_code=404, detail="Data source not found")
 
-        # Generate unique filename
+        # Content-addressed storage: identical uploads share one stored file named by their SHA-256
         file_extension = os.path.splitext(file.filename)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}{file_extension}"
+        content = await file.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        unique_filename = f"{content_hash}{file_extension}"
         file_path = UPLOAD_DIR / unique_filename
 
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        # Save file only if this content has not been stored before
+        is_new_content = not file_path.exists()
+        if is_new_content:
+            partial_path = UPLOAD_DIR / f"{unique_filename}.{uuid.uuid4().hex}.part"
+            async with aiofiles.open(partial_path, 'wb') as f:
+                await f.write(content)
+            os.replace(partial_path, file_path)
 
         # Determine file type
         file_type_mapping = {
@@ -338,7 +386,8 @@ async def upload_file(
             original_filename=file.filename,
             file_type=file_type.value,
             file_size=len(content),
-            datasource_id=datasource_id
+            datasource_id=datasource_id,
+            content_hash=content_hash
         )
         
         if file_id:
@@ -350,53 +399,60 @@ async def upload_file(
                         datasource_id=datasource_id,
                         file_path=Path(str(file_path)), 
                         original_filename=file.filename,
-                        file_type=file_type.value
+                        file_type=file_type.value,
+                        content_hash=content_hash
                     )
                     await update_file_processing_status(file_id, ProcessingStatus.COMPLETED.value)
                 except Exception as processing_error:
                     await update_file_processing_status(file_id, ProcessingStatus.FAILED.value)
-                    print(f"File processing failed: {processing_error}")
+                    logger.error(f"File processing failed: {processing_error}")
             
             return {
                 "success": True,
                 "message": f"File '{file.filename}' uploaded successfully",
                 "file_id": file_id,
                 "filename": unique_filename,
+                "content_hash": content_hash,
+                "deduplicated": not is_new_content,
                 "processing_status": ProcessingStatus.COMPLETED.value if file_type != FileType.UNKNOWN else ProcessingStatus.PENDING.value
             }
         else:
-            # Cleanup uploaded file if DB entry failed
-            if os.path.exists(file_path):
+            # Cleanup uploaded file if DB entry failed (stored content shared with earlier uploads is kept)
+            if is_new_content and os.path.exists(file_path):
                 os.remove(file_path)
             raise HTTPException(status_code=500, detail="Failed to save file information to database.")
 
     except HTTPException:
         raise
     except Exception as e:
-        # General error, attempt cleanup if file_path was defined
-        if 'file_path' in locals() and os.path.exists(file_path):
+        # General error, attempt cleanup if this request stored new content
+        if locals().get('is_new_content') and not locals().get('file_id') and os.path.exists(file_path):
             try:
                 os.remove(file_path)
             except Exception as e_remove:
-                print(f"Failed to remove partially uploaded file {file_path}: {e_remove}")
+                logger.warning(f"Failed to remove partially uploaded file {file_path}: {e_remove}")
         return {"success": False, "error": f"File upload failed: {str(e)}"}
 
 @router.get("/api/v1/datasources/{datasource_id}/files", response_model=FileListResponse, summary="Get Data Source File List")
-async def get_datasource_files(datasource_id: int):
-    """Get all files for a specific data source"""
+async def get_datasource_files(datasource_id: int, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                               cursor: Optional[str] = Query(None, description="next_cursor of the previous page")):
+    """Get a page of files for a specific data source (newest first). Follow next_cursor for the following pages."""
     try:
         datasource = await get_datasource(datasource_id)
         if not datasource:
             raise HTTPException(status_code=404, detail="Data source not found")
         
-        files = await get_files_by_datasource(datasource_id)
+        files, next_cursor = await get_files_page(datasource_id, limit, cursor)
         file_list = [FileInfo(**file_data) for file_data in files]
         
         return FileListResponse(
             success=True,
             data=file_list,
+            next_cursor=next_cursor,
             message=f"Retrieved {len(file_list)} files"
         )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -406,6 +462,36 @@ async def get_datasource_files(datasource_id: int):
             data=[]
         )
 
+@router.get("/api/v1/datasources/{datasource_id}/profile", response_model=TableProfileResponse, summary="Get Data Source Table Profile")
+async def get_datasource_profile(datasource_id: int):
+    """Get the column statistics computed when the data source's table was ingested"""
+    try:
+        datasource = await get_datasource(datasource_id)
+        if not datasource:
+            raise HTTPException(status_code=404, detail="Data source not found")
+        if datasource['type'] != DataSourceType.SQL_TABLE_FROM_FILE.value:
+            raise HTTPException(status_code=400, detail="Table profiles are only available for SQL table data sources")
+        if not datasource.get('db_table_name'):
+            raise HTTPException(status_code=404, detail="Data source has no table yet. Upload a CSV or Excel file first.")
+
+        profile = await get_table_profile(datasource['db_table_name'])
+        if not profile:
+            raise HTTPException(status_code=404, detail=f"No profile available for table {datasource['db_table_name']}")
+
+        return TableProfileResponse(
+            success=True,
+            data=TableProfile(**profile),
+            message=f"Profile of table {profile['table_name']} retrieved successfully"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        return TableProfileResponse(
+            success=False,
+            error=f"Failed to retrieve table profile: {str(e)}",
+            data=None
+        )
+
 @router.delete("/api/v1/datasources/{datasource_id}/files/{file_id}", response_model=BaseResponse, summary="Delete File from Data Source")
 async def delete_file_from_datasource(datasource_id: int, file_id: int):
     """Delete a specific file and its associated data from a data source."""
@@ -420,8 +506,70 @@ async def delete_file_from_datasource(datasource_id: int, file_id: int):
     except Exception as e:
         return BaseResponse(success=False, error=f"An internal server error occurred while deleting File ID {file_id}: {str(e)}")
 
+# ==================== ERP Data Listing API ====================
+
+@router.get("/api/v1/products", response_model=Dict[str, Any], summary="List Products")
+async def list_products(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = Query(None, description="next_cursor of the previous page")):
+    """Get a page of products ordered by product ID. Follow next_cursor for the following pages."""
+    try:
+        products, next_cursor = await fetch_products_page(limit, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return create_api_response(data=serialize_records(products), next_cursor=next_cursor,
+                               message=f"Retrieved {len(products)} products")
+
+@router.get("/api/v1/sales", response_model=Dict[str, Any], summary="List Sales")
+async def list_sales(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     cursor: Optional[str] = Query(None, description="next_cursor of the previous page")):
+    """Get a page of sales, most recent first. Follow next_cursor for the following pages."""
+    try:
+        sales, next_cursor = await fetch_sales_page(limit, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return create_api_response(data=serialize_records(sales), next_cursor=next_cursor,
+                               message=f"Retrieved {len(sales)} sales")
+
 # ==================== Intelligent Q&A API ====================
 
+async def _resolve_query_route(query: str):
+    """Parse the query intent and pick the agent route for the active datasource. Returns (intent, datasource, query type)."""
+    with span("parse_intent"):
+        intent = parse_query_intent(query)
+    active_datasource_dict = await get_active_datasource()
+
+    query_type_for_agent = intent['type']
+    # Default routing logic based on intent and datasource type
+    if active_datasource_dict and active_datasource_dict['type'] != DataSourceType.DEFAULT.value:
+        # If custom data source is active, prioritize RAG or SQL Agent based on its type
+        if active_datasource_dict['type'] == DataSourceType.SQL_TABLE_FROM_FILE.value:
+            query_type_for_agent = "sql_agent"
+        else: # KNOWLEDGE_BASE or other future non-default types
+            query_type_for_agent = "rag"
+    elif intent['type'] not in ["sales", "inventory", "report"]:
+         # If default ERP and intent is unclear, fallback to general ERP / sales
+        query_type_for_agent = "sales"
+    return intent, active_datasource_dict, query_type_for_agent
+
+def _query_api_response(query: str, intent: Dict[str, Any], result: Dict[str, Any], datasource_id: int) -> Dict[str, Any]:
+    """Response body of the Q&A endpoints for an agent result."""
+    return create_api_response(
+        success=True,
+        query=query,
+        query_type=result.get("query_type", intent['type']),
+        intent=intent,
+        answer=result.get("answer", "No answer could be generated."),
+        data=serialize_records(result.get("data", {})),
+        charts=result.get("chart_data"),
+        suggestions=result.get("suggestions", []),
+        datasource_id=datasource_id,
+        source_datasource_name=result.get("source_datasource_name", "Default ERP")
+    )
+
+def _sse_event(event: str, payload: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(serialize_records(payload), default=str, ensure_ascii=False)}\n\n"
+
 @router.post("/api/v1/query", response_model=Dict[str, Any], summary="Intelligent Q&A")
 async def query_endpoint(request: QueryRequest):
     """
@@ -433,42 +581,203 @@ async def query_endpoint(request: QueryRequest):
     - Document/knowledge base queries
     - SQL table queries
     """
+    start = time.perf_counter()
+    query_type_for_agent = "unknown"
     try:
-        intent = parse_query_intent(request.query)
-        active_datasource_dict = await get_active_datasource()
+        intent, active_datasource_dict, query_type_for_agent = await _resolve_query_route(request.query)
         ds_id_for_response = active_datasource_dict['id'] if active_datasource_dict else 1
-        
-        query_type_for_agent = intent['type']
-        # Default routing logic based on intent and datasource type
-        if active_datasource_dict and active_datasource_dict['type'] != DataSourceType.DEFAULT.value:
-            # If custom data source is active, prioritize RAG or SQL Agent based on its type
-            if active_datasource_dict['type'] == DataSourceType.SQL_TABLE_FROM_FILE.value:
-                query_type_for_agent = "sql_agent"
-            else: # KNOWLEDGE_BASE or other future non-default types
-                query_type_for_agent = "rag"
-        elif intent['type'] not in ["sales", "inventory", "report"]:
-             # If default ERP and intent is unclear, fallback to general ERP / sales
-            query_type_for_agent = "sales"
-
-        result = await get_answer_from_erp(request.query, query_type_for_agent, active_datasource=active_datasource_dict)
-        
-        return create_api_response(
-            success=True,
-            query=request.query,
-            query_type=result.get("query_type", intent['type']),
-            intent=intent,
-            answer=result.get("answer", "No answer could be generated."),
-            data=result.get("data", {}),
-            charts=result.get("chart_data"),
-            suggestions=result.get("suggestions", []),
-            datasource_id=ds_id_for_response,
-            source_datasource_name=result.get("source_datasource_name", "Default ERP")
-        )
+
+        # One span per route, so the agent stage of sales, RAG and SQL queries is tracked separately
+        with span(f"agent.{query_type_for_agent}"):
+            result = await get_answer_from_erp(request.query, query_type_for_agent, active_datasource=active_datasource_dict)
+        observe_query(result.get("query_type", query_type_for_agent), result.get("success", True), time.perf_counter() - start)
+        with span("serialize"):
+            return _query_api_response(request.query, intent, result, ds_id_for_response)
         
     except Exception as e:
+        observe_query(query_type_for_agent, False, time.perf_counter() - start)
         return create_api_response(
             success=False,
             error=f"Query processing failed: {str(e)}",
             query=request.query,
             datasource_id=request.datasource_id if hasattr(request, 'datasource_id') else None
-        ) 
\ No newline at end of file
+        )
+
+@router.post("/api/v1/query/stream", summary="Intelligent Q&A (streaming)")
+async def query_stream_endpoint(request: QueryRequest):
+    """
+    Streaming variant of /api/v1/query over Server-Sent Events (text/event-stream).
+
+    Events, in order:
+    - start: intent and route, sent as soon as the query is parsed
+    - context: retrieved document chunks or fetched ERP/SQL data, before the LLM answers
+    - token: answer text as the LLM generates it (zero or more)
+    - answer: the complete response, identical to the /api/v1/query body
+    - error: sent instead of answer if processing fails
+    """
+    async def event_stream():
+        start = time.perf_counter()
+        query_type_for_agent = "unknown"
+        try:
+            intent, active_datasource_dict, query_type_for_agent = await _resolve_query_route(request.query)
+            ds_id_for_response = active_datasource_dict['id'] if active_datasource_dict else 1
+            yield _sse_event("start", {
+                "query": request.query, "intent": intent, "query_type": query_type_for_agent,
+                "datasource_id": ds_id_for_response
+            })
+            async for event, payload in stream_answer_from_erp(request.query, query_type_for_agent, active_datasource=active_datasource_dict):
+                if event == "answer":
+                    observe_query(payload.get("query_type", query_type_for_agent), payload.get("success", True), time.perf_counter() - start)
+                    payload = _query_api_response(request.query, intent, payload, ds_id_for_response)
+                yield _sse_event(event, payload)
+        except Exception as e:
+            observe_query(query_type_for_agent, False, time.perf_counter() - start)
+            yield _sse_event("error", create_api_response(
+                success=False,
+                error=f"Query processing failed: {str(e)}",
+                query=request.query,
+                datasource_id=request.datasource_id
+            ))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Disable proxy buffering so events flush immediately
+    ) 
+
+@router.post("/api/v1/query/federated", response_model=Dict[str, Any], summary="Federated Q&A across data sources")
+async def federated_query_endpoint(request: FederatedQueryRequest):
+    """
+    Ask one question to several data sources at once (default ERP, knowledge bases, SQL tables).
+
+    Sub-queries run concurrently, each bounded by `timeout_seconds`; sources that time out or fail
+    are reported per source without failing the whole query. The answer merges the per-source answers.
+    """
+    start = time.perf_counter()
+    try:
+        datasources = await resolve_federated_datasources(request.datasource_ids)
+        if not datasources:
+            return create_api_response(success=False, error="No data sources to query.", query=request.query)
+
+        result = await federated_query(request.query, datasources, request.timeout_seconds or FEDERATED_SOURCE_TIMEOUT_SECONDS)
+        observe_query("federated", result["data"]["answered"] > 0, time.perf_counter() - start)
+        return create_api_response(
+            success=result["data"]["answered"] > 0,
+            query=request.query,
+            query_type=result["query_type"],
+            intent=result["intent"],
+            answer=result["answer"],
+            data=serialize_records(result["data"]),
+            error=None if result["data"]["answered"] else "No data source returned an answer."
+        )
+    except Exception as e:
+        observe_query("federated", False, time.perf_counter() - start)
+        return create_api_response(
+            success=False,
+            error=f"Federated query failed: {str(e)}",
+            query=request.query
+        )
+
+# ==================== Admin API ====================
+
+def _require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need the X-Admin-Token header to match ADMIN_TOKEN; they are disabled when it is not set."""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not configured)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, Config.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token")
+
+@router.get("/api/v1/admin/slow-queries", response_model=Dict[str, Any], summary="Slow query log",
+            dependencies=[Depends(_require_admin)])
+async def slow_queries_endpoint(limit: Optional[int] = Query(None, ge=1, description="Most recent entries to return")):
+    """
+    SQL statements (application database and SQL agent) slower than SLOW_QUERY_THRESHOLD_MS,
+    most recent first, with their parameters, EXPLAIN QUERY PLAN and the tables they scan in full.
+    """
+    return create_api_response(data=get_slow_queries(limit))
+
+@router.delete("/api/v1/admin/slow-queries", response_model=Dict[str, Any], summary="Clear the slow query log",
+               dependencies=[Depends(_require_admin)])
+async def clear_slow_queries_endpoint():
+    clear_slow_queries()
+    return create_api_response(message="Slow query log cleared")
+
+# Profiles are served as JSON summaries or as collapsed stacks (format=collapsed) for flamegraph.pl / speedscope
+_PROFILE_FORMAT = Query("json", pattern="^(json|collapsed)$", description="json summary, or collapsed stacks for flamegraph tools")
+
+def _profiler_call(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except ProfileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ProfilerError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/api/v1/admin/profile/cpu/start", response_model=Dict[str, Any], summary="Start the sampling CPU profiler",
+             dependencies=[Depends(_require_admin)])
+async def start_cpu_profile_endpoint(
+    duration: float = Query(30, gt=0, description="Seconds to sample before stopping automatically"),
+    interval_ms: float = Query(PROFILE_INTERVAL_MS, ge=1, le=1000, description="Milliseconds between samples"),
+    include_idle: bool = Query(False, description="Also record threads blocked waiting for work")
+):
+    """
+    Sample the Python stacks of all server threads for `duration` seconds, e.g. while an
+    upload is ingested or a knowledge base index is built. Poll GET .../profile/cpu for the result.
+    """
+    return create_api_response(data=_profiler_call(start_cpu_profile, duration, interval_ms, include_idle),
+                               message="CPU profile started")
+
+@router.post("/api/v1/admin/profile/cpu/stop", response_model=Dict[str, Any], summary="Stop the CPU profiler",
+             dependencies=[Depends(_require_admin)])
+async def stop_cpu_profile_endpoint():
+    summary = await asyncio.to_thread(_profiler_call, stop_cpu_profile)
+    return create_api_response(data=summary, message="CPU profile stopped")
+
+@router.get("/api/v1/admin/profile/cpu", summary="CPU profile result", dependencies=[Depends(_require_admin)])
+async def get_cpu_profile_endpoint(
+    format: str = _PROFILE_FORMAT,
+    top: int = Query(25, ge=1, le=500, description="Functions listed in the json summary")
+):
+    """Hottest functions (self and total samples) of the current or last profile, or all its stacks collapsed."""
+    if format == "collapsed":
+        return PlainTextResponse(_profiler_call(get_cpu_profile, collapsed=True))
+    return create_api_response(data=_profiler_call(get_cpu_profile, top=top))
+
+@router.post("/api/v1/admin/profile/memory/snapshots", response_model=Dict[str, Any], summary="Take a tracemalloc snapshot",
+             dependencies=[Depends(_require_admin)])
+async def take_memory_snapshot_endpoint(top: int = Query(20, ge=1, le=500, description="Allocation sites listed")):
+    """
+    Snapshot the allocations traced by tracemalloc, which starts with the first snapshot
+    (that one is the baseline). Diff two snapshots to see what a workload left allocated.
+    """
+    return create_api_response(data=await asyncio.to_thread(take_memory_snapshot, top))
+
+@router.get("/api/v1/admin/profile/memory/snapshots", response_model=Dict[str, Any], summary="List tracemalloc snapshots",
+            dependencies=[Depends(_require_admin)])
+async def list_memory_snapshots_endpoint():
+    return create_api_response(data=list_memory_snapshots())
+
+@router.get("/api/v1/admin/profile/memory/snapshots/{snapshot_id}", summary="Allocations of a snapshot as collapsed stacks",
+            dependencies=[Depends(_require_admin)])
+async def memory_snapshot_endpoint(snapshot_id: int):
+    return PlainTextResponse(await asyncio.to_thread(_profiler_call, memory_snapshot_collapsed, snapshot_id))
+
+@router.get("/api/v1/admin/profile/memory/diff", summary="Diff two tracemalloc snapshots", dependencies=[Depends(_require_admin)])
+async def diff_memory_snapshots_endpoint(
+    base: int = Query(..., description="Earlier snapshot id"),
+    target: int = Query(..., description="Later snapshot id"),
+    format: str = _PROFILE_FORMAT,
+    top: int = Query(20, ge=1, le=500, description="Allocation sites listed in the json summary")
+):
+    """Allocation sites that grew most from `base` to `target`, or the growth by traceback as collapsed stacks."""
+    result = await asyncio.to_thread(_profiler_call, diff_memory_snapshots, base, target, top, format == "collapsed")
+    if format == "collapsed":
+        return PlainTextResponse(result)
+    return create_api_response(data=result)
+
+@router.delete("/api/v1/admin/profile/memory", response_model=Dict[str, Any], summary="Stop tracemalloc",
+               dependencies=[Depends(_require_admin)])
+async def stop_memory_tracing_endpoint():
+    """Stop tracing allocations (and its overhead) and drop the snapshots."""
+    stop_memory_tracing()
+    return create_api_response(message="Memory tracing stopped")
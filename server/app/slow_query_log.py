@@ -0,0 +1,119 @@
+"""
+Slow query log.
+
+Every SQL statement run through `db.get_db_connection` connections and the SQL
+agent's guarded SQLDatabase is timed (execution plus fetching its rows). Statements
+slower than SLOW_QUERY_THRESHOLD_MS are logged with their parameters and their
+EXPLAIN QUERY PLAN, and kept in an in-memory ring buffer of the last
+SLOW_QUERY_LOG_SIZE entries (GET /api/v1/admin/slow-queries).
+
+Each entry lists the tables its plan reads in full (`SCAN`, with or without a
+covering index, as opposed to an index `SEARCH`), e.g. a filter on `DATE(sale_date)`,
+which cannot seek on the sale_date index.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+# Capture EXPLAIN QUERY PLAN for slow statements (one extra planning call per slow statement)
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+# Longest SQL text / parameter text kept per entry
+SLOW_QUERY_MAX_TEXT = 4000
+
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_entries: Deque[Dict[str, Any]] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_lock = threading.Lock()
+_total_slow = 0
+
+def _truncate(text: str) -> str:
+    return text if len(text) <= SLOW_QUERY_MAX_TEXT else text[:SLOW_QUERY_MAX_TEXT] + "..."
+
+def _format_plan(rows: List[Any]) -> List[str]:
+    """EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as indented lines, like the sqlite3 shell."""
+    depths: Dict[int, int] = {0: -1}
+    lines = []
+    for row in rows:
+        node_id, parent_id, detail = row[0], row[1], row[3]
+        depths[node_id] = depths.get(parent_id, -1) + 1
+        lines.append("  " * depths[node_id] + detail)
+    return lines
+
+def explain_sqlite(execute: Callable[[str, Any], Any], sql: str, parameters: Any = ()) -> Optional[List[str]]:
+    """Plan of a statement through `execute(sql, parameters)` returning the plan rows, or None if it cannot be explained."""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        return _format_plan(list(execute(f"EXPLAIN QUERY PLAN {sql}", parameters)))
+    except Exception as e:
+        logger.debug(f"[SlowQuery] EXPLAIN failed for {sql[:200]}: {e}")
+        return None
+
+def _full_scans(plan: Optional[List[str]]) -> List[str]:
+    """Tables the plan reads in full: SCAN steps (also over a covering index), excluding subquery results."""
+    scans = []
+    for line in plan or []:
+        detail = line.strip()
+        if detail.startswith("SCAN ") and not detail.startswith(("SCAN (", "SCAN CONSTANT ROW")):
+            scans.append(detail[len("SCAN "):].split(" ", 1)[0])
+    return scans
+
+def is_slow(elapsed_seconds: float) -> bool:
+    return elapsed_seconds * 1000 >= SLOW_QUERY_THRESHOLD_MS
+
+def record_slow_query(source: str, sql: str, parameters: Any, elapsed_seconds: float,
+                      plan: Optional[List[str]] = None):
+    """Log a slow statement and keep it in the ring buffer."""
+    global _total_slow
+    elapsed_ms = round(elapsed_seconds * 1000, 3)
+    entry = {
+        "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+        "source": source,
+        "elapsed_ms": elapsed_ms,
+        "sql": _truncate(" ".join(sql.split())),
+        "parameters": _truncate(repr(parameters)) if parameters else None,
+        "plan": plan,
+        "full_scans": _full_scans(plan),
+    }
+    with _lock:
+        _entries.append(entry)
+        _total_slow += 1
+    plan_text = " | ".join(line.strip() for line in plan) if plan else "n/a"
+    logger.warning(f"[SlowQuery] {source} statement took {elapsed_ms:.1f} ms: {entry['sql'][:500]} "
+                   f"params={entry['parameters']} plan={plan_text}")
+
+def record_sqlite_statement(source: str, connection: Optional[sqlite3.Connection], sql: str,
+                            parameters: Any, elapsed_seconds: float):
+    """Record a finished SQLite statement if it was slow, explaining it on `connection` (None: no plan)."""
+    if not is_slow(elapsed_seconds):
+        return
+    plan = None
+    if SLOW_QUERY_EXPLAIN and connection is not None:
+        # The base class execute bypasses instrumented connections, so the EXPLAIN itself is not timed
+        plan = explain_sqlite(lambda statement, params: sqlite3.Connection.execute(connection, statement, params), sql, parameters)
+    record_slow_query(source, sql, parameters, elapsed_seconds, plan)
+
+def get_slow_queries(limit: Optional[int] = None) -> Dict[str, Any]:
+    """Most recent slow statements first, with the log settings and the number recorded since startup."""
+    with _lock:
+        entries = list(_entries)
+        total = _total_slow
+    entries.reverse()
+    return {
+        "threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+        "capacity": SLOW_QUERY_LOG_SIZE,
+        "total_recorded": total,
+        "entries": entries[:limit] if limit else entries,
+    }
+
+def clear_slow_queries():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,84 @@
+"""
+NL-to-SQL translation cache for the SQL agent.
+
+Questions are keyed by a normalized form of the question text plus a hash of the
+queried table's schema, and map to the SQL the agent's final answer was based on
+(only single read-only SELECTs on the datasource table are stored or replayed).
+On a hit the cached SQL runs directly against the current table contents, so the
+answer reflects fresh data without another round of LLM calls. A schema change
+(different table or columns) yields a different key, so stale SQL is never reused.
+"""
+import hashlib
+import os
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_community.utilities import SQLDatabase
+
+NL_SQL_CACHE_ENABLED = os.getenv("NL_SQL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+NL_SQL_CACHE_MAX_ENTRIES = int(os.getenv("NL_SQL_CACHE_MAX_ENTRIES", "1000"))
+
+# Rows shown in answers formatted from cached SQL results
+ANSWER_PREVIEW_ROWS = 10
+
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question: Unicode-normalized, lowercased, punctuation and extra whitespace removed."""
+    normalized = unicodedata.normalize("NFKC", question).lower()
+    normalized = _PUNCTUATION_PATTERN.sub(" ", normalized)
+    return _WHITESPACE_PATTERN.sub(" ", normalized).strip()
+
+def compute_schema_hash(db: SQLDatabase, table_names: Sequence[str]) -> str:
+    """Hash of the dialect, table names, column names and column types the SQL was written against."""
+    parts = [db.dialect]
+    for table_name in sorted(table_names):
+        table = db._metadata.tables.get(table_name)
+        columns = [f"{column.name}:{column.type}" for column in table.columns] if table is not None else []
+        parts.append(f"{table_name}({','.join(columns)})")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+def extract_final_sql(intermediate_steps: List[Any]) -> Optional[str]:
+    """
+    Return the query the agent's final answer was based on, from AgentExecutor intermediate steps:
+    the last step's query if it executed without error. None when the agent answered after another
+    tool call or a failed query, since the answer then does not follow from a single query's result.
+    """
+    if not intermediate_steps:
+        return None
+    action, observation = intermediate_steps[-1]
+    if getattr(action, "tool", None) != "sql_db_query":
+        return None
+    if isinstance(observation, str) and observation.startswith("Error"):
+        return None
+    tool_input = action.tool_input
+    if isinstance(tool_input, dict):
+        tool_input = tool_input.get("query")
+    if isinstance(tool_input, str) and tool_input.strip():
+        return tool_input.strip().rstrip(";").strip()
+    return None
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f"{value:,}"
+    return str(value)
+
+def format_rows_answer(rows: List[Dict[str, Any]], truncated: bool = False) -> str:
+    """Deterministic natural-language rendering of a query result, used when no LLM call is made."""
+    if not rows:
+        return "The query returned no results."
+    if len(rows) == 1 and len(rows[0]) == 1:
+        column, value = next(iter(rows[0].items()))
+        return f"{column}: {_format_value(value)}"
+
+    lines = []
+    for row in rows[:ANSWER_PREVIEW_ROWS]:
+        lines.append("- " + ", ".join(f"{column}: {_format_value(value)}" for column, value in row.items()))
+    summary = f"The query returned {len(rows)}{'+' if truncated else ''} rows"
+    if len(rows) > ANSWER_PREVIEW_ROWS:
+        summary += f" (showing the first {ANSWER_PREVIEW_ROWS})"
+    return summary + ":\n" + "\n".join(lines)
@@ -0,0 +1,109 @@
+"""
+Single-shot NL-to-SQL for SQL_TABLE_FROM_FILE datasources.
+
+Instead of the SQL agent's multi-step tool loop (list tables, fetch schema, check
+query, run query, answer), the LLM is called once with a compact schema summary of
+the datasource table and asked for a single read-only SELECT. The statement is
+validated here (it may read no table but the datasource table) and executed through
+the guarded database; any failure falls back to the full agent.
+"""
+import os
+import re
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_community.utilities import SQLDatabase
+
+from .sql_guard import GuardedSQLDatabase
+
+SQL_DIRECT_MODE_ENABLED = os.getenv("SQL_DIRECT_MODE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Sample values shown per column in the schema summary
+SCHEMA_SAMPLE_ROWS = 3
+SCHEMA_SAMPLE_VALUE_LENGTH = 40
+_SCHEMA_SUMMARY_CACHE_SIZE = 256
+
+# Marker the LLM returns when a single query cannot answer the question
+NO_SQL_MARKER = "NO_SQL"
+
+_CODE_FENCE_PATTERN = re.compile(r"```(?:sql)?\s*(.*?)```", re.IGNORECASE | re.DOTALL)
+_READ_ONLY_START_PATTERN = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_FORBIDDEN_KEYWORDS_PATTERN = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|DROP|ALTER|CREATE|ATTACH|DETACH|PRAGMA|VACUUM|COPY|INSTALL)\b",
+    re.IGNORECASE
+)
+
+_schema_summary_cache: "OrderedDict[str, str]" = OrderedDict()
+
+def get_schema_summary(db: SQLDatabase, table_name: str, schema_hash: str) -> str:
+    """
+    Compact description of a table (column names, types and a few sample values),
+    cached per schema hash so the sample query runs once per table layout.
+    """
+    if schema_hash in _schema_summary_cache:
+        _schema_summary_cache.move_to_end(schema_hash)
+        return _schema_summary_cache[schema_hash]
+
+    table = db._metadata.tables[table_name]
+    column_names = [column.name for column in table.columns]
+    quoted_columns = ", ".join(f'"{name}"' for name in column_names)
+    sample_rows = db._execute(f'SELECT {quoted_columns} FROM "{table_name}" LIMIT {SCHEMA_SAMPLE_ROWS}')
+
+    lines = [f'Table "{table_name}" ({db.dialect}):']
+    for column in table.columns:
+        samples = []
+        for row in sample_rows:
+            value = row.get(column.name)
+            if value is not None and str(value) not in samples:
+                samples.append(str(value)[:SCHEMA_SAMPLE_VALUE_LENGTH])
+        sample_text = f" e.g. {', '.join(repr(sample) for sample in samples)}" if samples else ""
+        lines.append(f'- "{column.name}" {column.type}{sample_text}')
+    summary = "\n".join(lines)
+
+    _schema_summary_cache[schema_hash] = summary
+    if len(_schema_summary_cache) > _SCHEMA_SUMMARY_CACHE_SIZE:
+        _schema_summary_cache.popitem(last=False)
+    return summary
+
+def build_direct_sql_prompt(question: str, schema_summary: str, dialect: str, max_rows: int) -> str:
+    """Prompt asking for exactly one read-only query answering the question."""
+    return f"""You translate questions into a single {dialect} SQL query.
+
+{schema_summary}
+
+Rules:
+- Return only one SELECT statement, with no explanation and no code fences.
+- Use only the table and columns listed above, quoting column names with double quotes.
+- Columns declared as TEXT may hold numbers or dates; CAST them (e.g. CAST("amount" AS REAL)) for arithmetic and comparisons.
+- Prefer aggregation (SUM, COUNT, AVG, GROUP BY) over returning raw rows, and never return more than {max_rows} rows (use LIMIT).
+- If the question cannot be answered with one query on this table, return exactly {NO_SQL_MARKER}.
+
+Question: {question}
+SQL:"""
+
+def extract_sql_from_completion(completion: str) -> Optional[str]:
+    """Pull the SQL statement out of an LLM completion, or None if the model declined."""
+    text = completion.strip()
+    fenced = _CODE_FENCE_PATTERN.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    if not text or text.upper().startswith(NO_SQL_MARKER):
+        return None
+    return text.rstrip().rstrip(";").strip()
+
+def validate_direct_sql(sql: str, table_name: str, db: GuardedSQLDatabase) -> Optional[str]:
+    """Return a reason the generated SQL must not be executed, or None if it is acceptable."""
+    if ";" in sql:
+        return "multiple statements"
+    if not _READ_ONLY_START_PATTERN.match(sql):
+        return "not a SELECT statement"
+    if _FORBIDDEN_KEYWORDS_PATTERN.search(sql):
+        return "contains a data-modifying keyword"
+    # The statement runs on the whole database, not only the datasource table the agent is scoped to
+    try:
+        tables = db.tables_read(sql)
+    except Exception as e:
+        return f"does not compile ({e})"
+    if tables != {table_name.lower()}:
+        return f"reads {', '.join(sorted(tables)) or 'no table'} instead of only table {table_name}"
+    return None
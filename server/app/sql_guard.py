@@ -0,0 +1,342 @@
+"""
+Execution guard rails for SQL generated by the SQL agent.
+
+GuardedSQLDatabase is a drop-in replacement for LangChain's SQLDatabase that, for
+every query the agent runs:
+  - inspects the query plan and rejects full scans of very large tables that are
+    neither aggregated nor limited by their outermost query, as well as nested-loop
+    (cross join) scans of large tables;
+  - interrupts the statement once it exceeds a wall-clock timeout (SQLite progress
+    handler, DuckDB interrupt);
+  - caps the number of rows fetched into the agent's context.
+
+Rejected and aborted queries are reported back to the agent as "Error: ..." tool
+output so it can rewrite the query, and are counted in process-wide metrics.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .metrics import observe_sql, register_collector
+from .slow_query_log import SLOW_QUERY_EXPLAIN, explain_sqlite, is_slow, record_slow_query
+
+logger = logging.getLogger(__name__)
+
+SQL_GUARD_MAX_ROWS = int(os.getenv("SQL_GUARD_MAX_ROWS", "200"))
+SQL_GUARD_TIMEOUT_SECONDS = float(os.getenv("SQL_GUARD_TIMEOUT_SECONDS", "15"))
+SQL_GUARD_LARGE_TABLE_ROWS = int(os.getenv("SQL_GUARD_LARGE_TABLE_ROWS", "100000"))
+
+# Number of SQLite VM instructions between progress handler callbacks
+_PROGRESS_HANDLER_INSTRUCTIONS = 10000
+
+_AGGREGATE_PATTERN = re.compile(r"\b(COUNT|SUM|AVG|MIN|MAX|TOTAL|GROUP_CONCAT|STRING_AGG)\s*\(|\bGROUP\s+BY\b|\bSELECT\s+DISTINCT\b", re.IGNORECASE)
+# LIMIT n [OFFSET m] (or SQLite's LIMIT m, n) closing the outermost query (see _outer_query)
+_OUTER_LIMIT_PATTERN = re.compile(r"\bLIMIT\s+\d+(?:\s+OFFSET\s+\d+|\s*,\s*\d+)?\s*$", re.IGNORECASE)
+_SQL_COMMENT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_SQL_STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_SUBQUERY_START_PATTERN = re.compile(r"\s*(SELECT|WITH|VALUES)\b", re.IGNORECASE)
+_TABLE_ALIAS_PATTERN = re.compile(r'(?:\bFROM|\bJOIN|,)\s*["`\[]?(\w+)["`\]]?(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SQLITE_SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+_DUCKDB_SCAN_TABLE_PATTERN = re.compile(r"Table:\s*([\w.]+)")
+_DUCKDB_NESTED_LOOP_OPERATORS = ("CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN")
+_SQL_KEYWORDS_AFTER_TABLE = {"where", "group", "order", "limit", "join", "inner", "left", "right", "full", "cross", "on", "natural", "union", "having", "using", "outer"}
+
+class QueryGuardError(Exception):
+    """Raised when a query is rejected or aborted by the SQL guard."""
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+def _outer_query(command: str) -> str:
+    """
+    The outermost query of a statement: comments and the final semicolon removed, string literals
+    emptied, and the bodies of parenthesized subqueries and CTEs dropped (other parentheses, such as
+    function calls, are kept).
+    """
+    statement = _SQL_STRING_PATTERN.sub("''", _SQL_COMMENT_PATTERN.sub(" ", command))
+    levels: List[List[str]] = [[]]  # Text of every open parenthesis, outermost first
+    for char in statement:
+        if char == "(":
+            levels.append([])
+        elif char == ")" and len(levels) > 1:
+            inner = "".join(levels.pop())
+            levels[-1].append("()" if _SUBQUERY_START_PATTERN.match(inner) else f"({inner})")
+        else:
+            levels[-1].append(char)
+    return "(".join("".join(level) for level in levels).strip().rstrip(";").strip()
+
+def _has_outer_limit(command: str) -> bool:
+    """Whether the outermost query ends with a LIMIT."""
+    return bool(_OUTER_LIMIT_PATTERN.search(_outer_query(command)))
+
+def _is_outer_aggregate(command: str) -> bool:
+    """Whether the outermost query aggregates; aggregates inside subqueries or CTEs do not bound its result."""
+    return bool(_AGGREGATE_PATTERN.search(_outer_query(command)))
+
+_stats_lock = threading.Lock()
+_guard_stats: Dict[str, int] = defaultdict(int)
+
+def _record(event: str):
+    with _stats_lock:
+        _guard_stats[event] += 1
+
+def get_sql_guard_stats() -> Dict[str, Any]:
+    """Snapshot of guard counters (executed, rejected, timed out, truncated queries) and active limits."""
+    with _stats_lock:
+        counters = dict(_guard_stats)
+    return {
+        "queries_executed": counters.get("executed", 0),
+        "queries_rejected_full_scan": counters.get("rejected_full_scan", 0),
+        "queries_rejected_cross_join": counters.get("rejected_cross_join", 0),
+        "queries_timed_out": counters.get("timed_out", 0),
+        "results_truncated": counters.get("truncated", 0),
+        "limits": {
+            "max_rows": SQL_GUARD_MAX_ROWS,
+            "timeout_seconds": SQL_GUARD_TIMEOUT_SECONDS,
+            "large_table_rows": SQL_GUARD_LARGE_TABLE_ROWS,
+        },
+    }
+
+def _collect_metrics():
+    with _stats_lock:
+        counters = dict(_guard_stats)
+    yield "sql_guard_events", "counter", "Guarded datasource queries by outcome (executed, rejected_*, timed_out, truncated).", [
+        ({"event": event}, count) for event, count in sorted(counters.items())
+    ]
+
+register_collector(_collect_metrics)
+
+class GuardedSQLDatabase(SQLDatabase):
+    """SQLDatabase whose query execution is bounded in plan shape, time and result size."""
+
+    def __init__(self, *args, max_rows: int = SQL_GUARD_MAX_ROWS, timeout_seconds: float = SQL_GUARD_TIMEOUT_SECONDS,
+                 large_table_rows: int = SQL_GUARD_LARGE_TABLE_ROWS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._max_rows = max_rows
+        self._timeout_seconds = timeout_seconds
+        self._large_table_rows = large_table_rows
+        self._table_row_estimates: Dict[str, int] = {}
+        self._last_truncated = False
+
+    @property
+    def max_rows(self) -> int:
+        """Rows returned at most per query; longer results are truncated."""
+        return self._max_rows
+
+    def tables_read(self, command: str) -> Set[str]:
+        """
+        Lower-cased names of the tables a statement reads, including through subqueries, CTEs and views,
+        without executing it: from the SQLite authorizer while the statement compiles, or from the scans of
+        the DuckDB plan (where scans the optimizer proves empty are left out). Table-valued functions
+        (pragma_table_info, read_csv, duckdb_tables, ...) are reported by their function name.
+        """
+        tables: Set[str] = set()
+        with self._engine.connect() as connection:
+            if self.dialect == "sqlite":
+                driver_connection = connection.connection.driver_connection
+
+                def _authorizer(action, arg1, _arg2, _db_name, _trigger):
+                    if action == sqlite3.SQLITE_READ and arg1:
+                        tables.add(arg1.lower())
+                    return sqlite3.SQLITE_OK
+
+                driver_connection.set_authorizer(_authorizer)
+                try:
+                    driver_connection.execute(f"EXPLAIN {command}")
+                finally:
+                    driver_connection.set_authorizer(None)
+            elif self.dialect == "duckdb":
+                rows = connection.execute(text(f"EXPLAIN (FORMAT JSON) {command}")).fetchall()
+                nodes = [node for row in rows for node in json.loads(row[-1])]
+                while nodes:
+                    node = nodes.pop()
+                    extra_info = node.get("extra_info") or {}
+                    if extra_info.get("Table"):
+                        tables.add(extra_info["Table"].split(".")[-1].lower())
+                    elif extra_info.get("Function"):
+                        tables.add(extra_info["Function"].lower())
+                    nodes.extend(node.get("children") or [])
+        return tables
+
+    def run(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        self._last_truncated = False
+        result = super().run(command, fetch, include_columns, parameters=parameters, execution_options=execution_options)
+        if self._last_truncated and isinstance(result, str):
+            result += f"\n(Result truncated to the first {self._max_rows} rows. Use aggregation or a LIMIT to narrow the query.)"
+        return result
+
+    def run_no_throw(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        try:
+            return super().run_no_throw(command, fetch, include_columns, parameters=parameters, execution_options=execution_options)
+        except QueryGuardError as e:
+            return f"Error: {e}"
+
+    def fetch_rows(self, command: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """Execute a query under the guard and return (rows as dicts, whether the result was truncated)."""
+        self._last_truncated = False
+        rows = self._execute(command)
+        return list(rows), self._last_truncated
+
+    def _execute(self, command, fetch="all", *, parameters=None, execution_options=None):
+        if not isinstance(command, str) or fetch == "cursor" or self.dialect not in ("sqlite", "duckdb"):
+            return super()._execute(command, fetch, parameters=parameters, execution_options=execution_options)
+
+        with self._engine.begin() as connection:
+            self._check_plan(connection, command, parameters or {})
+            driver_connection = connection.connection.driver_connection
+            timed_out = threading.Event()
+            deadline = time.monotonic() + self._timeout_seconds
+            timer = None
+
+            if self.dialect == "sqlite":
+                def _progress_handler():
+                    if time.monotonic() > deadline:
+                        timed_out.set()
+                        return 1  # Non-zero interrupts the running statement
+                    return 0
+                driver_connection.set_progress_handler(_progress_handler, _PROGRESS_HANDLER_INSTRUCTIONS)
+            else:
+                def _interrupt():
+                    timed_out.set()
+                    driver_connection.interrupt()
+                timer = threading.Timer(self._timeout_seconds, _interrupt)
+                timer.daemon = True
+                timer.start()
+
+            started = time.perf_counter()
+            try:
+                cursor = connection.execute(text(command), parameters or {}, execution_options=execution_options or {})
+                if not cursor.returns_rows:
+                    self._observe_statement(driver_connection, command, parameters, started)
+                    _record("executed")
+                    return []
+                limit = 1 if fetch == "one" else self._max_rows
+                rows = cursor.fetchmany(limit + 1)
+                cursor.close()
+                self._observe_statement(driver_connection, command, parameters, started)
+            except Exception as e:
+                if timed_out.is_set():
+                    if self.dialect == "sqlite":
+                        driver_connection.set_progress_handler(None, 0)  # Let the plan of the aborted query be captured
+                    self._observe_statement(driver_connection, command, parameters, started)
+                    _record("timed_out")
+                    logger.warning(f"[SQLGuard] Query aborted after {self._timeout_seconds}s: {command}")
+                    raise QueryGuardError(
+                        "timeout",
+                        f"Query aborted: it exceeded the {self._timeout_seconds:g}s time limit. Simplify the query, filter more rows or aggregate."
+                    ) from e
+                raise
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                elif self.dialect == "sqlite":
+                    driver_connection.set_progress_handler(None, 0)
+
+        _record("executed")
+        if fetch != "one" and len(rows) > self._max_rows:
+            rows = rows[:self._max_rows]
+            self._last_truncated = True
+            _record("truncated")
+            logger.info(f"[SQLGuard] Result truncated to {self._max_rows} rows: {command}")
+        return [row._asdict() for row in rows[:limit]]
+
+    def _observe_statement(self, driver_connection, command: str, parameters: Optional[Dict[str, Any]], started: float):
+        """Record a finished statement in the SQLite metrics and, when slow, in the slow query log with its plan."""
+        elapsed = time.perf_counter() - started
+        if self.dialect == "sqlite":
+            observe_sql("sql_agent", command, elapsed)
+        if is_slow(elapsed):
+            plan = None
+            if SLOW_QUERY_EXPLAIN and self.dialect == "sqlite":
+                plan = explain_sqlite(driver_connection.execute, command, parameters or {})
+            record_slow_query("sql_agent", command, parameters, elapsed, plan)
+
+    def _check_plan(self, connection, command: str, parameters: Dict[str, Any]):
+        """Reject queries whose plan scans large tables without bounding the result."""
+        scans, nested_loop_groups = self._plan_scans(connection, command, parameters)
+        large_scans = [table for table in scans if self._estimate_rows(connection, table) > self._large_table_rows]
+        if not large_scans:
+            return
+
+        for group in nested_loop_groups:
+            large_in_group = [table for table in group if table in large_scans]
+            if len(large_in_group) >= 2:
+                _record("rejected_cross_join")
+                logger.warning(f"[SQLGuard] Rejected nested-loop scan of large tables {large_in_group}: {command}")
+                raise QueryGuardError(
+                    "cross_join",
+                    "Query rejected: it joins large tables without a usable join condition (cross join). Add a join condition on matching columns."
+                )
+
+        if not _has_outer_limit(command) and not _is_outer_aggregate(command):
+            _record("rejected_full_scan")
+            logger.warning(f"[SQLGuard] Rejected unbounded full scan of {large_scans}: {command}")
+            raise QueryGuardError(
+                "full_scan",
+                f"Query rejected: it reads every row of a large table ({', '.join(sorted(set(large_scans)))}) without aggregation or a LIMIT. "
+                "Aggregate the data (COUNT/SUM/AVG/GROUP BY) or add a LIMIT."
+            )
+
+    def _plan_scans(self, connection, command: str, parameters: Dict[str, Any]) -> Tuple[List[str], List[List[str]]]:
+        """
+        Return the tables read by full scans and groups of tables scanned inside the same
+        nested loop. Scans that cannot be mapped back to a table (e.g. subqueries) are ignored.
+        """
+        if self.dialect == "sqlite":
+            aliases = self._alias_map(command)
+            plan = connection.execute(text(f"EXPLAIN QUERY PLAN {command}"), parameters).fetchall()
+            scans: List[str] = []
+            by_parent: Dict[int, List[str]] = defaultdict(list)
+            for _node_id, parent_id, _unused, detail in plan:
+                match = _SQLITE_SCAN_PATTERN.match(detail)
+                if not match:
+                    continue
+                table = aliases.get(match.group(1).lower())
+                if table:
+                    scans.append(table)
+                    by_parent[parent_id].append(table)
+            return scans, list(by_parent.values())
+
+        plan_text = "\n".join(str(row[-1]) for row in connection.execute(text(f"EXPLAIN {command}"), parameters).fetchall())
+        scans = [name.split(".")[-1] for name in _DUCKDB_SCAN_TABLE_PATTERN.findall(plan_text)]
+        known_tables = {name.lower(): name for name in self.get_usable_table_names()}
+        scans = [known_tables[name.lower()] for name in scans if name.lower() in known_tables]
+        nested_groups = [scans] if any(op in plan_text for op in _DUCKDB_NESTED_LOOP_OPERATORS) else []
+        return scans, nested_groups
+
+    def _alias_map(self, command: str) -> Dict[str, str]:
+        """Map table names and their aliases in the statement to usable table names."""
+        known_tables = {name.lower(): name for name in self.get_usable_table_names()}
+        aliases = dict(known_tables)
+        for table, alias in _TABLE_ALIAS_PATTERN.findall(command):
+            table_name = known_tables.get(table.lower())
+            if table_name and alias and alias.lower() not in _SQL_KEYWORDS_AFTER_TABLE:
+                aliases[alias.lower()] = table_name
+        return aliases
+
+    def _estimate_rows(self, connection, table_name: str) -> int:
+        """Cheap row count estimate for a table, cached for the lifetime of this object."""
+        if table_name not in self._table_row_estimates:
+            try:
+                if self.dialect == "sqlite":
+                    row = connection.execute(text(f'SELECT MAX(rowid) FROM "{table_name}"')).fetchone()
+                else:
+                    row = connection.execute(
+                        text("SELECT estimated_size FROM duckdb_tables() WHERE table_name = :table_name"),
+                        {"table_name": table_name}
+                    ).fetchone()
+                self._table_row_estimates[table_name] = int(row[0] or 0) if row else 0
+            except SQLAlchemyError as e:
+                logger.warning(f"[SQLGuard] Could not estimate size of table '{table_name}': {e}")
+                self._table_row_estimates[table_name] = 0
+        return self._table_row_estimates[table_name]
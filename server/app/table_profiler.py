@@ -0,0 +1,276 @@
+"""
+Column statistics for tables built from uploaded files.
+
+The profile is computed once at ingestion time from the DataFrames being written
+(so no extra pass over the stored table is needed) and persisted in the
+table_profiles metadata table. Prompt builders and the profile API read it
+instead of sampling the table on every question.
+
+Distinct counts use a vectorized HyperLogLog sketch, so multi-sheet uploads can
+be profiled sheet by sheet and merged without holding every distinct value.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# HyperLogLog precision: 2^14 registers, ~0.8% standard error
+HLL_PRECISION = 14
+# Most frequent values kept per column
+PROFILE_TOP_K = 5
+# Longest string stored for min/max/top values
+PROFILE_VALUE_MAX_LENGTH = 60
+# Above this many distinct values, top values are counted on the first TOP_K_SAMPLE_ROWS rows only
+TOP_K_EXACT_MAX_DISTINCT = 10000
+TOP_K_SAMPLE_ROWS = 10000
+# Rows checked before attempting a full numeric/date parse of a text column
+TYPE_PROBE_ROWS = 1000
+
+class HyperLogLog:
+    """HyperLogLog cardinality sketch operating on arrays of 64-bit hashes."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = np.zeros(self.num_registers, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add an array of uint64 hashes to the sketch."""
+        if len(hashes) == 0:
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        register_index = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        remaining_bits = 64 - self.precision
+        remainder = hashes & np.uint64((1 << remaining_bits) - 1)
+        # Rank = position of the leftmost 1-bit within the remaining bits (remaining_bits + 1 if all zero)
+        rank = (remaining_bits - _bit_length(remainder) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, register_index, rank)
+
+    def add_series(self, values: pd.Series):
+        """Hash and add the non-null values of a Series."""
+        values = values.dropna()
+        if not values.empty:
+            # categorize=False skips factorizing the column first, which dominates on high-cardinality text
+            self.add_hashes(pd.util.hash_pandas_object(values, index=False, categorize=False).to_numpy())
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        """Estimated number of distinct values added."""
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        empty_registers = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty_registers:
+            # Small-range correction (linear counting)
+            estimate = m * np.log(m / empty_registers)
+        return int(round(estimate))
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length() for uint64 arrays (exact: works on 32-bit halves)."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp returns the exponent e with value = mantissa * 2**e, 0.5 <= mantissa < 1, i.e. the bit length
+    high_bits = np.frexp(high)[1]
+    low_bits = np.frexp(low)[1]
+    return np.where(high > 0, high_bits + 32, low_bits)
+
+def _json_value(value: Any) -> Any:
+    """Convert numpy/pandas scalars into JSON-friendly Python values."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, str) and len(value) > PROFILE_VALUE_MAX_LENGTH:
+        return value[:PROFILE_VALUE_MAX_LENGTH]
+    return value
+
+def _all_iso_dates(values: pd.Series) -> bool:
+    """Whether every string starts with a YYYY-MM-DD date (vectorized over UCS-4 code points)."""
+    if values.str.len().min() < 10:
+        return False
+    codes = values.to_numpy(dtype="U10").view(np.uint32).reshape(-1, 10)
+    digits = codes[:, [0, 1, 2, 3, 5, 6, 8, 9]]
+    return bool(np.all((codes[:, 4] == ord("-")) & (codes[:, 7] == ord("-")))
+                and np.all((digits >= ord("0")) & (digits <= ord("9"))))
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if value.is_integer() else str(value)
+
+class _ColumnAccumulator:
+    """Statistics for one column, accumulated over one or more DataFrames."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.null_count = 0
+        self.non_null_count = 0
+        self.all_numeric = True
+        self.all_integral = True
+        self.all_date_like = True
+        self.is_datetime_dtype = False
+        self.is_bool_dtype = False
+        self.hll = HyperLogLog()
+        self.numeric_min: Optional[float] = None
+        self.numeric_max: Optional[float] = None
+        self.text_min: Optional[str] = None
+        self.text_max: Optional[str] = None
+        self.value_counts: Optional[pd.Series] = None
+
+    def add_missing(self, row_count: int):
+        self.null_count += row_count
+
+    def add(self, series: pd.Series):
+        non_null = series.dropna()
+        self.null_count += len(series) - len(non_null)
+        self.non_null_count += len(non_null)
+        if non_null.empty:
+            return
+        self.hll.add_series(non_null)
+        self.is_datetime_dtype |= pd.api.types.is_datetime64_any_dtype(non_null)
+        self.is_bool_dtype |= pd.api.types.is_bool_dtype(non_null)
+
+        was_numeric = self.all_numeric
+        if self.is_datetime_dtype or self.is_bool_dtype:
+            self.all_numeric = False
+        if self.all_numeric:
+            self._add_numeric(non_null)
+        if not self.all_numeric:
+            if was_numeric and self.numeric_min is not None:
+                # Earlier frames were numeric only; carry their range over as text
+                self.text_min, self.text_max = _format_number(self.numeric_min), _format_number(self.numeric_max)
+            self._add_text(non_null)
+
+        # Exact top-k is only meaningful (and cheap) for low-cardinality columns; otherwise count a sample
+        if self.hll.count() > TOP_K_EXACT_MAX_DISTINCT:
+            counts = non_null.iloc[:TOP_K_SAMPLE_ROWS].value_counts()
+        else:
+            counts = non_null.value_counts()
+        self.value_counts = counts if self.value_counts is None else self.value_counts.add(counts, fill_value=0)
+
+    def _add_numeric(self, non_null: pd.Series):
+        if pd.api.types.is_numeric_dtype(non_null):
+            numeric = non_null
+        else:
+            # Probe a sample first so text columns skip a full (slow) numeric parse
+            if pd.to_numeric(non_null.iloc[:TYPE_PROBE_ROWS], errors="coerce").isna().any():
+                self.all_numeric = False
+                return
+            numeric = pd.to_numeric(non_null, errors="coerce")
+            if numeric.isna().any():
+                self.all_numeric = False
+                return
+        values = numeric.to_numpy(dtype=np.float64)
+        self.all_integral &= bool(np.all(np.mod(values, 1) == 0))
+        low, high = float(values.min()), float(values.max())
+        self.numeric_min = low if self.numeric_min is None else min(self.numeric_min, low)
+        self.numeric_max = high if self.numeric_max is None else max(self.numeric_max, high)
+
+    def _add_text(self, non_null: pd.Series):
+        # Lexical range; ISO dates and timestamps sort correctly as text
+        if pd.api.types.is_datetime64_any_dtype(non_null) or pd.api.types.is_bool_dtype(non_null):
+            low, high = str(non_null.min()), str(non_null.max())
+        else:
+            as_text = non_null.astype(str)
+            if self.all_date_like:
+                self.all_date_like = _all_iso_dates(as_text.iloc[:TYPE_PROBE_ROWS]) and _all_iso_dates(as_text)
+            low, high = as_text.min(), as_text.max()
+        self.text_min = low if self.text_min is None else min(self.text_min, low)
+        self.text_max = high if self.text_max is None else max(self.text_max, high)
+
+    def inferred_type(self) -> str:
+        if self.non_null_count == 0:
+            return "empty"
+        if self.is_bool_dtype:
+            return "boolean"
+        if self.is_datetime_dtype:
+            return "datetime"
+        if self.all_numeric:
+            return "integer" if self.all_integral else "float"
+        if self.all_date_like:
+            return "date"
+        return "text"
+
+    def result(self, row_count: int, storage_type: str) -> Dict[str, Any]:
+        inferred_type = self.inferred_type()
+        if inferred_type in ("integer", "float"):
+            minimum, maximum = self.numeric_min, self.numeric_max
+            if inferred_type == "integer" and minimum is not None:
+                minimum, maximum = int(minimum), int(maximum)
+        else:
+            minimum, maximum = self.text_min, self.text_max
+
+        top_values: List[Dict[str, Any]] = []
+        if self.value_counts is not None:
+            for value, count in self.value_counts.nlargest(PROFILE_TOP_K).items():
+                top_values.append({"value": _json_value(value), "count": int(count)})
+
+        return {
+            "name": self.name,
+            "storage_type": storage_type,
+            "inferred_type": inferred_type,
+            "null_fraction": round(self.null_count / row_count, 4) if row_count else 0.0,
+            "distinct_count": min(self.hll.count(), self.non_null_count),
+            "min": _json_value(minimum),
+            "max": _json_value(maximum),
+            "top_values": top_values,
+        }
+
+def profile_frames(frames: List[pd.DataFrame], storage_types: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Profile the union of DataFrames that make up one table (e.g. the sheets of a workbook).
+    storage_types maps column names to the column type used by the storage engine.
+    """
+    storage_types = storage_types or {}
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    accumulators = {col: _ColumnAccumulator(col) for col in columns}
+    row_count = 0
+    for frame in frames:
+        row_count += len(frame)
+        for col, accumulator in accumulators.items():
+            if col in frame.columns:
+                accumulator.add(frame[col])
+            else:
+                accumulator.add_missing(len(frame))
+
+    return {
+        "row_count": row_count,
+        "columns": [accumulators[col].result(row_count, storage_types.get(col, "TEXT")) for col in columns],
+    }
+
+def duckdb_storage_types(frames: List[pd.DataFrame]) -> Dict[str, str]:
+    """Approximate DuckDB column types for frames written through analytics.write_frames_to_table."""
+    if not frames:
+        return {}
+    types = {}
+    for col, dtype in frames[0].dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            types[col] = "BOOLEAN"
+        elif pd.api.types.is_integer_dtype(dtype):
+            types[col] = "BIGINT"
+        elif pd.api.types.is_float_dtype(dtype):
+            types[col] = "DOUBLE"
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            types[col] = "TIMESTAMP"
+        else:
+            types[col] = "VARCHAR"
+    return types
+
+def format_profile_summary(table_name: str, profile: Dict[str, Any], dialect: str) -> str:
+    """Compact, prompt-ready description of a profiled table."""
+    lines = [f'Table "{table_name}" ({dialect}, {profile.get("row_count", 0)} rows):']
+    for column in profile.get("columns", []):
+        details = [column["inferred_type"]]
+        if column["null_fraction"]:
+            details.append(f"{column['null_fraction']:.0%} null")
+        details.append(f"~{column['distinct_count']} distinct")
+        if column["min"] is not None and column["inferred_type"] in ("integer", "float", "date", "datetime"):
+            details.append(f"range {column['min']} .. {column['max']}")
+        top_values = [repr(str(item["value"])) for item in column.get("top_values", [])[:3]]
+        if top_values and column["inferred_type"] not in ("float",):
+            details.append(f"e.g. {', '.join(top_values)}")
+        lines.append(f'- "{column["name"]}" {column["storage_type"]}: {"; ".join(details)}')
+    return "\n".join(lines)
@@ -0,0 +1,252 @@
+"""
+Lightweight per-stage latency instrumentation.
+
+Code marks pipeline stages with `span("name")` (a context manager) or the `@timed`
+decorator. Each finished span is recorded twice:
+  - in the trace of the current request (a context variable set by TimingMiddleware),
+    returned to the client as a standard `Server-Timing` header when timing is enabled
+    (TIMING_HEADER_ENABLED, or per request with `X-Debug-Timing: 1`);
+  - in a process-wide latency histogram per span name (get_timing_histograms), also
+    exported as the smarterp_stage_duration_seconds Prometheus metric.
+
+LLM calls are additionally attributed to the route template of the request that made
+them (`current_route`), for the per-route token and cost metrics.
+
+Spans are inclusive (a nested span's time also counts towards its parent). Spans
+finished after the response headers were sent (e.g. while streaming) only reach the
+histograms.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .metrics import (
+    HTTP_REQUEST_DURATION, HTTP_REQUESTS, LLM_COST, LLM_REQUEST_DURATION, LLM_REQUESTS, LLM_TOKENS, STAGE_DURATION,
+    model_name, token_usage
+)
+from .token_budget import count_tokens, generations_text, llm_cost_usd, messages_text
+
+# Send the Server-Timing header on every response (otherwise only when the request asks with X-Debug-Timing: 1)
+TIMING_HEADER_ENABLED = os.getenv("TIMING_HEADER_ENABLED", "false").lower() == "true"
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is unbounded
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_current_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("timing_trace", default=None)
+# ASGI scope of the current request; routing fills in its "route" while the request is handled
+_current_scope: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("timing_scope", default=None)
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float):
+        for index, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                break
+        else:
+            index = len(HISTOGRAM_BUCKETS_MS)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the maximum for the unbounded bucket)."""
+        rank, seen = q * self.count, 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return float(HISTOGRAM_BUCKETS_MS[index]) if index < len(HISTOGRAM_BUCKETS_MS) else round(self.max_ms, 3)
+        return 0.0
+
+_histograms: Dict[str, _Histogram] = {}
+_histograms_lock = threading.Lock()
+
+def _observe(name: str, elapsed_ms: float):
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram()
+        histogram.observe(elapsed_ms)
+
+def record_span(name: str, elapsed_ms: float):
+    """Record a finished stage in the current request trace and the histograms of its name."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append((name, elapsed_ms))
+    _observe(name, elapsed_ms)
+    STAGE_DURATION.observe(elapsed_ms / 1000, stage=name)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage `name` (usable in sync and async code)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, (time.perf_counter() - start) * 1000)
+
+def timed(name: Optional[str] = None):
+    """Decorator timing every call of a sync or async function as a span (default name: <module>.<function>)."""
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def summarize_trace(trace: List[Tuple[str, float]]) -> List[Tuple[str, float, int]]:
+    """Per-stage totals of a trace as (name, total ms, calls), in order of first occurrence."""
+    totals: Dict[str, List[float]] = {}
+    for name, elapsed_ms in trace:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += elapsed_ms
+        entry[1] += 1
+    return [(name, total, int(calls)) for name, (total, calls) in totals.items()]
+
+def format_server_timing(trace: List[Tuple[str, float]], total_ms: float) -> str:
+    """Server-Timing header value: one metric per stage, with the call count when a stage ran more than once."""
+    metrics = [f"total;dur={total_ms:.1f}"]
+    for name, elapsed_ms, calls in summarize_trace(trace):
+        metrics.append(f'{name};dur={elapsed_ms:.1f}' + (f';desc="x{calls}"' if calls > 1 else ""))
+    return ", ".join(metrics)
+
+def get_timing_histograms() -> Dict[str, Dict[str, Any]]:
+    """Latency histogram of every span name: count, sum/avg/max, approximate p50/p95/p99 and cumulative buckets."""
+    with _histograms_lock:
+        snapshot = {name: (list(h.counts), h.count, h.sum_ms, h.max_ms, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                    for name, h in _histograms.items()}
+    histograms = {}
+    for name, (counts, count, sum_ms, max_ms, p50, p95, p99) in sorted(snapshot.items()):
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip([*HISTOGRAM_BUCKETS_MS, "+Inf"], counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        histograms[name] = {
+            "count": count, "sum_ms": round(sum_ms, 3), "avg_ms": round(sum_ms / count, 3) if count else 0.0,
+            "max_ms": round(max_ms, 3), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "buckets": buckets,
+        }
+    return histograms
+
+def reset_timing_histograms():
+    with _histograms_lock:
+        _histograms.clear()
+
+def _route_path(scope: Dict[str, Any]) -> str:
+    # Route templates (not raw paths) keep the number of histograms and metric series bounded
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+def current_route() -> str:
+    """Route template of the request being handled, or "none" outside requests (startup, background work)."""
+    scope = _current_scope.get()
+    return _route_path(scope) if scope is not None else "none"
+
+class LLMTimingCallback(BaseCallbackHandler):
+    """
+    Records every LLM call as an "llm" span and in the LLM metrics (calls, latency, and
+    token usage and estimated cost by route and model), including the calls made inside
+    chains and agents. Tokens are counted locally when the provider reports no usage
+    (e.g. streamed responses). Attached to the LLM itself (`callbacks=[LLM_TIMING_CALLBACK]`);
+    runs inline so the span lands in the trace of the request that made the call.
+    """
+
+    run_inline = True
+
+    def __init__(self, span_name: str = "llm"):
+        self.span_name = span_name
+        self._starts: Dict[UUID, Tuple[float, str, str, str]] = {}
+
+    def _start(self, run_id: UUID, serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any], prompt_text: str):
+        self._starts[run_id] = (time.perf_counter(), model_name(serialized, kwargs.get("invocation_params")), current_route(), prompt_text)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, serialized, kwargs, "\n".join(prompts))
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, serialized, kwargs, messages_text(messages))
+
+    def _finish(self, run_id: UUID, status: str, response: Any = None):
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        start, model, route, prompt_text = started
+        elapsed = time.perf_counter() - start
+        record_span(self.span_name, elapsed * 1000)
+        LLM_REQUESTS.inc(model=model, status=status)
+        LLM_REQUEST_DURATION.observe(elapsed, model=model)
+        if response is not None:
+            prompt_tokens, completion_tokens = token_usage(response)
+            if not prompt_tokens and not completion_tokens:
+                prompt_tokens, completion_tokens = count_tokens(prompt_text), count_tokens(generations_text(response))
+            LLM_TOKENS.inc(prompt_tokens, route=route, model=model, kind="prompt")
+            LLM_TOKENS.inc(completion_tokens, route=route, model=model, kind="completion")
+            LLM_COST.inc(llm_cost_usd(model, prompt_tokens, completion_tokens), route=route, model=model)
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, "ok", response)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, "error")
+
+LLM_TIMING_CALLBACK = LLMTimingCallback()
+
+class TimingMiddleware:
+    """ASGI middleware opening a trace per HTTP request and adding the Server-Timing header to its response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace: List[Tuple[str, float]] = []
+        token = _current_trace.set(trace)
+        scope_token = _current_scope.set(scope)
+        start = time.perf_counter()
+        send_header = TIMING_HEADER_ENABLED or (b"x-debug-timing", b"1") in scope.get("headers", [])
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if send_header:
+                    header = format_server_timing(trace, (time.perf_counter() - start) * 1000)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            _current_scope.reset(scope_token)
+            route_path = _route_path(scope)
+            elapsed = time.perf_counter() - start
+            _observe(f"http {scope['method']} {route_path}", elapsed * 1000)
+            HTTP_REQUESTS.inc(method=scope["method"], route=route_path, status=status_code)
+            HTTP_REQUEST_DURATION.observe(elapsed, method=scope["method"], route=route_path)
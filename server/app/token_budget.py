@@ -0,0 +1,173 @@
+"""
+Token accounting and prompt budgets for LLM calls.
+
+Tokens are counted with tiktoken (the encoding of OPENAI_MODEL, cl100k_base for
+models it does not know) once the encoding is loaded, otherwise - while it loads, or
+offline without a TIKTOKEN_CACHE_DIR - estimated from the text length. tiktoken may
+download the encoding file, so it is loaded in a background thread that startup waits
+for at most TOKENIZER_LOAD_TIMEOUT seconds, never on the event loop. LLMTimingCallback
+uses the count when a provider reports no usage, and records every call's tokens
+and estimated cost per route.
+
+Prompts that embed data keep it under PROMPT_TOKEN_BUDGET with `fit_prompt`: tables
+are rendered CSV-style by `format_table` (column names once, no per-row quotes or
+braces), and when the prompt is still too long rows are dropped from the end of the
+least important table first, leaving a note of how many were left out.
+"""
+import csv
+import io
+import json
+import logging
+import math
+import os
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence, Tuple
+
+from .metrics import PROMPT_ROWS_DROPPED, PROMPT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the tokens of a data-bearing prompt (instructions plus embedded tables)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+# "tiktoken" (exact for OpenAI models, falls back to the estimate if the encoding cannot be loaded) or "estimate"
+TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "tiktoken").lower()
+# Seconds application startup waits for the tiktoken encoding before serving with estimates
+TOKENIZER_LOAD_TIMEOUT = float(os.getenv("TOKENIZER_LOAD_TIMEOUT", "10"))
+# Characters per token for the estimate (about 4 for English text, fewer for CJK)
+CHARS_PER_TOKEN = float(os.getenv("TOKEN_ESTIMATE_CHARS_PER_TOKEN", "4"))
+# USD per million tokens for all models, and per-model overrides: {"gpt-4o-mini": [0.15, 0.6], ...}
+LLM_PROMPT_PRICE_PER_1M = float(os.getenv("LLM_PROMPT_PRICE_PER_1M", "0"))
+LLM_COMPLETION_PRICE_PER_1M = float(os.getenv("LLM_COMPLETION_PRICE_PER_1M", "0"))
+LLM_MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    model: (float(prices[0]), float(prices[1])) for model, prices in json.loads(os.getenv("LLM_MODEL_PRICES", "{}")).items()
+}
+DEFAULT_TOKENIZER_ENCODING = "cl100k_base"
+
+_encoding = None
+_encoding_thread: Optional[threading.Thread] = None
+_encoding_lock = threading.Lock()
+
+def _load_encoding():
+    global _encoding
+    try:
+        import tiktoken
+        model = (os.getenv("OPENAI_MODEL") or "").rsplit("/", 1)[-1]
+        try:
+            _encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encoding = tiktoken.get_encoding(DEFAULT_TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(f"[TokenBudget] tiktoken encoding unavailable ({e}). Estimating tokens from text length.")
+
+def start_encoding_load() -> Optional[threading.Thread]:
+    """Start loading the tiktoken encoding in a background thread (once). Returns the thread, None when disabled."""
+    global _encoding_thread
+    if TOKEN_COUNTER != "tiktoken":
+        return None
+    with _encoding_lock:
+        if _encoding_thread is None:
+            _encoding_thread = threading.Thread(target=_load_encoding, name="tiktoken-load", daemon=True)
+            _encoding_thread.start()
+    return _encoding_thread
+
+def wait_for_encoding(timeout: float = TOKENIZER_LOAD_TIMEOUT) -> bool:
+    """Block until the encoding is loaded or `timeout` seconds passed (call off the event loop). Returns whether it is loaded."""
+    thread = start_encoding_load()
+    if thread is not None:
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"[TokenBudget] tiktoken encoding not loaded after {timeout:g}s. Estimating tokens until it is.")
+    return _encoding is not None
+
+def count_tokens(text: str) -> int:
+    """Number of tokens of `text` (exact with tiktoken, otherwise estimated)."""
+    if not text:
+        return 0
+    encoding = _encoding
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    if _encoding_thread is None:
+        start_encoding_load()
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def llm_cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated cost of a call from the configured prices (0 when none are configured)."""
+    prompt_price, completion_price = LLM_MODEL_PRICES.get(model, (LLM_PROMPT_PRICE_PER_1M, LLM_COMPLETION_PRICE_PER_1M))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+# ================== Compact Data Formatting ==================
+
+def _cell(value: Any, float_digits: int) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return round(value, float_digits)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    return value
+
+def format_table(rows: Sequence[Mapping[str, Any]], columns: Optional[Sequence[str]] = None, float_digits: int = 2) -> str:
+    """Render rows (dicts or records) as CSV with a header line. Columns default to those of the first row."""
+    if not rows:
+        return "(no rows)"
+    columns = list(columns or rows[0].keys())
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_cell(row.get(column) if hasattr(row, "get") else row[column], float_digits) for column in columns])
+    return output.getvalue().rstrip("\n")
+
+def format_fields(values: Mapping[str, Any], float_digits: int = 2) -> str:
+    """Render scalar values as 'name: value' lines."""
+    return "\n".join(f"{name}: {_cell(value, float_digits)}" for name, value in values.items())
+
+def _render_tables(tables: Dict[str, Sequence[Mapping[str, Any]]], limits: Dict[str, int]) -> Dict[str, str]:
+    rendered = {}
+    for name, rows in tables.items():
+        omitted = len(rows) - limits[name]
+        if not omitted:
+            rendered[name] = format_table(rows)
+        elif limits[name]:
+            rendered[name] = format_table(rows[:limits[name]]) + f"\n... ({omitted} more rows omitted)"
+        else:
+            rendered[name] = f"({omitted} rows omitted)"
+    return rendered
+
+def fit_prompt(prompt_name: str, render: Callable[[Dict[str, str]], str], tables: Dict[str, Sequence[Mapping[str, Any]]],
+               budget: Optional[int] = None) -> str:
+    """
+    Build a prompt within `budget` tokens (default PROMPT_TOKEN_BUDGET).
+    `render` receives the formatted tables by name; `tables` are given most important first, and rows are
+    dropped from the end of the least important non-empty table until the prompt fits (or no rows are left).
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    limits = {name: len(rows) for name, rows in tables.items()}
+    prompt = render(_render_tables(tables, limits))
+    tokens = count_tokens(prompt)
+    while tokens > budget:
+        name = next((name for name in reversed(tables) if limits[name]), None)
+        if name is None:
+            logger.warning(f"[TokenBudget] Prompt '{prompt_name}' needs {tokens} tokens without any data rows (budget {budget}).")
+            break
+        # Drop about as many rows as the excess is worth, at least one per round
+        row_tokens = count_tokens(format_table(tables[name][:limits[name]])) / limits[name]
+        limits[name] = max(0, limits[name] - max(1, math.ceil((tokens - budget) / max(row_tokens, 1.0))))
+        prompt = render(_render_tables(tables, limits))
+        tokens = count_tokens(prompt)
+
+    dropped = sum(len(rows) - limits[name] for name, rows in tables.items())
+    if dropped:
+        PROMPT_ROWS_DROPPED.inc(dropped, prompt=prompt_name)
+        logger.info(f"[TokenBudget] Left {dropped} data rows out of prompt '{prompt_name}' to fit {budget} tokens ({tokens} tokens).")
+    PROMPT_TOKENS.observe(tokens, prompt=prompt_name)
+    return prompt
+
+def messages_text(messages: Sequence[Sequence[Any]]) -> str:
+    """Text of the chat message batches passed to a chat model callback."""
+    return "\n".join(str(getattr(message, "content", message)) for batch in messages for message in batch)
+
+def generations_text(response: Any) -> str:
+    """Completion text of an LLMResult."""
+    return "".join(generation.text for generations in getattr(response, "generations", None) or [] for generation in generations)
@@ -0,0 +1,167 @@
+"""
+Vector index construction and compressed embedding storage for knowledge bases.
+
+Each knowledge base datasource chooses:
+  - an index type: exact "flat" search, "hnsw" graph search, or "ivf_pq"
+    (inverted lists with product-quantized codes) for large corpora;
+  - a quantization for stored vectors and flat/HNSW index codes: "float32",
+    "float16" (half the size) or "int8" (a quarter, with a per-vector scale).
+
+Stored chunk embeddings record their format, so chunks shared by content hash
+between datasources with different settings decode correctly. Built indexes are
+kept in a small per-datasource LRU cache keyed by the datasource's completed files
+and index settings, so repeated questions do not rebuild (or retrain) the index.
+"""
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .models import VectorIndexType, VectorQuantization
+from .metrics import VECTOR_INDEX_CACHE_LOOKUPS, register_collector
+
+logger = logging.getLogger(__name__)
+
+# HNSW graph degree and search breadth (higher: better recall, more memory/latency)
+HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
+# IVF-PQ inverted lists probed per query; the number of lists is derived from the corpus size
+IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+# Dimensions per PQ sub-quantizer (8 bits each): 384-dim embeddings become 48-byte codes
+IVF_PQ_DIMS_PER_SUBQUANTIZER = 8
+# Below this many vectors IVF-PQ cannot be trained meaningfully; flat search is used instead
+IVF_PQ_MIN_VECTORS = int(os.getenv("VECTOR_IVF_PQ_MIN_VECTORS", "10000"))
+# Built indexes kept in memory (one per datasource)
+VECTOR_INDEX_CACHE_SIZE = int(os.getenv("VECTOR_INDEX_CACHE_SIZE", "8"))
+
+_SCALAR_QUANTIZER_TYPES = {
+    VectorQuantization.FLOAT16.value: faiss.ScalarQuantizer.QT_fp16,
+    VectorQuantization.INT8.value: faiss.ScalarQuantizer.QT_8bit,
+}
+
+# ================== Stored Embedding Encoding ==================
+
+def encode_vectors(vectors: np.ndarray, quantization: str = VectorQuantization.FLOAT32.value) -> List[bytes]:
+    """
+    Encode a (n, d) float array into one blob per vector.
+    int8 blobs start with the float32 scale of the vector, followed by d signed bytes.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if quantization == VectorQuantization.FLOAT16.value:
+        return [vector.tobytes() for vector in vectors.astype(np.float16)]
+    if quantization == VectorQuantization.INT8.value:
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return [scale.tobytes() + code.tobytes() for scale, code in zip(scales.astype(np.float32), codes)]
+    return [vector.tobytes() for vector in vectors]
+
+def decode_embedding(blob: bytes, embedding_format: Optional[str] = None) -> np.ndarray:
+    """Decode a stored embedding blob into a float32 vector. Chunks stored before quantization have no format (float32)."""
+    if embedding_format == VectorQuantization.FLOAT16.value:
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if embedding_format == VectorQuantization.INT8.value:
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32)
+
+# ================== Index Construction ==================
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest number of sub-quantizers dividing the dimension with ~IVF_PQ_DIMS_PER_SUBQUANTIZER dims each."""
+    target = max(1, dimension // IVF_PQ_DIMS_PER_SUBQUANTIZER)
+    for m in range(target, 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def create_faiss_index(dimension: int, num_vectors: int, index_type: str = VectorIndexType.FLAT.value,
+                       quantization: str = VectorQuantization.FLOAT32.value) -> faiss.Index:
+    """Create an empty (possibly untrained) FAISS L2 index for the given settings."""
+    qtype = _SCALAR_QUANTIZER_TYPES.get(quantization)
+
+    if index_type == VectorIndexType.IVF_PQ.value:
+        if num_vectors >= IVF_PQ_MIN_VECTORS:
+            # ~sqrt(n) lists keeps both the coarse search and the list scans short
+            nlist = max(1, min(int(np.sqrt(num_vectors)), num_vectors // 39))
+            index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, _pq_subquantizers(dimension), 8)
+            index.nprobe = min(IVF_NPROBE, nlist)
+            return index
+        logger.info(f"[VectorIndex] {num_vectors} vectors are too few to train IVF-PQ (minimum {IVF_PQ_MIN_VECTORS}). Using flat search.")
+        index_type = VectorIndexType.FLAT.value
+
+    if index_type == VectorIndexType.HNSW.value:
+        index = faiss.IndexHNSWSQ(dimension, qtype, HNSW_M) if qtype is not None else faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    return faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_L2) if qtype is not None else faiss.IndexFlatL2(dimension)
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = VectorIndexType.FLAT.value,
+                      quantization: str = VectorQuantization.FLOAT32.value) -> faiss.Index:
+    """Create, train (if needed) and fill an index with a (n, d) float32 array."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = create_faiss_index(vectors.shape[1], len(vectors), index_type, quantization)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+def build_vector_store(texts: Sequence[str], metadatas: Sequence[Dict[str, Any]], vectors: np.ndarray, embeddings: Embeddings,
+                       index_type: str = VectorIndexType.FLAT.value,
+                       quantization: str = VectorQuantization.FLOAT32.value) -> FAISS:
+    """Wrap an index built with the datasource's settings in LangChain's FAISS vector store."""
+    index = build_faiss_index(vectors, index_type, quantization)
+    docstore_ids = [str(i) for i in range(len(texts))]
+    docstore = InMemoryDocstore({
+        docstore_id: Document(page_content=text, metadata=metadata)
+        for docstore_id, text, metadata in zip(docstore_ids, texts, metadatas)
+    })
+    return FAISS(embeddings, index, docstore, dict(enumerate(docstore_ids)))
+
+# ================== Per-Datasource Index Cache ==================
+
+_index_cache: "OrderedDict[int, Tuple[str, Any]]" = OrderedDict()
+
+def vector_index_fingerprint(files: List[Dict[str, Any]], index_type: str, quantization: str) -> str:
+    """Identify the indexed content of a datasource: its completed files plus the index settings."""
+    digest = hashlib.sha256(f"{index_type}|{quantization}".encode())
+    for file_info in sorted(files, key=lambda f: f['id']):
+        digest.update(f"|{file_info['id']}:{file_info.get('content_hash')}:{file_info.get('processed_chunks')}".encode())
+    return digest.hexdigest()
+
+def get_cached_vector_index(datasource_id: int, fingerprint: str) -> Optional[Any]:
+    """Return the cached index entry of a datasource if it was built from the same content, else None."""
+    entry = _index_cache.get(datasource_id)
+    if entry is None or entry[0] != fingerprint:
+        VECTOR_INDEX_CACHE_LOOKUPS.inc(result="miss")
+        return None
+    VECTOR_INDEX_CACHE_LOOKUPS.inc(result="hit")
+    _index_cache.move_to_end(datasource_id)
+    return entry[1]
+
+def cache_vector_index(datasource_id: int, fingerprint: str, value: Any):
+    """Store a built index entry for a datasource, evicting the least recently used datasource."""
+    _index_cache[datasource_id] = (fingerprint, value)
+    _index_cache.move_to_end(datasource_id)
+    while len(_index_cache) > VECTOR_INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+
+def invalidate_vector_index(datasource_id: int):
+    """Drop the cached index of a datasource (e.g. when it is deleted)."""
+    _index_cache.pop(datasource_id, None)
+
+def _collect_metrics():
+    yield "vector_index_cache_entries", "gauge", "Built vector indexes held in the cache.", [({}, len(_index_cache))]
+
+register_collector(_collect_metrics)
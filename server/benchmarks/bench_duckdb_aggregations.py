@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+SQLite vs DuckDB Aggregation Benchmark
+
+Compares the aggregate queries the SQL agent typically generates (SUM, GROUP BY,
+top-N, COUNT DISTINCT) on an uploaded-table style dataset stored in SQLite
+(all TEXT columns, as created by file ingestion) and in DuckDB (typed columns).
+
+Usage:
+    python benchmarks/bench_duckdb_aggregations.py --rows 10000000
+    python benchmarks/bench_duckdb_aggregations.py --rows 1000000 --repeat 5 --output duckdb_bench.json
+"""
+
+import sys
+import argparse
+import json
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+TABLE_NAME = "dstable_bench_sales"
+INSERT_BATCH_ROWS = 200_000
+
+# Queries in the shape the SQL agent produces for aggregate questions
+QUERIES = {
+    "total_revenue": f'SELECT SUM(total_amount) FROM "{TABLE_NAME}"',
+    "revenue_by_category": f'SELECT category, SUM(total_amount) AS revenue FROM "{TABLE_NAME}" GROUP BY category ORDER BY revenue DESC',
+    "monthly_revenue": f'SELECT substr(sale_date, 1, 7) AS month, SUM(total_amount), SUM(quantity_sold) FROM "{TABLE_NAME}" GROUP BY month ORDER BY month',
+    "top10_products": f'SELECT product_name, SUM(quantity_sold) AS units FROM "{TABLE_NAME}" GROUP BY product_name ORDER BY units DESC LIMIT 10',
+    "avg_price_by_region": f'SELECT region, AVG(price_per_unit), COUNT(*) FROM "{TABLE_NAME}" GROUP BY region',
+    "distinct_products": f'SELECT COUNT(DISTINCT product_name) FROM "{TABLE_NAME}"',
+}
+
+def generate_chunk(rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Generate a chunk of sales-like rows."""
+    product_ids = rng.integers(0, 5000, rows)
+    quantity = rng.integers(1, 20, rows)
+    price = np.round(rng.uniform(5, 1500, rows), 2)
+    days = rng.integers(0, 3 * 365, rows)
+    dates = (np.datetime64("2022-01-01") + days.astype("timedelta64[D]")).astype(str)
+    return pd.DataFrame({
+        "product_name": np.char.add("Product ", product_ids.astype(str)),
+        "category": np.char.add("Category ", (product_ids % 40).astype(str)),
+        "region": np.char.add("Region ", (product_ids % 12).astype(str)),
+        "quantity_sold": quantity,
+        "price_per_unit": price,
+        "total_amount": np.round(quantity * price, 2),
+        "sale_date": dates,
+    })
+
+def load_sqlite(db_path: Path, rows: int, seed: int) -> float:
+    """Load rows into SQLite with TEXT columns, mirroring file ingestion. Returns load seconds."""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    columns = list(generate_chunk(1, np.random.default_rng(0)).columns)
+    conn.execute(f'CREATE TABLE "{TABLE_NAME}" ({", ".join(f"{c} TEXT" for c in columns)})')
+    placeholders = ", ".join("?" for _ in columns)
+    remaining = rows
+    while remaining > 0:
+        chunk = generate_chunk(min(INSERT_BATCH_ROWS, remaining), rng)
+        conn.executemany(f'INSERT INTO "{TABLE_NAME}" VALUES ({placeholders})', chunk.itertuples(index=False, name=None))
+        remaining -= len(chunk)
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - start
+
+def load_duckdb(db_path: Path, rows: int, seed: int) -> float:
+    """Load the same rows into DuckDB with inferred column types. Returns load seconds."""
+    rng = np.random.default_rng(seed)
+    conn = duckdb.connect(str(db_path))
+    start = time.perf_counter()
+    remaining = rows
+    first = True
+    while remaining > 0:
+        chunk = generate_chunk(min(INSERT_BATCH_ROWS, remaining), rng)
+        conn.register("incoming_frame", chunk)
+        if first:
+            conn.execute(f'CREATE TABLE "{TABLE_NAME}" AS SELECT * FROM incoming_frame')
+            first = False
+        else:
+            conn.execute(f'INSERT INTO "{TABLE_NAME}" SELECT * FROM incoming_frame')
+        conn.unregister("incoming_frame")
+        remaining -= len(chunk)
+    conn.close()
+    return time.perf_counter() - start
+
+def time_queries(execute, repeat: int) -> dict:
+    """Run each query `repeat` times and return the median and min latency in milliseconds."""
+    results = {}
+    for name, sql in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            execute(sql)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {"median_ms": round(statistics.median(timings), 2), "min_ms": round(min(timings), 2)}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite vs DuckDB on typical SQL agent aggregations")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Number of rows to generate")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data generation")
+    parser.add_argument("--output", type=Path, help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    report = {"rows": args.rows, "repeat": args.repeat, "engines": {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sqlite_path = Path(tmp_dir) / "bench.db"
+        print(f"Loading {args.rows:,} rows into SQLite...")
+        load_seconds = load_sqlite(sqlite_path, args.rows, args.seed)
+        conn = sqlite3.connect(sqlite_path)
+        report["engines"]["sqlite"] = {
+            "load_seconds": round(load_seconds, 2),
+            "queries": time_queries(lambda sql: conn.execute(sql).fetchall(), args.repeat),
+        }
+        conn.close()
+
+        if duckdb is None:
+            print("duckdb is not installed; skipping the DuckDB side of the benchmark.")
+        else:
+            duckdb_path = Path(tmp_dir) / "bench.duckdb"
+            print(f"Loading {args.rows:,} rows into DuckDB...")
+            load_seconds = load_duckdb(duckdb_path, args.rows, args.seed)
+            conn = duckdb.connect(str(duckdb_path), read_only=True)
+            report["engines"]["duckdb"] = {
+                "load_seconds": round(load_seconds, 2),
+                "queries": time_queries(lambda sql: conn.execute(sql).fetchall(), args.repeat),
+            }
+            conn.close()
+
+    print(f"\n{'query':<22}" + "".join(f"{engine:>16}" for engine in report["engines"]))
+    for name in QUERIES:
+        print(f"{name:<22}" + "".join(f"{data['queries'][name]['median_ms']:>14.1f}ms" for data in report["engines"].values()))
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+End-to-End Query Benchmark
+
+Runs the API in-process (uvicorn on a local port, in a background thread) against a
+temporary database, with the LLM and the embedding model replaced by the
+deterministic fakes of benchmarks/fakes.py (fixed time to first token, fixed delay per
+streamed token), and measures POST /api/v1/query for every answering path:
+
+  - sales:      default ERP datasource, sales questions (SQL aggregates + LLM summary)
+  - inventory:  default ERP datasource, stock questions (low-stock lookup + LLM summary)
+  - report:     daily sales report (called through the agent: /api/v1/query never
+                routes to it, intent parsing has no "report" type)
+  - rag:        knowledge base datasource with ingested manuals (hybrid retrieval + LLM)
+  - sql_table:  SQL table datasource built from an ingested CSV (single-shot NL-to-SQL,
+                then the NL-to-SQL cache)
+
+Each scenario is measured at every requested concurrency level: throughput and
+p50/p95/p99 latency (plus time to first token with --stream, over
+/api/v1/query/stream), errors, LLM calls per request and the mean time of each
+pipeline stage (timing spans). The JSON report records the commit, settings and
+machine, and --compare prints the change against a previous report.
+
+Usage:
+    python benchmarks/bench_end_to_end.py
+    python benchmarks/bench_end_to_end.py --concurrency 1,8,32 --requests 200
+    python benchmarks/bench_end_to_end.py --scenarios sales,rag --stream --llm-first-token-ms 300
+    python benchmarks/bench_end_to_end.py --output e2e.json --compare e2e_baseline.json
+"""
+
+import os
+
+# Keep the application's per-request logging out of the measurements
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import sys
+import argparse
+import asyncio
+import json
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import httpx
+import numpy as np
+import uvicorn
+
+from app.main import app  # First: configures logging before the other modules log at import
+from app import agent, db, report
+from app.file_processor import process_uploaded_file, shutdown_ingest_workers
+from app.timing import LLM_TIMING_CALLBACK, get_timing_histograms, reset_timing_histograms
+from benchmarks.fakes import FakeChatModel, HashingEmbeddings
+from scripts.generate_erp_data import day_weights, generate_inventory, generate_products, generate_sales, load_sqlite, product_popularity
+
+SCENARIOS = ["sales", "inventory", "report", "rag", "sql_table"]
+
+QUESTIONS = {
+    "sales": [
+        "What were total sales this month?",
+        "Show sales revenue for the last 7 days",
+        "Which products had the highest sales volume this week?",
+        "What is the sales revenue today?",
+    ],
+    "inventory": [
+        "Which products are low in stock?",
+        "Check inventory levels in the warehouse",
+        "Is stock of P0001 sufficient?",
+    ],
+    "report": ["Generate the daily sales report"],
+    "rag": [
+        "How often should the seals of the pump be inspected?",
+        "What is the maximum pressure of the compressor?",
+        "How do I install the valve?",
+        "The motor keeps overheating, what should I check?",
+    ],
+    "sql_table": [
+        "How many orders are there per region?",
+        "What is the total amount by channel?",
+        "Count orders by product",
+    ],
+}
+
+REGIONS = ["North", "South", "East", "West", "Central"]
+CHANNELS = ["online", "retail", "wholesale", "partner"]
+KINDS = ["pump", "compressor", "valve", "motor", "gearbox", "sensor"]
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def populate_erp(num_products: int, num_sales: int, seed: int):
+    """Products, inventory and sales dated within the last 30 days (scripts/generate_erp_data.py)."""
+    rng = np.random.default_rng(seed)
+    products = generate_products(num_products, rng)
+    popularity = product_popularity(num_products, 1.1, rng)
+    now = datetime.now()
+    days, day_share = day_weights((now - timedelta(days=29)).date(), now.date())
+    inventory = generate_inventory(products, popularity, num_sales, len(days), now, rng)
+    load_sqlite(db.DATABASE_PATH, products, inventory, generate_sales(products, popularity, days, day_share, num_sales, rng))
+
+async def ingest(datasource_id: int, path: Path, file_type: str):
+    file_id = await db.save_file_info(path.name, path.name, file_type, path.stat().st_size, datasource_id)
+    await process_uploaded_file(file_id, datasource_id, path, path.name, file_type)
+
+async def create_knowledge_base(data_dir: Path, num_documents: int, seed: int) -> int:
+    """Knowledge base of product manuals, ingested (chunked and embedded) like uploads."""
+    rng = random.Random(seed)
+    datasource = await db.create_datasource(name="e2e-knowledge-base", ds_type="knowledge_base")
+    for index in range(num_documents):
+        kind = rng.choice(KINDS)
+        path = data_dir / f"manual_{index}.txt"
+        path.write_text(
+            f"Manual for the {kind} model {index}.\n\n"
+            f"Installation: mount the {kind} on a level surface, secure the anchor bolts and verify the rotation direction.\n\n"
+            f"Maintenance: inspect the seals every {rng.choice([250, 500, 1000])} operating hours and replace the filter twice a year.\n\n"
+            f"Specifications: maximum pressure {rng.randint(6, 40)} bar, rated power {round(rng.uniform(0.5, 90), 1)} kW.\n\n"
+            f"Troubleshooting: if the {kind} overheats, clean the cooling fins and check the ambient temperature.\n"
+        )
+        await ingest(datasource["id"], path, "txt")
+    return datasource["id"]
+
+async def create_sql_table(data_dir: Path, num_rows: int, seed: int) -> int:
+    """SQL table datasource from a CSV of orders, ingested like an upload."""
+    rng = random.Random(seed)
+    datasource = await db.create_datasource(name="e2e-sql-table", ds_type="sql_table_from_file")
+    path = data_dir / "orders.csv"
+    with open(path, "w") as csv_file:
+        csv_file.write("order_id,region,channel,product,quantity,amount,order_date\n")
+        start = datetime.now() - timedelta(days=365)
+        for i in range(num_rows):
+            quantity = rng.randint(1, 20)
+            csv_file.write(f"O{i:07d},{rng.choice(REGIONS)},{rng.choice(CHANNELS)},Product {rng.randrange(200)},{quantity},"
+                           f"{round(quantity * rng.uniform(5, 500), 2)},{(start + timedelta(minutes=rng.randrange(525600))).date()}\n")
+    await ingest(datasource["id"], path, "csv")
+    return datasource["id"]
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    cuts = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else [ordered[0]] * 99
+    return {"p50": round(cuts[49], 1), "p95": round(cuts[94], 1), "p99": round(cuts[98], 1),
+            "mean": round(statistics.fmean(ordered), 1), "max": round(ordered[-1], 1)}
+
+async def query_once(client: httpx.AsyncClient, question: str, stream: bool):
+    """(latency ms, time to first token ms or None, succeeded) of one query."""
+    start = time.perf_counter()
+    if not stream:
+        response = await client.post("/api/v1/query", json={"query": question})
+        body = response.json()
+        return (time.perf_counter() - start) * 1000, None, response.status_code == 200 and body.get("success", False)
+
+    first_token_ms, succeeded, event = None, False, None
+    async with client.stream("POST", "/api/v1/query/stream", json={"query": question}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event in ("token", "answer") and first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                succeeded = succeeded or event == "answer"
+    return (time.perf_counter() - start) * 1000, first_token_ms, response.status_code == 200 and succeeded
+
+async def report_once(client: httpx.AsyncClient, question: str, stream: bool):
+    start = time.perf_counter()
+    result = await agent.get_answer_from_erp(question, "report")
+    return (time.perf_counter() - start) * 1000, None, bool(result.get("answer"))
+
+async def run_load(run_query, client, questions, total: int, concurrency: int, stream: bool):
+    """Send `total` queries from `concurrency` concurrent clients; returns (results, wall seconds)."""
+    results = []
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total:
+            question = questions[next_index % len(questions)]
+            next_index += 1
+            try:
+                results.append(await run_query(client, question, stream))
+            except Exception as e:
+                print(f"  request failed: {e}")
+                results.append((None, None, False))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+async def run_scenario(name: str, client: httpx.AsyncClient, datasource_id: int, args, concurrency: int):
+    await db.set_active_datasource(datasource_id)
+    run_query = report_once if name == "report" else query_once
+    stream = args.stream and name != "report"
+    # Warm-up queries build the per-datasource caches (vector index, NL-to-SQL, schema summaries)
+    await run_load(run_query, client, QUESTIONS[name], args.warmup, 1, stream)
+    reset_timing_histograms()
+
+    results, wall_seconds = await run_load(run_query, client, QUESTIONS[name], args.requests, concurrency, stream)
+    latencies = [latency for latency, _, ok in results if ok]
+    first_tokens = [ttft for _, ttft, ok in results if ok and ttft is not None]
+    stages = get_timing_histograms()
+    llm_calls = stages.get("llm", {}).get("count", 0)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        "latency_ms": percentiles(latencies),
+        "first_token_ms": percentiles(first_tokens),
+        "llm_calls_per_request": round(llm_calls / len(results), 2) if results else 0.0,
+        # Mean time per call of each pipeline stage (spans are inclusive of nested stages)
+        "stages_avg_ms": {stage: values["avg_ms"] for stage, values in stages.items() if not stage.startswith("http ")},
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(port: int) -> uvicorn.Server:
+    """Serve the app on a background thread (lifespan off: the benchmark initializes the database itself)."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning", access_log=False))
+    threading.Thread(target=server.run, name="bench-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def compare(report_data, baseline_path: Path):
+    baseline = json.loads(baseline_path.read_text())
+    previous = {(row["scenario"], row["concurrency"]): row for row in baseline["results"]}
+    print(f"\nChange against {baseline_path} (commit {baseline.get('git_commit', '?')}):")
+    print(f"{'scenario':<11}{'conc':>5}{'rps':>14}{'p50 ms':>16}{'p95 ms':>16}")
+    for row in report_data["results"]:
+        old = previous.get((row["scenario"], row["concurrency"]))
+        if not old or not old["latency_ms"] or not row["latency_ms"]:
+            continue
+
+        def delta(new_value, old_value):
+            return f"{(new_value - old_value) / old_value * 100:+.1f}%" if old_value else "n/a"
+
+        print(f"{row['scenario']:<11}{row['concurrency']:>5}{delta(row['throughput_rps'], old['throughput_rps']):>14}"
+              f"{delta(row['latency_ms']['p50'], old['latency_ms']['p50']):>16}{delta(row['latency_ms']['p95'], old['latency_ms']['p95']):>16}")
+
+async def run_benchmark(args, data_dir: Path):
+    print(f"Generating {args.sales} sales rows, {args.documents} documents and a {args.table_rows}-row SQL table...")
+    populate_erp(args.products, args.sales, args.seed)
+    datasource_ids = {"sales": 1, "inventory": 1, "report": 1}
+    if "rag" in args.scenarios:
+        datasource_ids["rag"] = await create_knowledge_base(data_dir, args.documents, args.seed)
+    if "sql_table" in args.scenarios:
+        datasource_ids["sql_table"] = await create_sql_table(data_dir, args.table_rows, args.seed)
+
+    server = start_server(free_port())
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.config.port}", timeout=300) as client:
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    print(f"Measuring {name} at concurrency {concurrency}...")
+                    results.append(await run_scenario(name, client, datasource_ids[name], args, concurrency))
+    finally:
+        server.should_exit = True
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/v1/query end to end with a fake LLM and fake embeddings")
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=SCENARIOS, help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")], default=[1, 8],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Measured requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests per scenario before measuring")
+    parser.add_argument("--stream", action="store_true", help="Use /api/v1/query/stream and report time to first token")
+    parser.add_argument("--llm-first-token-ms", type=float, default=200, help="Fake LLM latency before the first token")
+    parser.add_argument("--llm-token-ms", type=float, default=10, help="Fake LLM latency per generated token")
+    parser.add_argument("--llm-tokens", type=int, default=40, help="Tokens per fake LLM answer")
+    parser.add_argument("--embedding-ms", type=float, default=0, help="Fake embedding latency per text")
+    parser.add_argument("--products", type=int, default=500, help="Number of products")
+    parser.add_argument("--sales", type=int, default=50000, help="Number of sales rows (last 30 days)")
+    parser.add_argument("--documents", type=int, default=50, help="Number of knowledge base documents")
+    parser.add_argument("--table-rows", type=int, default=20000, help="Rows of the SQL table datasource")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed")
+    parser.add_argument("--output", type=Path, help="Optional path to write the JSON report")
+    parser.add_argument("--compare", type=Path, help="Previous JSON report to compare against")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    fake_llm = FakeChatModel(first_token_latency=args.llm_first_token_ms / 1000, token_latency=args.llm_token_ms / 1000,
+                             answer_tokens=args.llm_tokens, callbacks=[LLM_TIMING_CALLBACK])
+    agent.llm = report.llm = fake_llm
+    agent.embeddings = HashingEmbeddings(latency_per_text=args.embedding_ms / 1000)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Point the application database at a scratch file for the duration of the benchmark
+        db.DATABASE_DIR = Path(tmp_dir)
+        db.DATABASE_PATH = Path(tmp_dir) / "e2e_bench.db"
+        agent.DB_URI = f"sqlite:///{db.DATABASE_PATH}"
+        db.initialize_database_schema()
+        try:
+            results = asyncio.run(run_benchmark(args, Path(tmp_dir)))
+        finally:
+            shutdown_ingest_workers()
+
+    print(f"\n{'scenario':<11}{'conc':>5}{'reqs':>6}{'err':>5}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttft p50':>10}{'llm/req':>9}")
+    for row in results:
+        latency = row["latency_ms"] or {}
+        first_token = row["first_token_ms"] or {}
+        print(f"{row['scenario']:<11}{row['concurrency']:>5}{row['requests']:>6}{row['errors']:>5}{row['throughput_rps']:>9.2f}"
+              f"{latency.get('p50', 0):>10.1f}{latency.get('p95', 0):>10.1f}{latency.get('p99', 0):>10.1f}"
+              f"{first_token.get('p50', 0):>10.1f}{row['llm_calls_per_request']:>9.2f}")
+
+    report_data = {
+        "benchmark": "end_to_end",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "results": results,
+    }
+    if args.compare:
+        compare(report_data, args.compare)
+    if args.output:
+        args.output.write_text(json.dumps(report_data, indent=2))
+        print(f"\nReport written to {args.output}")
+    else:
+        print("\n" + json.dumps(report_data, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Hybrid Retrieval Benchmark
+
+Builds a synthetic corpus of product manuals (one file per product, one chunk per
+manual section) in a temporary database, stores it through the regular ingestion
+functions (so the FTS5 index is populated by the same triggers), and compares
+dense-only, BM25-only and hybrid (RRF) retrieval on two query sets:
+
+  - part_number: questions quoting an exact part number / SKU
+  - semantic:    paraphrased questions about a product's manual section
+
+Reports recall@k, MRR@10 and per-query latency for each method.
+
+Usage:
+    python benchmarks/bench_hybrid_retrieval.py
+    python benchmarks/bench_hybrid_retrieval.py --products 500 --k 3 --embeddings hashing
+    python benchmarks/bench_hybrid_retrieval.py --embeddings local --output retrieval_bench.json
+"""
+
+import sys
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from app import db
+from app.retrieval import HybridRetriever
+from benchmarks.fakes import HashingEmbeddings
+
+LOCAL_EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-small"
+
+PRODUCT_FAMILIES = ["Aurora", "Titan", "Nimbus", "Vertex", "Falcon", "Orion", "Helix", "Summit", "Zephyr", "Cobalt"]
+PRODUCT_KINDS = ["pump", "compressor", "valve", "motor", "gearbox", "controller", "sensor", "actuator"]
+
+SECTION_TEMPLATES = {
+    "installation": (
+        "Installation guide for the {name}. Mount the {kind} on a level surface and secure it with the four anchor bolts. "
+        "Connect the supply line before powering on and verify the rotation direction during the first start."
+    ),
+    "maintenance": (
+        "Maintenance schedule for the {name}. Inspect the seals every {interval} operating hours, replace the filter cartridge "
+        "twice a year and lubricate the bearings with grade {grease} grease."
+    ),
+    "troubleshooting": (
+        "Troubleshooting the {name}. If the unit runs hot or shuts down unexpectedly, clean the cooling fins and check that the "
+        "ambient temperature stays below {temp} degrees. Repeated thermal trips indicate a worn bearing."
+    ),
+    "specifications": (
+        "Technical specifications. Part number {part_number}. Rated power {power} kW, maximum pressure {pressure} bar, "
+        "tightening torque {torque} Nm for the flange bolts. Replacement kit SKU {sku}."
+    ),
+}
+
+SEMANTIC_QUESTIONS = {
+    "installation": "How should I set up and mount a new {name}?",
+    "maintenance": "How often do the seals of the {name} need checking and what lubricant does it take?",
+    "troubleshooting": "My {name} keeps overheating and switching itself off, what should I do?",
+}
+
+PART_NUMBER_QUESTIONS = [
+    "What is the tightening torque for part {part_number}?",
+    "Which replacement kit fits {sku}?",
+    "Rated power of {part_number}?",
+]
+
+def build_corpus(num_products: int, seed: int):
+    """Generate product manuals and the questions whose answer is a known chunk."""
+    rng = random.Random(seed)
+    products = []
+    used_part_numbers = set()
+    for index in range(num_products):
+        part_number = f"PN-{rng.randint(10000, 99999)}-{rng.choice('ABCDEFGHJK')}"
+        while part_number in used_part_numbers:
+            part_number = f"PN-{rng.randint(10000, 99999)}-{rng.choice('ABCDEFGHJK')}"
+        used_part_numbers.add(part_number)
+        name = f"{rng.choice(PRODUCT_FAMILIES)} {rng.choice(PRODUCT_KINDS)} {100 + index}"
+        values = {
+            "name": name, "kind": name.split()[1], "part_number": part_number,
+            "sku": f"SKU-{rng.randint(100000, 999999)}", "interval": rng.choice([250, 500, 1000]),
+            "grease": rng.choice(["EP2", "NLGI-3", "HT-1"]), "temp": rng.choice([35, 40, 45]),
+            "power": round(rng.uniform(0.5, 90), 1), "pressure": rng.randint(6, 40), "torque": rng.randint(20, 240),
+        }
+        sections = {section: template.format(**values) for section, template in SECTION_TEMPLATES.items()}
+        products.append({"values": values, "sections": sections})
+
+    queries = []
+    for product_index, product in enumerate(products):
+        values = product["values"]
+        question = rng.choice(PART_NUMBER_QUESTIONS).format(**values)
+        queries.append({"type": "part_number", "question": question, "target": (product_index, "specifications")})
+        section = rng.choice(list(SEMANTIC_QUESTIONS))
+        queries.append({"type": "semantic", "question": SEMANTIC_QUESTIONS[section].format(**values), "target": (product_index, section)})
+    return products, queries
+
+async def ingest_corpus(products, embedder: Embeddings):
+    """Store the corpus through the application's datasource/file/chunk functions. Returns (files, chunk targets)."""
+    datasource = await db.create_datasource(name="retrieval-benchmark", ds_type="knowledge_base")
+    files = []
+    target_by_chunk_id = {}
+    for product_index, product in enumerate(products):
+        content_hash = hashlib.sha256(json.dumps(product["sections"]).encode()).hexdigest()
+        file_id = await db.save_file_info(f"{content_hash}.txt", f"manual_{product_index}.txt", "txt", 1, datasource["id"], content_hash=content_hash)
+        section_names = list(product["sections"])
+        texts = [product["sections"][name] for name in section_names]
+        vectors = np.asarray(embedder.embed_documents(texts), dtype=np.float32)
+        await db.save_vector_chunks(file_id, [
+            {"content": text, "metadata": {"source": f"manual_{product_index}.txt"}, "embedding": vector.tobytes()}
+            for text, vector in zip(texts, vectors)
+        ])
+        await db.update_file_processing_status(file_id, status="completed", chunks=len(texts))
+        files.append({"id": file_id, "content_hash": content_hash})
+
+    for chunk in await db.get_vector_chunks_for_files(files):
+        product_index = int(re.search(r"manual_(\d+)", chunk["metadata"]["source"]).group(1))
+        section = next(name for name, text in products[product_index]["sections"].items() if text == chunk["content"])
+        target_by_chunk_id[chunk["id"]] = (product_index, section)
+    return files, target_by_chunk_id
+
+async def build_retriever(files, embedder: Embeddings, k: int) -> HybridRetriever:
+    """Assemble the hybrid retriever exactly as perform_rag_query does."""
+    chunks = await db.get_vector_chunks_for_files(files)
+    texts = [chunk["content"] for chunk in chunks]
+    metadatas = [{"source": chunk["metadata"]["source"], "chunk_id": chunk["id"]} for chunk in chunks]
+    vectors = [np.frombuffer(chunk["embedding"], dtype=np.float32).tolist() for chunk in chunks]
+    vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), embedder, metadatas=metadatas)
+    return HybridRetriever(
+        vector_store=vector_store,
+        documents_by_chunk_id={m["chunk_id"]: Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)},
+        files=files,
+        k=k
+    )
+
+def evaluate(search, queries, target_by_chunk_id, k):
+    """Run every query through `search` (returns ranked chunk ids) and compute quality and latency."""
+    results = {}
+    for query_type in sorted({q["type"] for q in queries}):
+        subset = [q for q in queries if q["type"] == query_type]
+        hits, reciprocal_ranks, latencies = 0, [], []
+        for query in subset:
+            start = time.perf_counter()
+            ranked_ids = search(query["question"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            ranked_targets = [target_by_chunk_id.get(chunk_id) for chunk_id in ranked_ids]
+            if query["target"] in ranked_targets[:k]:
+                hits += 1
+            rank = ranked_targets.index(query["target"]) + 1 if query["target"] in ranked_targets[:10] else None
+            reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        latencies.sort()
+        results[query_type] = {
+            f"recall@{k}": round(hits / len(subset), 4),
+            "mrr@10": round(statistics.mean(reciprocal_ranks), 4),
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dense vs BM25 vs hybrid (RRF) retrieval")
+    parser.add_argument("--products", type=int, default=300, help="Number of product manuals in the corpus")
+    parser.add_argument("--k", type=int, default=3, help="Cut-off for recall@k (the RAG chain uses k=3)")
+    parser.add_argument("--embeddings", choices=["hashing", "local"], default="hashing",
+                        help="hashing: deterministic bag-of-words vectors; local: the app's sentence-transformers model")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for corpus generation")
+    parser.add_argument("--output", type=Path, help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    if args.embeddings == "local":
+        from langchain_community.embeddings import SentenceTransformerEmbeddings
+        embedder = SentenceTransformerEmbeddings(model_name=LOCAL_EMBEDDING_MODEL_NAME)
+    else:
+        embedder = HashingEmbeddings()
+
+    products, queries = build_corpus(args.products, args.seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Point the application database at a scratch file for the duration of the benchmark
+        db.DATABASE_DIR = Path(tmp_dir)
+        db.DATABASE_PATH = Path(tmp_dir) / "retrieval_bench.db"
+        db.initialize_database_schema()
+
+        start = time.perf_counter()
+        files, target_by_chunk_id = asyncio.run(ingest_corpus(products, embedder))
+        ingest_seconds = time.perf_counter() - start
+        retriever = asyncio.run(build_retriever(files, embedder, args.k))
+
+        def dense_search(question):
+            return [doc.metadata["chunk_id"] for doc in retriever.vector_store.similarity_search(question, k=10)]
+
+        def keyword_search(question):
+            return db.search_chunk_ids_by_keywords(question, files, limit=10)
+
+        def hybrid_search(question):
+            retriever.k = 10
+            return [doc.metadata["chunk_id"] for doc in retriever.invoke(question)]
+
+        report = {
+            "products": args.products,
+            "chunks": len(target_by_chunk_id),
+            "queries": len(queries),
+            "embeddings": args.embeddings,
+            "ingest_seconds": round(ingest_seconds, 2),
+            "methods": {
+                "dense": evaluate(dense_search, queries, target_by_chunk_id, args.k),
+                "bm25": evaluate(keyword_search, queries, target_by_chunk_id, args.k),
+                "hybrid_rrf": evaluate(hybrid_search, queries, target_by_chunk_id, args.k),
+            },
+        }
+
+    print(f"\n{'method':<12}{'query type':<14}{'recall@' + str(args.k):>10}{'mrr@10':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for method, by_type in report["methods"].items():
+        for query_type, metrics in by_type.items():
+            print(f"{method:<12}{query_type:<14}{metrics[f'recall@{args.k}']:>10.3f}{metrics['mrr@10']:>10.3f}"
+                  f"{metrics['p50_ms']:>10.2f}{metrics['p95_ms']:>10.2f}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Ingestion Throughput Benchmark
+
+Generates CSV, XLSX, PDF, DOCX and TXT files of increasing size and ingests each one
+into a fresh datasource of every DataSourceType that accepts it:
+
+  - sql_table_from_file: CSV and XLSX (parsed into a SQL table, profiled)
+  - knowledge_base:      all five types (text extraction, chunking, embedding)
+
+Each file goes either through process_uploaded_file directly ("process") or through
+POST /api/v1/datasources/{id}/files/upload ("upload", multipart upload included). Every
+case runs in its own spawned process against its own scratch database, so the peak
+RSS it reports belongs to that ingestion alone. Embeddings come from the
+deterministic HashingEmbeddings (benchmarks/fakes.py), optionally with a fixed cost
+per chunk to stand in for a model.
+
+Reported per case: time to COMPLETED, rows/sec (tabular files), chunks/sec, MB/sec,
+peak RSS (and its increase over the process before ingesting) and the peak RSS of the
+sheet-parsing worker processes (only started for workbooks with several sheets, see --sheets).
+
+Usage:
+    python benchmarks/bench_ingestion.py
+    python benchmarks/bench_ingestion.py --types csv,xlsx --rows 10000,100000,1000000 --via process
+    python benchmarks/bench_ingestion.py --types pdf,docx,txt --pages 10,100,1000 --embedding-ms 2
+    python benchmarks/bench_ingestion.py --output ingestion_bench.json
+"""
+
+import os
+
+# Keep the application's per-file logging out of the measurements
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import sys
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd
+from docx import Document
+
+TABULAR_TYPES = ("csv", "xlsx")
+DOCUMENT_TYPES = ("pdf", "docx", "txt")
+DATASOURCE_TYPES_BY_FILE_TYPE = {
+    "csv": ("sql_table_from_file", "knowledge_base"),
+    "xlsx": ("sql_table_from_file", "knowledge_base"),
+    "pdf": ("knowledge_base",),
+    "docx": ("knowledge_base",),
+    "txt": ("knowledge_base",),
+}
+REGIONS = ["North", "South", "East", "West", "Central"]
+WORDS = ("pump valve motor seal bearing filter pressure torque flange bolt coolant sensor housing gasket rotor "
+         "inspection maintenance installation warranty replacement calibration temperature operating hours").split()
+LINES_PER_PAGE = 45
+
+# ==================== File generation ====================
+
+def generate_table(num_rows: int, seed: int) -> pd.DataFrame:
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "order_id": [f"O{seed:03d}{i:08d}" for i in range(num_rows)],
+        "region": [rng.choice(REGIONS) for _ in range(num_rows)],
+        "product": [f"Product {rng.randrange(500)}" for _ in range(num_rows)],
+        "quantity": [rng.randint(1, 20) for _ in range(num_rows)],
+        "amount": [round(rng.uniform(5, 5000), 2) for _ in range(num_rows)],
+        "order_date": [f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(num_rows)],
+    })
+
+def generate_lines(num_pages: int, seed: int):
+    """Manual-like text: LINES_PER_PAGE lines of about 90 characters per page, a blank line between paragraphs."""
+    rng = random.Random(seed)
+    lines = []
+    for index in range(num_pages * LINES_PER_PAGE):
+        lines.append("" if index % 6 == 5 else " ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + ".")
+    return lines
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: Path, lines, lines_per_page: int = LINES_PER_PAGE):
+    """Minimal text-only PDF (one Helvetica content stream per page) that PyPDF2 can extract."""
+    pages = [lines[start:start + lines_per_page] for start in range(0, len(lines), lines_per_page)] or [[]]
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    for index, page_lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * index, 5 + 2 * index
+        stream = ("BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in page_lines) + " ET").encode("latin-1")
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{page_id} 0 R" for page_id in page_ids).encode(), len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offsets[object_id] for object_id in sorted(objects))
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    path.write_bytes(bytes(output))
+
+def write_docx(path: Path, lines):
+    document = Document()
+    for line in lines:
+        document.add_paragraph(line)
+    document.save(path)
+
+def write_file(directory: Path, file_type: str, size: int, sheets: int, seed: int) -> Path:
+    """Write a file of `size` rows (tabular types) or pages (document types)."""
+    path = directory / f"{file_type}_{size}.{file_type}"
+    if file_type == "csv":
+        generate_table(size, seed).to_csv(path, index=False)
+    elif file_type == "xlsx":
+        table = generate_table(size, seed)
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            for sheet in range(sheets):
+                table.iloc[sheet::sheets].to_excel(writer, sheet_name=f"Sheet{sheet + 1}", index=False)
+    elif file_type == "pdf":
+        write_pdf(path, generate_lines(size, seed))
+    elif file_type == "docx":
+        write_docx(path, generate_lines(size, seed))
+    else:
+        path.write_text("\n".join(generate_lines(size, seed)), encoding="utf-8")
+    return path
+
+# ==================== Measurement (one spawned process per case) ====================
+
+def current_rss_mb() -> float:
+    """Resident set size of this process now (Linux /proc; falls back to the peak elsewhere)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return peak_rss_mb(resource.RUSAGE_SELF)
+
+def peak_rss_mb(who) -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * scale / 1e6
+
+async def _ingest(case, work_dir: Path):
+    import httpx
+    from app import agent, db, routes
+    from app.file_processor import process_uploaded_file
+    from app.main import app
+    from benchmarks.fakes import HashingEmbeddings
+
+    agent.embeddings = HashingEmbeddings(latency_per_text=case["embedding_ms"] / 1000)
+    db.DATABASE_DIR = work_dir
+    db.DATABASE_PATH = work_dir / "ingestion_bench.db"
+    routes.UPLOAD_DIR = work_dir / "uploads"
+    routes.UPLOAD_DIR.mkdir(exist_ok=True)
+    db.initialize_database_schema()
+    datasource = await db.create_datasource(name=f"ingest-{case['datasource_type']}", ds_type=case["datasource_type"])
+    path = Path(case["path"])
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    if case["via"] == "process":
+        file_id = await db.save_file_info(path.name, path.name, case["file_type"], path.stat().st_size, datasource["id"])
+        await process_uploaded_file(file_id, datasource["id"], path, path.name, case["file_type"])
+    else:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            with open(path, "rb") as upload:
+                response = await client.post(f"/api/v1/datasources/{datasource['id']}/files/upload", files={"file": (path.name, upload)})
+            file_id = response.json().get("file_id")
+            # The route ingests before responding; poll in case processing moves to the background
+            while True:
+                files = await db.get_files_by_datasource(datasource["id"])
+                record = next((f for f in files if f["id"] == file_id), None)
+                if record is None or record["processing_status"] in ("completed", "failed"):
+                    break
+                await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    files = await db.get_files_by_datasource(datasource["id"])
+    record = next((f for f in files if f["id"] == file_id), {}) if file_id else {}
+    return record, elapsed, rss_before
+
+def run_case(case):
+    """Ingest one file in this (fresh) process and measure it."""
+    from app import file_processor
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        record, elapsed, rss_before = asyncio.run(_ingest(case, Path(tmp_dir)))
+        peak_rss = peak_rss_mb(resource.RUSAGE_SELF)
+        # Wait for the sheet parsing workers to exit so RUSAGE_CHILDREN includes them
+        if file_processor._sheet_executor is not None:
+            file_processor._sheet_executor.shutdown(wait=True)
+            file_processor._sheet_executor = None
+    # The upload route reports COMPLETED even when processing failed; the error message tells.
+    # Text extraction logs and swallows its errors, so an empty knowledge base counts as failed too.
+    processed = record.get("processed_chunks") or 0
+    error = record.get("error_message")
+    if not error and case["datasource_type"] == "knowledge_base" and not processed:
+        error = "no chunks were produced"
+    failed = record.get("processing_status") != "completed" or bool(error)
+    size_mb = case["file_mb"]
+    result = {
+        "file_type": case["file_type"],
+        "datasource_type": case["datasource_type"],
+        "via": case["via"],
+        "size": case["size"],
+        "file_mb": round(size_mb, 3),
+        "status": "failed" if failed else "completed",
+        "error": error,
+        "seconds_to_completed": round(elapsed, 3),
+        "mb_per_sec": round(size_mb / elapsed, 2) if elapsed else None,
+        "rss_before_mb": round(rss_before, 1),
+        "peak_rss_mb": round(peak_rss, 1),
+        "peak_rss_increase_mb": round(max(0.0, peak_rss - rss_before), 1),
+        "peak_worker_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+    if case["file_type"] in TABULAR_TYPES:
+        result["rows"] = case["size"]
+        result["rows_per_sec"] = round(case["size"] / elapsed) if elapsed else None
+    if case["datasource_type"] == "knowledge_base":
+        result["chunks"] = processed
+        result["chunks_per_sec"] = round(processed / elapsed, 1) if elapsed else None
+    return result
+
+def _run_case_in_child(case, connection):
+    connection.send(run_case(case))
+    connection.close()
+
+def run_case_isolated(context, case):
+    """Run one case in a fresh spawned process (not a daemonic Pool worker, which could not start the sheet pool)."""
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case_in_child, args=(case, sender))
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"Ingestion process for {case['file_type']}/{case['datasource_type']} exited with code {process.exitcode}")
+    finally:
+        process.join()
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark file ingestion throughput, latency and memory per file and datasource type")
+    parser.add_argument("--types", type=lambda value: value.split(","), default=list(DATASOURCE_TYPES_BY_FILE_TYPE),
+                        help="Comma-separated file types (csv,xlsx,pdf,docx,txt)")
+    parser.add_argument("--datasource-types", type=lambda value: value.split(","), default=["sql_table_from_file", "knowledge_base"],
+                        help="Comma-separated datasource types to ingest into")
+    parser.add_argument("--rows", type=_int_list, default=[1000, 10000, 100000], help="Row counts of the CSV/XLSX files")
+    parser.add_argument("--pages", type=_int_list, default=[1, 10, 100], help="Page counts of the PDF/DOCX/TXT files")
+    parser.add_argument("--sheets", type=int, default=1, help="Sheets per XLSX file (rows are split across them)")
+    parser.add_argument("--via", choices=["process", "upload", "both"], default="both",
+                        help="Call process_uploaded_file directly, go through the upload route, or both")
+    parser.add_argument("--embedding-ms", type=float, default=0, help="Fake embedding latency per chunk")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed")
+    parser.add_argument("--output", type=Path, help="Optional path to write the JSON report")
+    args = parser.parse_args()
+    unknown = set(args.types) - set(DATASOURCE_TYPES_BY_FILE_TYPE)
+    if unknown:
+        parser.error(f"Unknown file types: {', '.join(sorted(unknown))}")
+
+    via_list = ["process", "upload"] if args.via == "both" else [args.via]
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for file_type in args.types:
+            for size in (args.rows if file_type in TABULAR_TYPES else args.pages):
+                print(f"Generating {file_type} file with {size} {'rows' if file_type in TABULAR_TYPES else 'pages'}...")
+                path = write_file(Path(tmp_dir), file_type, size, args.sheets, args.seed + size)
+                for datasource_type in DATASOURCE_TYPES_BY_FILE_TYPE[file_type]:
+                    if datasource_type not in args.datasource_types:
+                        continue
+                    for via in via_list:
+                        case = {"file_type": file_type, "datasource_type": datasource_type, "via": via, "size": size,
+                                "path": str(path), "file_mb": path.stat().st_size / 1e6, "embedding_ms": args.embedding_ms}
+                        print(f"  {datasource_type} via {via}...")
+                        results.append(run_case_isolated(context, case))
+
+    print(f"\n{'file':<6}{'datasource':<21}{'via':<9}{'size':>8}{'MB':>8}{'status':>10}{'sec':>9}{'rows/s':>10}{'chunks/s':>10}"
+          f"{'MB/s':>8}{'peak MB':>9}{'+MB':>8}")
+    for row in results:
+        print(f"{row['file_type']:<6}{row['datasource_type']:<21}{row['via']:<9}{row['size']:>8}{row['file_mb']:>8.2f}{row['status']:>10}"
+              f"{row['seconds_to_completed']:>9.2f}{row.get('rows_per_sec') or '-':>10}{row.get('chunks_per_sec') or '-':>10}"
+              f"{row['mb_per_sec'] or 0:>8.2f}{row['peak_rss_mb']:>9.1f}{row['peak_rss_increase_mb']:>8.1f}")
+
+    report = {"embedding_ms": args.embedding_ms, "sheets": args.sheets, "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+RAG Retrieval Benchmark
+
+Generates a local corpus of service manuals (several products per manual, each fact
+sentence surrounded by filler paragraphs) together with labeled questions whose
+answer span is a known fact sentence, and evaluates knowledge base retrieval as the
+corpus grows, for every combination of:
+
+  - chunking parameters (RAG_CHUNK_SIZE / RAG_CHUNK_OVERLAP), e.g. 500:50,1000:200,2000:400
+  - vector index type (flat, hnsw, ivf_pq; IVF-PQ falls back to flat below VECTOR_IVF_PQ_MIN_VECTORS)
+
+Manuals are ingested with process_uploaded_file into a scratch database per corpus
+size and chunking setting, the index is built with the same function as
+perform_rag_query, and questions go through the HybridRetriever (dense + BM25, RRF)
+as well as plain dense search. A retrieved chunk is relevant when it contains the
+whole answer span, so chunks that cut the fact in two do not count.
+
+Reported per case: recall@k for each --k (the RAG chain uses RAG_TOP_K), MRR@10,
+ingestion and index build time, per-query latency (p50/p95), chunk count and size,
+index size and process RSS.
+
+Usage:
+    python benchmarks/bench_rag_retrieval.py
+    python benchmarks/bench_rag_retrieval.py --documents 100,1000,5000 --chunking 500:50,1000:200 --index-types flat hnsw ivf_pq
+    python benchmarks/bench_rag_retrieval.py --embeddings local --documents 200 --output rag_retrieval_bench.json
+"""
+
+import os
+
+# Keep the per-file ingestion logging out of the measurements
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import sys
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import faiss
+
+import app.main  # noqa: F401  First: configures logging before the other modules log at import
+from app import agent, db, file_processor
+from app.models import VectorIndexType, VectorQuantization
+from app.retrieval import HybridRetriever
+from benchmarks.fakes import HashingEmbeddings
+
+PRODUCT_FAMILIES = ["Aurora", "Titan", "Nimbus", "Vertex", "Falcon", "Orion", "Helix", "Summit", "Zephyr", "Cobalt"]
+PRODUCT_KINDS = ["pump", "compressor", "valve", "motor", "gearbox", "controller", "blower", "actuator"]
+PRODUCTS_PER_MANUAL = 4
+
+# (fact sentence, question) per attribute; the fact sentence is the labeled answer span
+FACTS = {
+    "pressure": ("The {name} is rated for a maximum operating pressure of {pressure} bar.",
+                 "What is the highest pressure the {name} can run at?"),
+    "seals": ("Seals on the {name} must be inspected every {interval} operating hours.",
+              "How often should the seals of the {name} be checked?"),
+    "torque": ("Tighten the flange bolts of the {name} to {torque} Nm in a crosswise pattern.",
+               "What torque do the flange bolts on the {name} need?"),
+    "warranty": ("The {name} is covered by a {warranty} month warranty from the date of installation.",
+                 "How long is the warranty on the {name}?"),
+    "temperature": ("Shut the {name} down if the housing temperature exceeds {temperature} degrees Celsius.",
+                    "At what housing temperature must the {name} be switched off?"),
+}
+
+FILLER_SENTENCES = [
+    "Always follow the site safety rules before opening any housing.",
+    "Keep a written record of every inspection in the maintenance log.",
+    "Use only genuine spare parts supplied by an authorized distributor.",
+    "Disconnect the power supply and lock out the isolator before service work.",
+    "Wear protective gloves and eye protection when handling lubricants.",
+    "Check the mounting surface for cracks or corrosion during each visit.",
+    "Clean spilled oil immediately to prevent slips on the work floor.",
+    "Replace damaged warning labels so that they remain readable.",
+    "Allow hot surfaces to cool down before touching any component.",
+    "Store spare parts in a dry room away from direct sunlight.",
+    "Report unusual noise or vibration to the shift supervisor.",
+    "Dispose of used filters according to local environmental regulations.",
+    "Verify that all guards are reinstalled before restarting the unit.",
+    "Training records must be kept for every technician on site.",
+    "Inspect cable glands for tightness and signs of moisture ingress.",
+    "The commissioning checklist is included at the end of this manual.",
+]
+
+# ==================== Corpus generation ====================
+
+def generate_manual(index: int, seed: int):
+    """One manual: PRODUCTS_PER_MANUAL products, one paragraph per fact. Returns (text, labeled questions)."""
+    rng = random.Random(seed * 1000003 + index)
+    paragraphs = [f"Service manual volume {index + 1}", rng.choice(FILLER_SENTENCES) + " " + rng.choice(FILLER_SENTENCES)]
+    questions = []
+    for position in range(PRODUCTS_PER_MANUAL):
+        name = f"{rng.choice(PRODUCT_FAMILIES)} {rng.choice(PRODUCT_KINDS)} M{index * PRODUCTS_PER_MANUAL + position + 1000}"
+        values = {
+            "name": name, "pressure": rng.randint(6, 40), "interval": rng.choice([250, 500, 1000, 2000]),
+            "torque": rng.randint(20, 240), "warranty": rng.choice([12, 18, 24, 36]), "temperature": rng.randint(60, 95),
+        }
+        paragraphs.append(f"Section {position + 1}: {name}")
+        for attribute, (fact_template, question_template) in FACTS.items():
+            answer_span = fact_template.format(**values)
+            before = " ".join(rng.sample(FILLER_SENTENCES, rng.randint(1, 4)))
+            after = " ".join(rng.sample(FILLER_SENTENCES, rng.randint(1, 4)))
+            paragraphs.append(f"{before} {answer_span} {after}")
+            questions.append({"question": question_template.format(**values), "answer_span": answer_span, "attribute": attribute})
+    return "\n\n".join(paragraphs), questions
+
+def generate_corpus(num_documents: int, seed: int):
+    """Manuals are generated independently, so smaller corpora are prefixes of larger ones."""
+    return [generate_manual(index, seed) for index in range(num_documents)]
+
+# ==================== Measurement ====================
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return 0.0
+
+def percentile(sorted_values, fraction: float) -> float:
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+async def ingest_manuals(manuals, work_dir: Path):
+    """Write the manuals as text files and ingest them like uploads. Returns the completed file records."""
+    datasource = await db.create_datasource(name="rag-retrieval-benchmark", ds_type="knowledge_base")
+    for index, (text, _) in enumerate(manuals):
+        path = work_dir / f"manual_{index}.txt"
+        path.write_text(text, encoding="utf-8")
+        content_hash = hashlib.sha256(text.encode()).hexdigest()
+        file_id = await db.save_file_info(path.name, path.name, "txt", path.stat().st_size, datasource["id"], content_hash=content_hash)
+        await file_processor.process_uploaded_file(file_id, datasource["id"], path, path.name, "txt", content_hash=content_hash)
+    return [f for f in await db.get_files_by_datasource(datasource["id"]) if f["processing_status"] == "completed"]
+
+def evaluate(search, questions, ks, latencies):
+    """Rank chunks for every question with `search` (returns chunk texts, best first) and score answer-span hits."""
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks = []
+    for question in questions:
+        start = time.perf_counter()
+        ranked_texts = search(question["question"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        rank = next((position for position, text in enumerate(ranked_texts, start=1) if question["answer_span"] in text), None)
+        for k in ks:
+            hits[k] += 1 if rank is not None and rank <= k else 0
+        reciprocal_ranks.append(1.0 / rank if rank is not None and rank <= 10 else 0.0)
+    return {f"recall@{k}": round(hits[k] / len(questions), 4) for k in ks} | {"mrr@10": round(statistics.mean(reciprocal_ranks), 4)}
+
+async def run_case(manuals, questions, chunk_size: int, chunk_overlap: int, index_types, ks, work_dir: Path):
+    """Ingest the corpus with one chunking setting, then evaluate every index type on it."""
+    file_processor.RAG_CHUNK_SIZE, file_processor.RAG_CHUNK_OVERLAP = chunk_size, chunk_overlap
+    db.DATABASE_DIR = work_dir
+    db.DATABASE_PATH = work_dir / "rag_retrieval_bench.db"
+    db.initialize_database_schema()
+
+    start = time.perf_counter()
+    files = await ingest_manuals(manuals, work_dir)
+    ingest_seconds = time.perf_counter() - start
+    chunk_lengths = [len(chunk["content"]) for chunk in await db.get_vector_chunks_for_files(files)]
+    cut_off = max(max(ks), 10)
+
+    results = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        vector_store, documents_by_chunk_id = await agent._build_rag_vector_store(files, index_type, VectorQuantization.FLOAT32.value)
+        build_seconds = time.perf_counter() - start
+        retriever = HybridRetriever(vector_store=vector_store, documents_by_chunk_id=documents_by_chunk_id, files=files, k=cut_off)
+
+        def dense_search(question):
+            return [document.page_content for document in vector_store.similarity_search(question, k=cut_off)]
+
+        def hybrid_search(question):
+            return [document.page_content for document in retriever.invoke(question)]
+
+        for method, search in (("dense", dense_search), ("hybrid_rrf", hybrid_search)):
+            latencies = []
+            metrics = evaluate(search, questions, ks, latencies)
+            latencies.sort()
+            results.append({
+                "documents": len(manuals),
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "index_type": index_type,
+                "faiss_index": type(vector_store.index).__name__,
+                "method": method,
+                **metrics,
+                "chunks": len(chunk_lengths),
+                "avg_chunk_chars": round(statistics.mean(chunk_lengths)) if chunk_lengths else 0,
+                "ingest_seconds": round(ingest_seconds, 2),
+                "index_build_seconds": round(build_seconds, 3),
+                "p50_ms": round(statistics.median(latencies), 2),
+                "p95_ms": round(percentile(latencies, 0.95), 2),
+                "index_mb": round(faiss.serialize_index(vector_store.index).nbytes / 1e6, 2),
+                "rss_mb": round(current_rss_mb(), 1),
+            })
+        del vector_store, documents_by_chunk_id, retriever
+    return results
+
+def _chunking(value: str):
+    settings = []
+    for item in value.split(","):
+        size, _, overlap = item.partition(":")
+        settings.append((int(size), int(overlap or 0)))
+    return settings
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval quality, latency and memory vs corpus size, chunking and index type")
+    parser.add_argument("--documents", type=lambda value: [int(item) for item in value.split(",")], default=[100, 1000],
+                        help=f"Comma-separated corpus sizes in manuals ({PRODUCTS_PER_MANUAL * len(FACTS)} labeled facts each)")
+    parser.add_argument("--chunking", type=_chunking, default=[(500, 50), (1000, 200), (2000, 400)],
+                        help="Comma-separated chunk_size:chunk_overlap settings")
+    parser.add_argument("--index-types", nargs="+", default=[t.value for t in VectorIndexType], choices=[t.value for t in VectorIndexType])
+    parser.add_argument("--k", type=lambda value: [int(item) for item in value.split(",")], default=[1, 3, 5, 10],
+                        help=f"Cut-offs for recall@k (RAG_TOP_K is currently {agent.RAG_TOP_K})")
+    parser.add_argument("--queries", type=int, default=300, help="Labeled questions sampled per corpus size")
+    parser.add_argument("--embeddings", choices=["hashing", "local"], default="hashing",
+                        help="hashing: deterministic bag-of-words vectors; local: the app's sentence-transformers model")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for corpus generation")
+    parser.add_argument("--output", type=Path, help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    if args.embeddings == "local":
+        from langchain_community.embeddings import SentenceTransformerEmbeddings
+        agent.embeddings = SentenceTransformerEmbeddings(model_name=agent.LOCAL_EMBEDDING_MODEL_NAME)
+    else:
+        agent.embeddings = HashingEmbeddings()
+
+    results = []
+    for num_documents in args.documents:
+        print(f"Generating {num_documents} manuals...")
+        manuals = generate_corpus(num_documents, args.seed)
+        all_questions = [question for _, questions in manuals for question in questions]
+        questions = random.Random(args.seed).sample(all_questions, min(args.queries, len(all_questions)))
+        for chunk_size, chunk_overlap in args.chunking:
+            print(f"  chunk_size={chunk_size} overlap={chunk_overlap}: ingesting and evaluating {', '.join(args.index_types)}...")
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                results.extend(asyncio.run(run_case(manuals, questions, chunk_size, chunk_overlap, args.index_types, args.k, Path(tmp_dir))))
+
+    recall_columns = [f"recall@{k}" for k in args.k]
+    print(f"\n{'docs':>6}{'chunking':>11}{'index':>8}{'method':>12}{'chunks':>8}" + "".join(f"{c:>11}" for c in recall_columns)
+          + f"{'mrr@10':>8}{'ingest s':>10}{'build s':>9}{'p50 ms':>8}{'p95 ms':>8}{'index MB':>10}{'RSS MB':>8}")
+    for row in results:
+        print(f"{row['documents']:>6}{str(row['chunk_size']) + ':' + str(row['chunk_overlap']):>11}{row['index_type']:>8}{row['method']:>12}"
+              f"{row['chunks']:>8}" + "".join(f"{row[c]:>11.3f}" for c in recall_columns)
+              + f"{row['mrr@10']:>8.3f}{row['ingest_seconds']:>10.2f}{row['index_build_seconds']:>9.3f}{row['p50_ms']:>8.2f}"
+              f"{row['p95_ms']:>8.2f}{row['index_mb']:>10.2f}{row['rss_mb']:>8.1f}")
+
+    report = {"embeddings": args.embeddings, "queries": args.queries, "rag_top_k": agent.RAG_TOP_K, "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
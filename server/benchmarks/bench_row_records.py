@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Row Record Benchmark
+
+Compares the two result-row representations of the default ERP queries on a large
+synthetic sales table:
+
+  - dict:   sqlite3.Row objects copied field by field into one dict per row
+            (how fetch_sales_data_for_query built its result before SaleRecord)
+  - record: SaleRecord objects built directly by the cursor's row_factory
+
+The record path runs the application's fetch_sales_data_for_query against a
+temporary database. For each representation the benchmark reports:
+
+  - fetch time (query + row construction) and the memory held by the result list
+  - time to aggregate total_amount over the rows (what the sales answer does)
+  - time to serialize the rows to JSON (what the response boundary does)
+
+Usage:
+    python benchmarks/bench_row_records.py
+    python benchmarks/bench_row_records.py --rows 200000 --repeat 5
+    python benchmarks/bench_row_records.py --output row_records_bench.json
+"""
+
+import sys
+import argparse
+import asyncio
+import gc
+import json
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app import db
+from app.records import serialize_records
+
+SALES_QUERY = """
+    SELECT s.*, p.category
+    FROM sales s
+    LEFT JOIN products p ON s.product_id = p.product_id
+    WHERE s.sale_date >= DATE('now', '-30 days')
+    ORDER BY s.sale_date DESC, s.sale_id DESC
+"""
+
+def populate_database(num_rows: int, num_products: int, seed: int):
+    """Fill the products and sales tables with random rows dated within the last 30 days."""
+    rng = random.Random(seed)
+    conn = db.get_db_connection()
+    products = [(f"P{i:05d}", f"Product {i}", rng.choice(["Electronics", "Accessories", "Office"]), round(rng.uniform(5, 2000), 2))
+                for i in range(num_products)]
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?)", products)
+    now = datetime.now()
+
+    def sales_rows():
+        for i in range(num_rows):
+            product_id, product_name, _, unit_price = products[rng.randrange(num_products)]
+            quantity = rng.randint(1, 10)
+            sale_date = (now - timedelta(seconds=rng.randrange(29 * 86400))).strftime(db.DATE_FORMAT)
+            yield (f"S{i:08d}", product_id, product_name, quantity, unit_price, round(quantity * unit_price, 2), sale_date)
+
+    conn.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?, ?, ?)", sales_rows())
+    conn.commit()
+    conn.close()
+
+def fetch_as_dicts():
+    """The per-row dict construction used before the record types."""
+    conn = db.get_db_connection()
+    try:
+        rows = conn.execute(SALES_QUERY).fetchall()
+        return [{
+            'sale_id': row['sale_id'],
+            'product_id': row['product_id'],
+            'product_name': row['product_name'],
+            'quantity_sold': row['quantity_sold'],
+            'price_per_unit': row['price_per_unit'],
+            'total_amount': row['total_amount'],
+            'sale_date': row['sale_date'],
+            'category': dict(row).get('category', 'Unknown')
+        } for row in rows]
+    finally:
+        conn.close()
+
+def fetch_as_records():
+    return asyncio.run(db.fetch_sales_data_for_query("sales in the last 30 days", None))
+
+REPRESENTATIONS = {
+    "dict": {
+        "fetch": fetch_as_dicts,
+        "aggregate": lambda rows: sum(row['total_amount'] for row in rows),
+    },
+    "record": {
+        "fetch": fetch_as_records,
+        "aggregate": lambda rows: sum(row.total_amount for row in rows),
+    },
+}
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def measure_result_memory(fetch) -> int:
+    """Bytes still allocated once the result list is built (transient fetch buffers excluded)."""
+    gc.collect()
+    tracemalloc.start()
+    rows = fetch()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    return retained
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dict rows vs slotted row records (memory and latency)")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of sales rows returned by the query")
+    parser.add_argument("--products", type=int, default=1000, help="Number of products")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per representation (median is reported)")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed")
+    parser.add_argument("--output", type=Path, help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Point the application database at a scratch file for the duration of the benchmark
+        db.DATABASE_DIR = Path(tmp_dir)
+        db.DATABASE_PATH = Path(tmp_dir) / "row_records_bench.db"
+        db.initialize_database_schema()
+        print(f"Generating {args.rows} sales rows...")
+        populate_database(args.rows, args.products, args.seed)
+
+        for name, representation in REPRESENTATIONS.items():
+            print(f"Measuring {name} rows...")
+            fetch_ms, aggregate_ms, serialize_ms = [], [], []
+            for _ in range(args.repeat):
+                gc.collect()
+                rows, elapsed = timed(representation["fetch"])
+                fetch_ms.append(elapsed)
+                total, elapsed = timed(representation["aggregate"], rows)
+                aggregate_ms.append(elapsed)
+                payload, elapsed = timed(lambda: json.dumps(serialize_records({"detailed_sales": rows}), default=str))
+                serialize_ms.append(elapsed)
+                row_count = len(rows)
+                del rows, payload
+
+            results.append({
+                "representation": name,
+                "rows": row_count,
+                "total_amount": round(total, 2),
+                "result_mb": round(measure_result_memory(representation["fetch"]) / 1e6, 1),
+                "fetch_ms": round(statistics.median(fetch_ms), 1),
+                "aggregate_ms": round(statistics.median(aggregate_ms), 1),
+                "serialize_ms": round(statistics.median(serialize_ms), 1),
+            })
+
+    print(f"\n{'rows':<8}{'count':>10}{'result MB':>11}{'fetch ms':>11}{'sum ms':>9}{'json ms':>10}")
+    for row in results:
+        print(f"{row['representation']:<8}{row['rows']:>10}{row['result_mb']:>11.1f}{row['fetch_ms']:>11.1f}"
+              f"{row['aggregate_ms']:>9.1f}{row['serialize_ms']:>10.1f}")
+
+    report = {"rows": args.rows, "products": args.products, "repeat": args.repeat, "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
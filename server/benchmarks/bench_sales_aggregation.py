@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Sales Aggregation Benchmark
+
+Compares two ways of answering default-ERP sales questions over a large synthetic
+sales table:
+
+  - rows:      fetch every sale of the time window into Python and aggregate there
+               (totals, top products, per-category revenue), as the sales answer did
+               before fetch_sales_summary_for_query
+  - summary:   fetch_sales_summary_for_query, which aggregates in SQL and returns only
+               the aggregates plus a capped sample of rows
+
+For each question the benchmark reports the median latency and the size of the JSON
+response data, and checks that both methods agree on the totals.
+
+Usage:
+    python benchmarks/bench_sales_aggregation.py
+    python benchmarks/bench_sales_aggregation.py --rows 1000000 --days 90
+    python benchmarks/bench_sales_aggregation.py --output sales_aggregation_bench.json
+"""
+
+import sys
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app import db
+from app.records import serialize_records
+
+QUESTIONS = [
+    "What were total sales today?",
+    "How did sales do this week?",
+    "Show me sales in the last 30 days",
+    "Best selling products last month",
+    "Daily laptop sales trend in the past 30 days",
+]
+
+def populate_database(num_rows: int, num_products: int, days: int, seed: int):
+    """Fill the products and sales tables with random sales spread over the last `days` days."""
+    rng = random.Random(seed)
+    conn = db.get_db_connection()
+    kinds = ["Laptop", "Mouse", "Keyboard", "Monitor", "Printer", "Router"]
+    products = []
+    for i in range(num_products):
+        kind = rng.choice(kinds)
+        products.append((f"P{i:05d}", f"{kind} {i}", f"{kind}s", round(rng.uniform(5, 2000), 2)))
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?)", products)
+    now = datetime.now()
+
+    def sales_rows():
+        for i in range(num_rows):
+            product_id, product_name, _, unit_price = products[rng.randrange(num_products)]
+            quantity = rng.randint(1, 10)
+            sale_date = (now - timedelta(seconds=rng.randrange(days * 86400))).strftime(db.DATE_FORMAT)
+            yield (f"S{i:08d}", product_id, product_name, quantity, unit_price, round(quantity * unit_price, 2), sale_date)
+
+    conn.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?, ?, ?)", sales_rows())
+    conn.commit()
+    conn.close()
+
+async def answer_from_rows(question: str):
+    """Aggregate the full result set in Python."""
+    rows = await db.fetch_sales_data_for_query(question, None)
+    by_product = defaultdict(lambda: [0, 0, 0.0])
+    by_category = defaultdict(float)
+    for row in rows:
+        stats = by_product[row.product_id]
+        stats[0] += 1
+        stats[1] += row.quantity_sold
+        stats[2] += row.total_amount
+        by_category[row.category] += row.total_amount
+    total_amount = sum(stats[2] for stats in by_product.values())
+    return {
+        "summary_stats": {"total_records": len(rows), "total_amount": total_amount},
+        "top_products_by_revenue": sorted(by_product.items(), key=lambda item: item[1][2], reverse=True)[:db.SALES_TOP_N],
+        "by_category": dict(by_category),
+        "detailed_sales": rows,
+    }
+
+async def answer_from_summary(question: str):
+    return await db.fetch_sales_summary_for_query(question)
+
+METHODS = {"rows": answer_from_rows, "summary": answer_from_summary}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Python-side vs SQL-side aggregation of sales questions")
+    parser.add_argument("--rows", type=int, default=3000000, help="Number of sales rows")
+    parser.add_argument("--days", type=int, default=90, help="Days of history the sales are spread over")
+    parser.add_argument("--products", type=int, default=2000, help="Number of products")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per question and method (median is reported)")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed")
+    parser.add_argument("--output", type=Path, help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Point the application database at a scratch file for the duration of the benchmark
+        db.DATABASE_DIR = Path(tmp_dir)
+        db.DATABASE_PATH = Path(tmp_dir) / "sales_aggregation_bench.db"
+        db.initialize_database_schema()
+        print(f"Generating {args.rows} sales rows over {args.days} days...")
+        populate_database(args.rows, args.products, args.days, args.seed)
+
+        for question in QUESTIONS:
+            row = {"question": question}
+            for method, answer in METHODS.items():
+                latencies = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    data = asyncio.run(answer(question))
+                    latencies.append((time.perf_counter() - start) * 1000)
+                row[f"{method}_ms"] = round(statistics.median(latencies), 1)
+                row[f"{method}_kb"] = round(len(json.dumps(serialize_records(data), default=str)) / 1000, 1)
+                row[f"{method}_total"] = round(data["summary_stats"]["total_amount"], 2)
+                row["matched_sales"] = data["summary_stats"]["total_records"]
+                del data
+            row["totals_agree"] = abs(row["rows_total"] - row["summary_total"]) <= 1e-6 * max(1.0, abs(row["rows_total"]))
+            results.append(row)
+
+    print(f"\n{'question':<48}{'sales':>10}{'rows ms':>10}{'rows KB':>11}{'summary ms':>12}{'summary KB':>12}{'agree':>7}")
+    for row in results:
+        print(f"{row['question'][:47]:<48}{row['matched_sales']:>10}{row['rows_ms']:>10.1f}{row['rows_kb']:>11.1f}"
+              f"{row['summary_ms']:>12.1f}{row['summary_kb']:>12.1f}{str(row['totals_agree']):>7}")
+
+    report = {"rows": args.rows, "days": args.days, "products": args.products, "repeat": args.repeat, "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
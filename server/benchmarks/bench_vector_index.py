@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Vector Index Benchmark
+
+Compares the knowledge base index types (flat, HNSW, IVF-PQ) and stored-vector
+quantizations (float32, float16, int8) on a synthetic corpus of clustered, unit-norm
+embeddings - the shape produced by sentence-transformer models.
+
+For every (index type, quantization) pair the vectors are encoded and decoded with
+the same functions used at ingestion/query time, the index is built with the same
+settings as perform_rag_query, and the benchmark reports:
+
+  - recall@k against exact float32 search (brute force)
+  - stored embedding bytes (vector_chunks.embedding) and index size
+  - build time (including training) and single-query latency (p50/p95)
+
+Vectors are generated in memory rather than stored in SQLite, so the numbers isolate
+the index; at 1M x 384 dims plan for ~5 GB of RAM.
+
+Usage:
+    python benchmarks/bench_vector_index.py
+    python benchmarks/bench_vector_index.py --vectors 100000 --index-types hnsw ivf_pq
+    python benchmarks/bench_vector_index.py --quantizations float32 int8 --output vector_index_bench.json
+"""
+
+import sys
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import faiss
+
+from app.models import VectorIndexType, VectorQuantization
+from app.vector_index import encode_vectors, decode_embedding, build_faiss_index
+
+ENCODE_BATCH_SIZE = 100000
+
+def generate_vectors(num_vectors: int, dimension: int, num_clusters: int, seed: int) -> np.ndarray:
+    """Clustered unit-norm vectors: topic centroids plus per-chunk noise."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((num_clusters, dimension)).astype(np.float32)
+    vectors = np.empty((num_vectors, dimension), dtype=np.float32)
+    for start in range(0, num_vectors, ENCODE_BATCH_SIZE):
+        end = min(start + ENCODE_BATCH_SIZE, num_vectors)
+        assignments = rng.integers(0, num_clusters, end - start)
+        batch = centroids[assignments] + 0.8 * rng.standard_normal((end - start, dimension)).astype(np.float32)
+        vectors[start:end] = batch / np.linalg.norm(batch, axis=1, keepdims=True)
+    return vectors
+
+def generate_queries(vectors: np.ndarray, num_queries: int, seed: int) -> np.ndarray:
+    """Queries near stored vectors (a paraphrase of an existing chunk)."""
+    rng = np.random.default_rng(seed + 1)
+    picks = vectors[rng.integers(0, len(vectors), num_queries)]
+    queries = picks + 0.05 * rng.standard_normal(picks.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def round_trip(vectors: np.ndarray, quantization: str):
+    """Encode/decode the corpus as ingestion and retrieval do. Returns (decoded vectors, stored bytes)."""
+    if quantization == VectorQuantization.FLOAT32.value:
+        return vectors, vectors.nbytes
+    decoded = np.empty_like(vectors)
+    stored_bytes = 0
+    for start in range(0, len(vectors), ENCODE_BATCH_SIZE):
+        blobs = encode_vectors(vectors[start:start + ENCODE_BATCH_SIZE], quantization)
+        stored_bytes += sum(len(blob) for blob in blobs)
+        decoded[start:start + len(blobs)] = [decode_embedding(blob, quantization) for blob in blobs]
+    return decoded, stored_bytes
+
+def index_size_bytes(index) -> int:
+    """Serialized index size, written to a temporary file to avoid a second in-memory copy."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "index.faiss")
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(row[:k]) & set(expected[:k])) for row, expected in zip(found, truth))
+    return hits / (len(truth) * k)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector index types and quantization (recall vs memory vs latency)")
+    parser.add_argument("--vectors", type=int, default=1000000, help="Number of synthetic chunk embeddings")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (384 for multilingual-e5-small)")
+    parser.add_argument("--clusters", type=int, default=1000, help="Number of topic clusters in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries used for recall")
+    parser.add_argument("--latency-queries", type=int, default=200, help="Queries timed one at a time for latency")
+    parser.add_argument("--k", type=int, default=10, help="Cut-off for recall@k")
+    parser.add_argument("--index-types", nargs="+", default=[t.value for t in VectorIndexType],
+                        choices=[t.value for t in VectorIndexType])
+    parser.add_argument("--quantizations", nargs="+", default=[q.value for q in VectorQuantization],
+                        choices=[q.value for q in VectorQuantization])
+    parser.add_argument("--seed", type=int, default=7, help="Random seed")
+    parser.add_argument("--output", type=Path, help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    print(f"Generating {args.vectors} x {args.dim} vectors...")
+    vectors = generate_vectors(args.vectors, args.dim, args.clusters, args.seed)
+    queries = generate_queries(vectors, args.queries, args.seed)
+
+    print("Computing exact neighbours...")
+    _, ground_truth = faiss.knn(queries, vectors, args.k)
+
+    results = []
+    for quantization in args.quantizations:
+        decoded, stored_bytes = round_trip(vectors, quantization)
+        for index_type in args.index_types:
+            print(f"Building {index_type} / {quantization}...")
+            start = time.perf_counter()
+            index = build_faiss_index(decoded, index_type, quantization)
+            build_seconds = time.perf_counter() - start
+
+            _, found = index.search(queries, args.k)
+            latencies = []
+            for query in queries[:args.latency_queries]:
+                start = time.perf_counter()
+                index.search(query[None, :], args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+
+            results.append({
+                "index_type": index_type,
+                "quantization": quantization,
+                "faiss_index": type(index).__name__,
+                f"recall@{args.k}": round(recall_at_k(found, ground_truth, args.k), 4),
+                "stored_mb": round(stored_bytes / 1e6, 1),
+                "index_mb": round(index_size_bytes(index) / 1e6, 1),
+                "build_seconds": round(build_seconds, 2),
+                "p50_ms": round(statistics.median(latencies), 3),
+                "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+            })
+            del index
+        del decoded
+
+    print(f"\n{'index':<8}{'quant':<9}{'faiss index':<22}{'recall@' + str(args.k):>10}{'stored MB':>11}{'index MB':>10}"
+          f"{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for row in results:
+        print(f"{row['index_type']:<8}{row['quantization']:<9}{row['faiss_index']:<22}{row[f'recall@{args.k}']:>10.3f}"
+              f"{row['stored_mb']:>11.1f}{row['index_mb']:>10.1f}{row['build_seconds']:>9.2f}{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}")
+
+    report = {"vectors": args.vectors, "dim": args.dim, "clusters": args.clusters, "queries": args.queries, "k": args.k, "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
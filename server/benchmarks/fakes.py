@@ -0,0 +1,133 @@
+"""
+Deterministic stand-ins for the LLM and the embedding model, so benchmarks run
+offline and their numbers do not depend on a remote endpoint.
+
+  - FakeChatModel:     LangChain chat model with a fixed time to first token and a fixed
+                       delay per token (invoke and token streaming). Answers are derived
+                       from a hash of the prompt; single-shot NL-to-SQL prompts get a
+                       valid aggregate query on the prompt's table, and ReAct agent
+                       prompts a final answer.
+  - HashingEmbeddings: bag-of-words embeddings (feature hashing), with an optional fixed
+                       cost per embedded text to stand in for model inference.
+
+Both report the same results for the same inputs on every run.
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_VOCABULARY = (
+    "sales revenue units product category region stock inventory trend week month growth order customer "
+    "average total higher lower stable demand supply margin report summary period top quantity"
+).split()
+_DIRECT_SQL_TABLE_PATTERN = re.compile(r'^Table "(\w+)"', re.MULTILINE)
+_SCHEMA_COLUMN_PATTERN = re.compile(r'^- "([^"]+)" (\w+)', re.MULTILINE)
+
+class FakeChatModel(BaseChatModel):
+    """Chat model answering after `first_token_latency` seconds plus `token_latency` per answer token."""
+
+    model_name: str = "fake-chat"
+    first_token_latency: float = 0.2
+    token_latency: float = 0.01
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        table = _DIRECT_SQL_TABLE_PATTERN.search(prompt)
+        if table and prompt.rstrip().endswith("SQL:"):
+            columns = _SCHEMA_COLUMN_PATTERN.findall(prompt)
+            group_column = next((name for name, type_name in columns if type_name.upper() == "TEXT"), None)
+            if group_column:
+                return (f'SELECT "{group_column}", COUNT(*) AS "row_count" FROM "{table.group(1)}" '
+                        f'GROUP BY "{group_column}" ORDER BY "row_count" DESC LIMIT 20')
+            return f'SELECT COUNT(*) AS "row_count" FROM "{table.group(1)}"'
+
+        digest = hashlib.sha256(prompt.encode()).digest()
+        words = [_VOCABULARY[digest[index % len(digest)] % len(_VOCABULARY)] for index in range(self.answer_tokens)]
+        answer = " ".join(words).capitalize() + "."
+        # ReAct agents (the SQL agent fallback) stop at a final answer
+        return f"Final Answer: {answer}" if "Final Answer" in prompt else answer
+
+    def _tokens(self, text: str) -> List[str]:
+        words = text.split(" ")
+        return [word if index == 0 else " " + word for index, word in enumerate(words)]
+
+    def _message(self, messages: List[BaseMessage], text: str) -> AIMessage:
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+        completion_tokens = len(self._tokens(text))
+        return AIMessage(content=text, usage_metadata={
+            "input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens
+        })
+
+    def _latency(self, text: str) -> float:
+        return self.first_token_latency + self.token_latency * len(self._tokens(text))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        time.sleep(self._latency(text))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        await asyncio.sleep(self._latency(text))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens(self._respond(messages)):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for token in self._tokens(self._respond(messages)):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings (feature hashing) for running without a model download."""
+
+    def __init__(self, dimensions: int = 256, latency_per_text: float = 0.0):
+        self.dimensions = dimensions
+        self.latency_per_text = latency_per_text
+
+    def _embed(self, text: str):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(token.encode()).hexdigest(), 16) % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.latency_per_text:
+            time.sleep(self.latency_per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        if self.latency_per_text:
+            time.sleep(self.latency_per_text)
+        return self._embed(text)
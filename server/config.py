@@ -51,6 +51,8 @@ class Config:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # 管理接口令牌（请求头 X-Admin-Token），未设置时管理接口禁用
+    ADMIN_TOKEN: Optional[str] = os.getenv("ADMIN_TOKEN")
     
     # 分页配置
     DEFAULT_PAGE_SIZE: int = 20
@@ -62,6 +64,7 @@ class Config:
     # 日志配置
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LOG_JSON: bool = os.getenv("LOG_JSON", "true").lower() == "true"  # JSON 行格式输出（false 时使用 LOG_FORMAT）
     
     # 业务配置
     DEFAULT_LOW_STOCK_THRESHOLD: int = 50
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Synthetic ERP Data Generator for Load Testing
+
+Generates consistent products, inventory and sales at any scale (tens of millions of
+sales) with vectorized NumPy, one chunk of sales at a time, and writes them either as
+the CSV files the application imports (products_data.csv, inventory_data.csv,
+sales_data.csv) or straight into the SQLite database.
+
+The data has the shape of real sales rather than uniform noise:
+  - product popularity follows a Zipf law (a few products make most of the sales);
+  - daily volume has yearly seasonality (year-end peak), a weekly cycle (quieter
+    weekends) and a growth trend; sale times follow business hours;
+  - sales reference existing products with their name and unit price, and stock
+    levels cover each product's demand for a few days to two months (some are low).
+
+Usage:
+    python scripts/generate_erp_data.py --sales 1000000 --output-dir /tmp/erp_csv
+    python scripts/generate_erp_data.py --sales 20000000 --products 50000 --database data/smart_erp.db --replace
+    python scripts/generate_erp_data.py --sales 5000000 --start 2023-01-01 --end 2024-12-31 --zipf 1.2 --seed 42
+"""
+
+import sys
+import argparse
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app import db
+
+CATEGORIES = ["Electronics", "Accessories", "Office Furniture", "Home Automation", "Storage",
+              "Lifestyle", "Audio", "Sports & Outdoors", "Wearables", "Home Goods",
+              "Kitchenware", "Outdoor", "Software", "Home Appliances", "Gaming",
+              "Office Supplies", "Travel", "Health & Wellness", "Eyewear", "Tools"]
+PRODUCT_NAME_PREFIXES = ["Alpha", "Beta", "Gamma", "Delta", "Nova", "Orion", "Stellar", "Quantum", "Aura", "Terra",
+                         "Hydro", "Zenith", "Cosmo", "Flexi", "Chrono", "Giga", "Aqua", "Aero", "Solar", "Eco"]
+PRODUCT_NAME_SUFFIXES = ["Pro", "Max", "Ultra", "Mini", "Plus", "X1", "Z200", "Flow", "Wave", "Core",
+                         "Guard", "Fit", "Stream", "Mate", "Beam", "Grip", "Speed", "Pure", "Glow", "Cast"]
+
+# Relative sales volume by weekday (Monday first) and by hour of day
+WEEKDAY_WEIGHTS = np.array([1.0, 1.05, 1.05, 1.1, 1.2, 0.8, 0.6])
+HOUR_WEIGHTS = np.array([0.1, 0.05, 0.05, 0.05, 0.05, 0.1, 0.3, 0.6, 1.0, 1.3, 1.5, 1.6,
+                         1.7, 1.6, 1.5, 1.5, 1.4, 1.3, 1.2, 1.0, 0.8, 0.6, 0.4, 0.2])
+# Amplitude of the yearly cycle and the day of year it peaks on (mid-December)
+SEASONAL_AMPLITUDE = 0.35
+SEASONAL_PEAK_DAY = 350
+ANNUAL_GROWTH = 0.15
+
+PRODUCT_COLUMNS = ["product_id", "product_name", "category", "unit_price"]
+INVENTORY_COLUMNS = ["product_id", "stock_level", "last_updated"]
+SALES_COLUMNS = ["sale_id", "product_id", "product_name", "quantity_sold", "price_per_unit", "total_amount", "sale_date"]
+# Secondary indexes of the sales table, dropped during a bulk load and rebuilt once afterwards
+SALES_INDEXES = ["idx_sales_sale_date_id", "idx_sales_date_product_amounts"]
+
+def _rows(frame: pd.DataFrame, columns: list) -> Iterator[tuple]:
+    """Rows as tuples of Python values (several times faster than DataFrame.itertuples)."""
+    return zip(*(frame[column].tolist() for column in columns))
+
+def _prefixed_ids(prefix: str, numbers: np.ndarray, width: int) -> np.ndarray:
+    return np.char.add(prefix, np.char.zfill(numbers.astype(str), width))
+
+def generate_products(num_products: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Products with unique ids, generated names, a category and a log-normally distributed unit price."""
+    name_parts = rng.integers(0, [len(PRODUCT_NAME_PREFIXES), len(PRODUCT_NAME_SUFFIXES), 900], size=(num_products, 3))
+    names = np.char.add(np.char.add(np.array(PRODUCT_NAME_PREFIXES)[name_parts[:, 0]],
+                                     np.array(PRODUCT_NAME_SUFFIXES)[name_parts[:, 1]]),
+                        np.char.add(" ", (name_parts[:, 2] + 100).astype(str)))
+    return pd.DataFrame({
+        "product_id": _prefixed_ids("P", np.arange(1, num_products + 1), max(4, len(str(num_products)))),
+        "product_name": names,
+        "category": np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), size=num_products)],
+        "unit_price": np.round(np.clip(rng.lognormal(mean=3.8, sigma=1.1, size=num_products), 2.5, 3000.0), 2),
+    })
+
+def product_popularity(num_products: int, zipf_exponent: float, rng: np.random.Generator) -> np.ndarray:
+    """Share of sales of each product: Zipfian over a random ranking of the products."""
+    ranks = rng.permutation(num_products) + 1
+    weights = 1.0 / ranks.astype(np.float64) ** zipf_exponent
+    return weights / weights.sum()
+
+def day_weights(start: date, end: date) -> tuple[np.ndarray, np.ndarray]:
+    """(days, share of sales per day) from start to end inclusive: seasonality, weekly cycle and growth."""
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    day_of_year = (days - days.astype("datetime64[Y]")).astype(np.int64) + 1
+    weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    years_elapsed = np.arange(len(days)) / 365.25
+    weights = ((1 + SEASONAL_AMPLITUDE * np.cos(2 * np.pi * (day_of_year - SEASONAL_PEAK_DAY) / 365.25))
+               * WEEKDAY_WEIGHTS[weekday] * (1 + ANNUAL_GROWTH) ** years_elapsed)
+    return days, weights / weights.sum()
+
+def generate_inventory(products: pd.DataFrame, popularity: np.ndarray, num_sales: int, num_days: int,
+                       as_of: datetime, rng: np.random.Generator) -> pd.DataFrame:
+    """Safety stock plus each product's average daily demand for 0 to 60 days (about a tenth end up below 50 units)."""
+    daily_units = popularity * num_sales * 2.2 / num_days  # 2.2: mean quantity per sale
+    days_of_cover = rng.uniform(0, 60, size=len(products))
+    safety_stock = rng.integers(10, 400, size=len(products))
+    stock = np.round(daily_units * days_of_cover + safety_stock).astype(np.int64)
+    return pd.DataFrame({
+        "product_id": products["product_id"].to_numpy(),
+        "stock_level": stock,
+        "last_updated": as_of.strftime(db.DATE_FORMAT),
+    })
+
+def generate_sales(products: pd.DataFrame, popularity: np.ndarray, days: np.ndarray, day_share: np.ndarray,
+                   num_sales: int, rng: np.random.Generator, chunk_size: int = 1_000_000,
+                   first_sale_number: int = 1) -> Iterator[pd.DataFrame]:
+    """Sales in chunks of `chunk_size` rows, sampled by product popularity, day share and hour of day."""
+    product_cdf = np.cumsum(popularity)
+    day_cdf = np.cumsum(day_share)
+    hour_cdf = np.cumsum(HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    product_ids = products["product_id"].to_numpy()
+    product_names = products["product_name"].to_numpy()
+    unit_prices = products["unit_price"].to_numpy()
+    day_seconds = days.astype("datetime64[s]")
+    id_width = max(8, len(str(first_sale_number + num_sales)))
+
+    for offset in range(0, num_sales, chunk_size):
+        size = min(chunk_size, num_sales - offset)
+        # Inverse-CDF sampling (searchsorted) keeps every draw vectorized, whatever the number of products or days
+        product = np.minimum(np.searchsorted(product_cdf, rng.random(size)), len(product_cdf) - 1)
+        day = np.minimum(np.searchsorted(day_cdf, rng.random(size)), len(day_cdf) - 1)
+        hour = np.minimum(np.searchsorted(hour_cdf, rng.random(size)), 23)
+        timestamps = day_seconds[day] + (hour * 3600 + rng.integers(0, 3600, size=size)).astype("timedelta64[s]")
+        # Chronological order within the chunk (sale ids grow with time), like rows appended by a live system
+        order = np.argsort(timestamps, kind="stable")
+        product, timestamps = product[order], timestamps[order]
+        quantity = np.minimum(rng.geometric(0.45, size=size), 50)
+        price = unit_prices[product]
+        numbers = np.arange(first_sale_number + offset, first_sale_number + offset + size)
+        yield pd.DataFrame({
+            "sale_id": _prefixed_ids("S", numbers, id_width),
+            "product_id": product_ids[product],
+            "product_name": product_names[product],
+            "quantity_sold": quantity,
+            "price_per_unit": price,
+            "total_amount": np.round(quantity * price, 2),
+            "sale_date": pd.to_datetime(timestamps).strftime(db.DATE_FORMAT),
+        })
+
+def write_csv(output_dir: Path, products: pd.DataFrame, inventory: pd.DataFrame, sales_chunks: Iterator[pd.DataFrame]) -> int:
+    """Write the three CSV files the application imports (see db.import_csv_data_to_db). Returns the sales written."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    products.to_csv(output_dir / "products_data.csv", index=False, columns=PRODUCT_COLUMNS)
+    inventory.to_csv(output_dir / "inventory_data.csv", index=False, columns=INVENTORY_COLUMNS)
+    written = 0
+    with open(output_dir / "sales_data.csv", "w", newline="", encoding="utf-8") as sales_file:
+        for chunk in sales_chunks:
+            chunk.to_csv(sales_file, index=False, header=written == 0, columns=SALES_COLUMNS)
+            written += len(chunk)
+            print(f"  {written} sales written")
+    return written
+
+def load_sqlite(database_path: Path, products: pd.DataFrame, inventory: pd.DataFrame,
+                sales_chunks: Iterator[pd.DataFrame], replace: bool = False) -> int:
+    """Bulk-load into the application database, rebuilding the sales indexes once at the end. Returns the sales loaded."""
+    db.DATABASE_DIR = database_path.parent
+    db.DATABASE_PATH = database_path
+    db.initialize_database_schema()
+
+    conn = sqlite3.connect(database_path)
+    try:
+        # Crash safety is not needed while loading throwaway data; journaling would double the writes
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")
+        if replace:
+            for table in ("sales", "inventory", "products"):
+                conn.execute(f"DELETE FROM {table}")
+        for index in SALES_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?)", _rows(products, PRODUCT_COLUMNS))
+        conn.executemany("INSERT OR REPLACE INTO inventory VALUES (?, ?, ?)", _rows(inventory, INVENTORY_COLUMNS))
+        loaded = 0
+        for chunk in sales_chunks:
+            conn.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?, ?, ?)", _rows(chunk, SALES_COLUMNS))
+            conn.commit()
+            loaded += len(chunk)
+            print(f"  {loaded} sales loaded")
+        conn.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        conn.close()
+
+    print("Rebuilding sales indexes...")
+    db.initialize_database_schema()
+    with sqlite3.connect(database_path) as conn:
+        conn.execute("ANALYZE")
+    return loaded
+
+def _parse_date(value: str) -> date:
+    return datetime.strptime(value, db.SHORT_DATE_FORMAT).date()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic ERP products, inventory and sales for load testing")
+    parser.add_argument("--products", type=int, default=5000, help="Number of products")
+    parser.add_argument("--sales", type=int, default=1_000_000, help="Number of sales rows")
+    parser.add_argument("--start", type=_parse_date, help="First sale date, YYYY-MM-DD (default: one year before --end)")
+    parser.add_argument("--end", type=_parse_date, default=date.today(), help="Last sale date, YYYY-MM-DD (default: today)")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of product popularity (0: uniform)")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed (same seed and settings: same data)")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="Sales generated and written per chunk")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output-dir", type=Path, help="Write products_data.csv, inventory_data.csv and sales_data.csv here")
+    target.add_argument("--database", type=Path, help="Bulk-load into this SQLite database (e.g. data/smart_erp.db)")
+    parser.add_argument("--replace", action="store_true", help="With --database: delete existing products, inventory and sales first")
+    args = parser.parse_args()
+    start = args.start or args.end - timedelta(days=365)
+    if start > args.end:
+        parser.error("--start must not be after --end")
+
+    started = time.perf_counter()
+    rng = np.random.default_rng(args.seed)
+    products = generate_products(args.products, rng)
+    popularity = product_popularity(args.products, args.zipf, rng)
+    days, day_share = day_weights(start, args.end)
+    inventory = generate_inventory(products, popularity, args.sales, len(days),
+                                   datetime.combine(args.end, datetime.min.time()).replace(hour=23), rng)
+    sales_chunks = generate_sales(products, popularity, days, day_share, args.sales, rng, args.chunk_size)
+
+    print(f"Generating {args.products} products and {args.sales} sales from {start} to {args.end}...")
+    if args.output_dir:
+        written = write_csv(args.output_dir, products, inventory, sales_chunks)
+        destination = args.output_dir
+    else:
+        written = load_sqlite(args.database.resolve(), products, inventory, sales_chunks, args.replace)
+        destination = args.database
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {written} sales to {destination} in {elapsed:.1f}s ({written / elapsed:,.0f} rows/s)")
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,8 @@ import argparse
 sys.path.insert(0, str(Path(__file__).parent))
 
 from config import config, check_environment
-from app.agent import initialize_app_state
+# app.agent loads the LLM and the embedding model on import; it is imported in main() so that the
+# spawned ingestion worker processes, which re-import this module as __mp_main__, stay light
 
 def run_command(command, description):
     """Run a command and handle errors."""
@@ -113,6 +114,7 @@ def main():
     # 初始化应用状态
     print("\n🔧 初始化应用状态...")
     try:
+        from app.agent import initialize_app_state
         initialize_app_state()
         print("✅ 应用状态初始化完成")
     except Exception as e: